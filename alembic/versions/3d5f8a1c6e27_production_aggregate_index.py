@@ -0,0 +1,62 @@
+"""Production aggregate covering index
+
+Revision ID: 3d5f8a1c6e27
+Revises: 7b1e0c2d9a41
+Create Date: 2026-10-18 10:04:17.592310
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+from apps.database.migrations import drop_invalid_index
+
+# revision identifiers, used by Alembic.
+revision: str = "3d5f8a1c6e27"
+down_revision: Union[str, None] = "7b1e0c2d9a41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ["chart_data_id", "time"]
+TOTALS = ["sprocket_production_actual", "sprocket_production_goal"]
+
+
+def upgrade() -> None:
+    # The covering index is built before the one it replaces is dropped, so
+    # chart reads always have an index on (chart_data_id, time).
+    with op.get_context().autocommit_block():
+        drop_invalid_index("ix_sprocketproduction_chart_data_id_time_totals")
+        op.create_index(
+            "ix_sprocketproduction_chart_data_id_time_totals",
+            "sprocketproduction",
+            COLUMNS,
+            unique=False,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_include=TOTALS,
+        )
+        op.drop_index(
+            "ix_sprocketproduction_chart_data_id_time",
+            table_name="sprocketproduction",
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        drop_invalid_index("ix_sprocketproduction_chart_data_id_time")
+        op.create_index(
+            "ix_sprocketproduction_chart_data_id_time",
+            "sprocketproduction",
+            COLUMNS,
+            unique=False,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_sprocketproduction_chart_data_id_time_totals",
+            table_name="sprocketproduction",
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
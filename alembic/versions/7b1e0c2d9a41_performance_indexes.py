@@ -0,0 +1,63 @@
+"""Performance indexes
+
+Revision ID: 7b1e0c2d9a41
+Revises: 4c903e937e53
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+
+from typing import Sequence, Tuple, Union
+
+from alembic import op
+from apps.database.migrations import drop_invalid_index
+
+# revision identifiers, used by Alembic.
+revision: str = "7b1e0c2d9a41"
+down_revision: Union[str, None] = "4c903e937e53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns)
+INDEXES: Sequence[Tuple[str, str, Sequence[str]]] = (
+    (
+        "ix_sprocketproduction_chart_data_id_time",
+        "sprocketproduction",
+        ["chart_data_id", "time"],
+    ),
+    ("ix_sprocketproduction_time", "sprocketproduction", ["time"]),
+    ("ix_sprocketproduction_created_at_id", "sprocketproduction", ["created_at", "id"]),
+    ("ix_sprockettype_created_at_id", "sprockettype", ["created_at", "id"]),
+    ("ix_factory_chart_data_id", "factory", ["chart_data_id"]),
+    (
+        "ix_sprockettypesprocketproductionlink_sprocket_production_id",
+        "sprockettypesprocketproductionlink",
+        ["sprocket_production_id", "sprocket_type_id"],
+    ),
+)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, so on Postgres
+    # the indexes are built in an autocommit block without locking writes.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            drop_invalid_index(name)
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
@@ -0,0 +1,45 @@
+"""Initial data load factories and sprocket types
+
+Revision ID: 8c4e1f6a2b95
+Revises: 9a4c2e7f1b08
+Create Date: 2026-10-18 16:05:12.480231
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8c4e1f6a2b95"
+down_revision: Union[str, None] = "9a4c2e7f1b08"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "initialdataloadfactory",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("position", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("chart_data_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["chart_data_id"], ["chartdata.id"]),
+        sa.PrimaryKeyConstraint("position"),
+    )
+    op.create_table(
+        "initialdataloadsprockettype",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("position", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("sprocket_type_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["sprocket_type_id"], ["sprockettype.id"]),
+        sa.PrimaryKeyConstraint("position"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("initialdataloadsprockettype")
+    op.drop_table("initialdataloadfactory")
@@ -0,0 +1,99 @@
+"""Production rollups
+
+Revision ID: 9a4c2e7f1b08
+Revises: 3d5f8a1c6e27
+Create Date: 2026-10-18 11:37:52.106843
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+import sqlmodel.sql.sqltypes
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9a4c2e7f1b08"
+down_revision: Union[str, None] = "3d5f8a1c6e27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+GRANULARITIES = ("hour", "day")
+# SQLite has no date_trunc, so buckets are formatted like services.time_bucket
+# does, as the text SQLAlchemy stores datetimes in.
+SQLITE_BUCKET_FORMATS = {
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+# Fills the rollups of the productions already stored, grouped the same way
+# as services.add_production_rollups.
+BACKFILL = """
+INSERT INTO {table} ({owner}, granularity, bucket, count, sprocket_production_actual,
+    sprocket_production_goal, attainment_sum, attainment_count)
+SELECT {owner}, '{granularity}', {bucket}, count(*),
+    sum(sprocket_production_actual), sum(sprocket_production_goal),
+    coalesce(sum(CAST(sprocket_production_actual AS FLOAT)
+        / nullif(sprocket_production_goal, 0)), 0),
+    count(nullif(sprocket_production_goal, 0))
+FROM {source}
+WHERE {owner} IS NOT NULL
+GROUP BY {owner}, {bucket}
+"""
+
+
+def bucket(granularity: str) -> str:
+    if op.get_context().dialect.name == "postgresql":
+        return f"date_trunc('{granularity}', time)"
+    return f"strftime('{SQLITE_BUCKET_FORMATS[granularity]}', time)"
+
+
+def create_rollup_table(name: str, owner: str, owner_table: str) -> None:
+    op.create_table(
+        name,
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("sprocket_production_actual", sa.Integer(), nullable=False),
+        sa.Column("sprocket_production_goal", sa.Integer(), nullable=False),
+        sa.Column("attainment_sum", sa.Float(), nullable=False),
+        sa.Column("attainment_count", sa.Integer(), nullable=False),
+        sa.Column(owner, sa.Integer(), nullable=False),
+        sa.Column("granularity", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("bucket", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            [owner],
+            [f"{owner_table}.id"],
+        ),
+        sa.PrimaryKeyConstraint(owner, "granularity", "bucket"),
+    )
+
+
+def upgrade() -> None:
+    create_rollup_table("chartdatarollup", "chart_data_id", "chartdata")
+    create_rollup_table("sprockettyperollup", "sprocket_type_id", "sprockettype")
+    for granularity in GRANULARITIES:
+        op.execute(
+            BACKFILL.format(
+                table="chartdatarollup",
+                owner="chart_data_id",
+                granularity=granularity,
+                bucket=bucket(granularity),
+                source="sprocketproduction",
+            )
+        )
+        op.execute(
+            BACKFILL.format(
+                table="sprockettyperollup",
+                owner="sprocket_type_id",
+                granularity=granularity,
+                bucket=bucket(granularity),
+                source="sprocketproduction JOIN sprockettypesprocketproductionlink "
+                "ON sprockettypesprocketproductionlink.sprocket_production_id = sprocketproduction.id",
+            )
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("sprockettyperollup")
+    op.drop_table("chartdatarollup")
@@ -0,0 +1,766 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi_redis_cache import FastApiRedisCache
+from fastapi_redis_cache.util import ONE_HOUR_IN_SECONDS
+from pydantic import BaseModel
+from redis.client import PubSubWorkerThread
+from redis.exceptions import WatchError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from apps.cache.memory import MemoryCache
+from apps.cache.scheduler import Scheduler
+from apps.database import database
+from apps.metrics import timing
+
+logger = logging.getLogger(__name__)
+
+CACHE_EXPIRE = int(os.getenv("CACHE_EXPIRE", 6 * ONE_HOUR_IN_SECONDS))
+# Seconds past CACHE_EXPIRE during which stale-while-revalidate routes keep
+# serving an entry while it is refreshed in the background.
+CACHE_STALE_EXPIRE = int(os.getenv("CACHE_STALE_EXPIRE", ONE_HOUR_IN_SECONDS))
+MEMORY_CACHE_MAXSIZE = int(os.getenv("MEMORY_CACHE_MAXSIZE", 1024))
+# Upper bound on how long a worker can serve an entry evicted elsewhere if an
+# invalidation message is lost, e.g. while the subscriber reconnects.
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", 30))
+# A worker holds the fill lock of a key for at most CACHE_LOCK_TIMEOUT seconds,
+# other workers wait up to CACHE_LOCK_WAIT seconds before computing it too.
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 10))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 5))
+# A miss right after a write may be filled from a lagging read replica; a
+# second eviction this many seconds later drops what it cached. With read
+# replicas it is at least REPLICA_STICKY_SECONDS, without them 0 disables it.
+CACHE_REINVALIDATE_AFTER = max(
+    float(os.getenv("CACHE_REINVALIDATE_AFTER", 0)),
+    database.REPLICA_STICKY_SECONDS if database.DATABASE_REPLICA_URLS else 0,
+)
+# Seconds between removals of expired keys from the tag sets, 0 disables them.
+CACHE_TAG_PRUNE_INTERVAL = float(os.getenv("CACHE_TAG_PRUNE_INTERVAL", 600))
+TAG_NAMESPACE = "tag"
+GENERATION_NAMESPACE = "generation"
+LOCK_NAMESPACE = "lock"
+INVALIDATION_CHANNEL = "invalidate"
+FILL_CHANNEL = "filled"
+JSON_MEDIA_TYPE = "application/json"
+IGNORED_ARG_TYPES = (Request, Response, Session, AsyncSession)
+
+
+class CacheEntry(NamedTuple):
+    key: str
+    content: bytes
+    expire: int
+    tags: Sequence[str]
+
+
+FillWaiter = Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]
+
+
+class CacheSettings(NamedTuple):
+    response_model: Type[BaseModel]
+    tags: Callable[[Any], Iterable[str]]
+    expire: int
+    stale_expire: int
+    serializer: Optional[Callable[[Any], bytes]]
+
+
+memory_cache = MemoryCache(maxsize=MEMORY_CACHE_MAXSIZE, ttl=MEMORY_CACHE_TTL)
+# Delayed and periodic cache maintenance of this worker.
+scheduler = Scheduler(name="cache-scheduler")
+# Fills running in this worker, so concurrent misses on a key share one.
+in_flight: Dict[str, "asyncio.Task[Tuple[bytes, Optional[str]]]"] = {}
+# Responses served by this worker per source: memory, redis, coalesced,
+# stale, batch (hits of batch lookups) or miss.
+served: "Counter[str]" = Counter()
+# Requests of this worker waiting for another worker to fill a key, resolved
+# from the listener thread when that worker releases its lock.
+fill_waiters: Dict[str, List[FillWaiter]] = {}
+fill_waiters_lock = threading.Lock()
+# Tags whose invalidation is deferred until the end of an invalidate_after block.
+deferred_invalidations: ContextVar[Optional[List[str]]] = ContextVar(
+    "deferred_invalidations", default=None
+)
+
+
+def get_cache_key(
+    redis_cache: FastApiRedisCache, func: Callable[..., Any], kwargs: Dict[str, Any]
+) -> str:
+    args = ",".join(
+        f"{name}={value}"
+        for name, value in sorted(kwargs.items())
+        if not isinstance(value, IGNORED_ARG_TYPES)
+    )
+    return f"{redis_cache.prefix}:{func.__module__}.{func.__name__}({args})"
+
+
+def get_tag_key(redis_cache: FastApiRedisCache, tag: str) -> str:
+    return f"{redis_cache.prefix}:{TAG_NAMESPACE}:{tag}"
+
+
+def get_generation_key(redis_cache: FastApiRedisCache) -> str:
+    return f"{redis_cache.prefix}:{GENERATION_NAMESPACE}"
+
+
+def get_generation(redis_cache: FastApiRedisCache) -> Optional[bytes]:
+    """The invalidation generation, read before loading what will be cached."""
+    return redis_cache.redis.get(get_generation_key(redis_cache))
+
+
+def add_to_cache(
+    redis_cache: FastApiRedisCache,
+    entries: Sequence[CacheEntry],
+    generation: Optional[bytes],
+) -> bool:
+    """Store ``entries`` unless an invalidation ran since ``generation``.
+
+    A fill that read the database before a write would otherwise store its
+    result after the write's eviction. A tag set keeps the longest of its
+    current TTL and those of the new entries, so short-lived entries never
+    cut the tracking of long-lived ones short.
+    """
+    generation_key = get_generation_key(redis_cache)
+    tag_expires: Dict[str, int] = {}
+    for entry in entries:
+        for tag in entry.tags:
+            tag_key = get_tag_key(redis_cache, tag)
+            tag_expires[tag_key] = max(tag_expires.get(tag_key, 0), entry.expire)
+    with redis_cache.redis.pipeline() as pipe:
+        try:
+            pipe.watch(generation_key)
+            if pipe.get(generation_key) != generation:
+                return False
+            ttls = redis_cache.redis.pipeline(transaction=False)
+            for tag_key in tag_expires:
+                ttls.ttl(tag_key)
+            for tag_key, ttl in zip(list(tag_expires), ttls.execute()):
+                tag_expires[tag_key] = max(tag_expires[tag_key], ttl)
+            pipe.multi()
+            for entry in entries:
+                pipe.set(name=entry.key, value=entry.content, ex=entry.expire)
+                for tag in entry.tags:
+                    pipe.sadd(get_tag_key(redis_cache, tag), entry.key)
+            for tag_key, expire in tag_expires.items():
+                pipe.expire(tag_key, expire)
+            pipe.execute()
+        except WatchError:
+            return False
+    return True
+
+
+def prune_tags() -> int:
+    """Remove the keys that expired from the tag sets, returning how many.
+
+    Tag sets of entities that are never written would otherwise keep every
+    key ever cached for them. A set is left for the next run if a fill adds
+    to it meanwhile.
+    """
+    redis_cache = FastApiRedisCache()
+    if redis_cache.not_connected:
+        return 0
+    removed = 0
+    for tag_key in redis_cache.redis.scan_iter(match=get_tag_key(redis_cache, "*")):
+        with redis_cache.redis.pipeline() as pipe:
+            try:
+                pipe.watch(tag_key)
+                keys = list(pipe.smembers(tag_key))
+                exists = redis_cache.redis.pipeline(transaction=False)
+                for key in keys:
+                    exists.exists(key)
+                expired = [
+                    key for key, found in zip(keys, exists.execute()) if not found
+                ]
+                if expired:
+                    pipe.multi()
+                    pipe.srem(tag_key, *expired)
+                    pipe.execute()
+                    removed += len(expired)
+            except WatchError:
+                pass
+    return removed
+
+
+def prune_tags_periodically() -> None:
+    prune_tags()
+    scheduler.call_later(CACHE_TAG_PRUNE_INTERVAL, prune_tags_periodically)
+
+
+def get_lock_key(redis_cache: FastApiRedisCache, key: str) -> str:
+    return f"{redis_cache.prefix}:{LOCK_NAMESPACE}:{key}"
+
+
+def acquire_lock(redis_cache: FastApiRedisCache, key: str) -> Optional[str]:
+    token = uuid.uuid4().hex
+    acquired = redis_cache.redis.set(
+        get_lock_key(redis_cache, key),
+        token,
+        nx=True,
+        px=int(CACHE_LOCK_TIMEOUT * 1000),
+    )
+    return token if acquired else None
+
+
+def release_lock(redis_cache: FastApiRedisCache, key: str, token: str) -> None:
+    """Delete the fill lock of ``key`` unless it expired and changed hands.
+
+    The key is published so the requests other workers have waiting on the
+    lock read the entry right away.
+    """
+    lock_key = get_lock_key(redis_cache, key)
+    with redis_cache.redis.pipeline() as pipe:
+        try:
+            pipe.watch(lock_key)
+            if pipe.get(lock_key) == token.encode():
+                pipe.multi()
+                pipe.delete(lock_key)
+                pipe.publish(get_fill_channel(redis_cache), key)
+                pipe.execute()
+        except WatchError:
+            pass
+
+
+def get_with_lock(
+    redis_cache: FastApiRedisCache, key: str
+) -> Tuple[Optional[bytes], bool]:
+    """The entry of ``key`` and whether a worker holds its fill lock."""
+    in_cache, locked = (
+        redis_cache.redis.pipeline()
+        .get(key)
+        .exists(get_lock_key(redis_cache, key))
+        .execute()
+    )
+    return in_cache, bool(locked)
+
+
+def get_with_ttl(
+    redis_cache: FastApiRedisCache, key: str
+) -> Tuple[Optional[bytes], int]:
+    in_cache, ttl = redis_cache.redis.pipeline().get(key).ttl(key).execute()
+    return in_cache, ttl
+
+
+def get_channel(redis_cache: FastApiRedisCache) -> str:
+    return f"{redis_cache.prefix}:{INVALIDATION_CHANNEL}"
+
+
+def get_fill_channel(redis_cache: FastApiRedisCache) -> str:
+    return f"{redis_cache.prefix}:{FILL_CHANNEL}"
+
+
+def invalidate(*tags: str) -> None:
+    """Evict every cached response built from one of the ``tags`` entities.
+
+    The keys are deleted from Redis and published so every worker drops them
+    from its memory cache as well. With ``CACHE_REINVALIDATE_AFTER`` they are
+    evicted once more after that delay, on the worker's cache scheduler.
+    Inside ``invalidate_after`` the tags are only collected.
+    """
+    deferred = deferred_invalidations.get()
+    if deferred is not None:
+        deferred.extend(tags)
+        return
+    evict_tags(*tags)
+    if CACHE_REINVALIDATE_AFTER > 0 and tags:
+        scheduler.call_later(CACHE_REINVALIDATE_AFTER, evict_tags, *tags)
+
+
+def evict_tags(*tags: str) -> None:
+    redis_cache = FastApiRedisCache()
+    if redis_cache.not_connected or not tags:
+        return
+    # The generation moves before the tag sets are read: a fill that adds to
+    # them afterwards fails its WATCH instead of being orphaned by the DEL.
+    redis_cache.redis.incr(get_generation_key(redis_cache))
+    tag_keys = [get_tag_key(redis_cache, tag) for tag in tags]
+    keys = [key.decode() for key in redis_cache.redis.sunion(tag_keys)]
+    memory_cache.evict(keys)
+    pipe = redis_cache.redis.pipeline()
+    pipe.delete(*keys, *tag_keys)
+    if keys:
+        pipe.publish(get_channel(redis_cache), json.dumps(keys))
+    pipe.execute()
+
+
+@asynccontextmanager
+async def invalidate_after() -> AsyncIterator[None]:
+    """Collect the invalidations of the block and run them in the threadpool.
+
+    Sync services run through ``AsyncSession.run_sync`` on the event loop
+    thread, where the Redis round trips of ``invalidate`` would stall every
+    other request of the worker. The block's tags are evicted once it exits,
+    also when it raises, since its writes may already be committed.
+    """
+    tags: List[str] = []
+    token = deferred_invalidations.set(tags)
+    try:
+        yield
+    finally:
+        deferred_invalidations.reset(token)
+        if tags:
+            await run_in_threadpool(invalidate, *dict.fromkeys(tags))
+
+
+def handle_invalidation(message: Dict[str, Any]) -> None:
+    memory_cache.evict(json.loads(message["data"]))
+
+
+def resolve_fill_waiter(filled: "asyncio.Future[None]") -> None:
+    if not filled.done():
+        filled.set_result(None)
+
+
+def handle_fill(message: Dict[str, Any]) -> None:
+    with fill_waiters_lock:
+        waiters = fill_waiters.pop(message["data"].decode(), [])
+    for loop, filled in waiters:
+        try:
+            loop.call_soon_threadsafe(resolve_fill_waiter, filled)
+        except RuntimeError:
+            # The loop of the waiter closed meanwhile.
+            pass
+
+
+def start_invalidation_listener() -> Optional[PubSubWorkerThread]:
+    redis_cache = FastApiRedisCache()
+    if redis_cache.not_connected:
+        return None
+    pubsub = redis_cache.redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(
+        **{
+            get_channel(redis_cache): handle_invalidation,
+            get_fill_channel(redis_cache): handle_fill,
+        }
+    )
+    if CACHE_TAG_PRUNE_INTERVAL > 0:
+        scheduler.call_later(CACHE_TAG_PRUNE_INTERVAL, prune_tags_periodically)
+    return pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+
+def stop_invalidation_listener(listener: Optional[PubSubWorkerThread]) -> None:
+    scheduler.clear()
+    if listener is not None:
+        listener.stop()
+        listener.join(timeout=2)
+    memory_cache.clear()
+
+
+def coalesce(
+    key: str, fill: Callable[[], Awaitable[Tuple[bytes, Optional[str]]]]
+) -> Tuple["asyncio.Task[Tuple[bytes, Optional[str]]]", bool]:
+    """Return the running fill of ``key``, starting one if there is none.
+
+    The flag tells whether the caller joined a fill started by another
+    request. Callers await the task through ``asyncio.shield`` so one of
+    them disconnecting does not cancel the fill for the rest.
+    """
+    task = in_flight.get(key)
+    if task is not None:
+        return task, True
+    task = asyncio.ensure_future(fill())
+    in_flight[key] = task
+
+    def done(task: "asyncio.Task[Tuple[bytes, Optional[str]]]") -> None:
+        in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+    task.add_done_callback(done)
+    return task, False
+
+
+async def wait_for_fill(redis_cache: FastApiRedisCache, key: str) -> Optional[bytes]:
+    """Wait for the entry another worker is filling, for a bounded time.
+
+    The waiter is registered before the lock is checked, so the release
+    published by the other worker, see ``release_lock``, cannot slip in
+    between the check and the wait.
+    """
+    loop = asyncio.get_running_loop()
+    filled: "asyncio.Future[None]" = loop.create_future()
+    waiter = (loop, filled)
+    with fill_waiters_lock:
+        fill_waiters.setdefault(key, []).append(waiter)
+    try:
+        in_cache, locked = await run_in_threadpool(get_with_lock, redis_cache, key)
+        if in_cache is not None or not locked:
+            return in_cache
+        try:
+            await asyncio.wait_for(filled, CACHE_LOCK_WAIT)
+        except asyncio.TimeoutError:
+            return None
+        return await run_in_threadpool(redis_cache.redis.get, key)
+    finally:
+        with fill_waiters_lock:
+            waiters = fill_waiters.get(key, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                fill_waiters.pop(key, None)
+
+
+@asynccontextmanager
+async def refresh_sessions(kwargs: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Swap the request sessions in ``kwargs`` for new ones on the same bind.
+
+    A background refresh outlives the request, whose sessions are closed
+    once the response is sent.
+    """
+    sessions: Dict[str, Any] = {}
+    for name, value in kwargs.items():
+        if isinstance(value, AsyncSession):
+            sessions[name] = type(value)(bind=value.bind, expire_on_commit=False)
+        elif isinstance(value, Session):
+            sessions[name] = type(value)(bind=value.get_bind())
+    try:
+        yield {**kwargs, **sessions}
+    finally:
+        for session in sessions.values():
+            if isinstance(session, AsyncSession):
+                await session.close()
+            else:
+                session.close()
+
+
+def build_response(
+    redis_cache: FastApiRedisCache,
+    content: bytes,
+    source: Optional[str],
+    media_type: str = JSON_MEDIA_TYPE,
+    etag: Optional[str] = None,
+) -> Response:
+    status = "Miss" if source is None else f"Hit; source={source}"
+    served[source or "miss"] += 1
+    headers = {
+        redis_cache.response_header: f"{status}; "
+        f"memory-hits={memory_cache.hits}; memory-misses={memory_cache.misses}"
+    }
+    if etag is not None:
+        headers["ETag"] = etag
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def content_etag(content: bytes) -> str:
+    """The strong ETag of a response body."""
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an ``If-None-Match`` header with ``etag``."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+
+
+async def conditional_response(
+    request: Request, respond: Callable[[], Awaitable[Response]]
+) -> Response:
+    """Answer a GET with ``304 Not Modified`` while its ETag still matches.
+
+    The ETag is the one ``respond`` set on the response it built, so it
+    always describes the body that would be sent.
+    """
+    response = await respond()
+    etag = response.headers.get("etag")
+    if etag is not None and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return response
+
+
+def join_array(ids: Sequence[int], contents: Dict[int, bytes]) -> bytes:
+    return b"[" + b",".join(contents[id] for id in ids if id in contents) + b"]"
+
+
+class BatchLookup(NamedTuple):
+    ids: List[int]
+    keys: Dict[int, str]
+    contents: Dict[int, bytes]
+    misses: List[int]
+    generation: int
+    redis_generation: Optional[bytes]
+
+
+def lookup_many(
+    route: Callable[..., Any], id_name: str, ids: Sequence[int]
+) -> BatchLookup:
+    """Look ``ids`` up in the memory cache, then with one Redis ``MGET``."""
+    ids = list(dict.fromkeys(ids))
+    redis_cache = FastApiRedisCache()
+    if redis_cache.not_connected:
+        return BatchLookup(ids, {}, {}, ids, memory_cache.generation, None)
+    keys = {id: get_cache_key(redis_cache, route, {id_name: id}) for id in ids}
+    contents = {}
+    with timing.phase("cache"):
+        for id, key in keys.items():
+            in_memory = memory_cache.get(key)
+            if in_memory is not None:
+                contents[id] = in_memory
+        generation = memory_cache.generation
+        remaining = [id for id in ids if id not in contents]
+        if remaining:
+            in_cache = redis_cache.redis.mget([keys[id] for id in remaining])
+            contents.update(
+                (id, content) for id, content in zip(remaining, in_cache) if content
+            )
+        misses = [id for id in remaining if id not in contents]
+        redis_generation = get_generation(redis_cache) if misses else None
+    return BatchLookup(ids, keys, contents, misses, generation, redis_generation)
+
+
+def render_many(
+    route: Callable[..., Any], items: Iterable[Any]
+) -> List[Tuple[Any, bytes]]:
+    """Serialize loaded items the way ``route`` caches them."""
+    settings: CacheSettings = route.cache_settings
+    if settings.serializer is not None:
+        return [(item, settings.serializer(item)) for item in items]
+    return [
+        (item, item.model_dump_json().encode())
+        for item in map(settings.response_model.model_validate, items)
+    ]
+
+
+def store_many(
+    route: Callable[..., Any],
+    batch: BatchLookup,
+    rendered: Iterable[Tuple[Any, bytes]],
+) -> Response:
+    """Cache the rendered misses of ``batch`` and build its JSON array."""
+    settings: CacheSettings = route.cache_settings
+    contents = dict(batch.contents)
+    redis_cache = FastApiRedisCache()
+    if redis_cache.not_connected:
+        contents.update((item.id, content) for item, content in rendered)
+        return Response(
+            content=join_array(batch.ids, contents), media_type=JSON_MEDIA_TYPE
+        )
+    entries = []
+    for item, content in rendered:
+        contents[item.id] = content
+        entries.append(
+            CacheEntry(
+                key=batch.keys[item.id],
+                content=content,
+                expire=settings.expire + settings.stale_expire,
+                tags=list(settings.tags(item)),
+            )
+        )
+        memory_cache.set(batch.keys[item.id], content, generation=batch.generation)
+    if entries:
+        add_to_cache(redis_cache, entries, batch.redis_generation)
+    hits, misses = len(batch.ids) - len(batch.misses), len(batch.misses)
+    served["batch"] += hits
+    served["miss"] += misses
+    return Response(
+        content=join_array(batch.ids, contents),
+        media_type=JSON_MEDIA_TYPE,
+        headers={
+            redis_cache.response_header: f"{'Miss' if misses else 'Hit'}; "
+            f"hits={hits}; misses={misses}; "
+            f"memory-hits={memory_cache.hits}; memory-misses={memory_cache.misses}"
+        },
+    )
+
+
+def get_many(
+    route: Callable[..., Any],
+    id_name: str,
+    ids: Sequence[int],
+    load: Callable[[List[int]], Sequence[Any]],
+) -> Response:
+    """Serve a JSON array of the cached responses of ``route`` for ``ids``.
+
+    Ids are looked up in the memory cache, then with one Redis ``MGET``, and
+    only the misses go to ``load`` in a single call. Entries are shared with
+    ``route`` itself. Unknown ids are left out of the array.
+    """
+    batch = lookup_many(route, id_name, ids)
+    rendered = render_many(route, load(batch.misses)) if batch.misses else []
+    return store_many(route, batch, rendered)
+
+
+def response_cache(
+    *,
+    response_model: Type[BaseModel],
+    tags: Callable[[Any], Iterable[str]],
+    expire: int = CACHE_EXPIRE,
+    stale_expire: int = 0,
+    media_type: str = JSON_MEDIA_TYPE,
+    serializer: Optional[Callable[[Any], bytes]] = None,
+    etag: bool = False,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Cache the JSON response of a GET route in Redis, tagged by entity.
+
+    The route result is serialized through ``response_model`` and stored with
+    the entity tags returned by ``tags``, so writes can evict exactly the
+    entries that embed what they changed through ``invalidate``. Reads go to
+    the worker's memory cache first and fall back to Redis. Misses are
+    single-flight: one request per key rebuilds the response, the others in
+    the worker await it and other workers wait on its Redis lock.
+
+    With ``stale_expire`` an entry older than ``expire`` is still served, for
+    up to ``stale_expire`` more seconds, while one background refresh per key
+    rebuilds it; if the refresh fails the stale entry keeps being served.
+
+    The wrapper always returns a ``media_type`` response, so a route can
+    serve another schema than its own ``response_model`` through it. A
+    ``serializer`` writes the route result directly, skipping its validation
+    through ``response_model``; ``tags`` then receive the raw result.
+
+    With ``etag`` responses carry the ETag of their body. It is computed when
+    the entry enters the memory cache and kept next to it, so hits need no
+    query and a stale entry keeps the ETag of what it holds.
+    """
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        def render(result: Any) -> Tuple[bytes, Any]:
+            with timing.phase("serialize"):
+                if serializer is not None:
+                    return serializer(result), result
+                data = response_model.model_validate(result)
+                return data.model_dump_json().encode(), data
+
+        async def call(**kwargs: Any) -> Tuple[bytes, Any]:
+            if asyncio.iscoroutinefunction(func):
+                return render(await func(**kwargs))
+            return await run_in_threadpool(lambda: render(func(**kwargs)))
+
+        # Every Redis call runs in the threadpool: the client is blocking,
+        # and a slow round trip would stall all requests of the event loop.
+        async def load(
+            redis_cache: FastApiRedisCache, key: str, **kwargs: Any
+        ) -> Tuple[bytes, Optional[str]]:
+            generation = await run_in_threadpool(get_generation, redis_cache)
+            content, data = await call(**kwargs)
+            entry = CacheEntry(
+                key=key,
+                content=content,
+                expire=expire + stale_expire,
+                tags=list(tags(data)),
+            )
+            await run_in_threadpool(add_to_cache, redis_cache, [entry], generation)
+            return content, None
+
+        async def fill(
+            redis_cache: FastApiRedisCache, key: str, **kwargs: Any
+        ) -> Tuple[bytes, Optional[str]]:
+            token = await run_in_threadpool(acquire_lock, redis_cache, key)
+            if token is None:
+                in_cache = await wait_for_fill(redis_cache, key)
+                if in_cache is not None:
+                    return in_cache, "redis"
+                return await load(redis_cache, key, **kwargs)
+            try:
+                in_cache = await run_in_threadpool(redis_cache.redis.get, key)
+                if in_cache is not None:
+                    return in_cache, "redis"
+                return await load(redis_cache, key, **kwargs)
+            finally:
+                await run_in_threadpool(release_lock, redis_cache, key, token)
+
+        async def refresh(
+            redis_cache: FastApiRedisCache, key: str, stale: bytes, **kwargs: Any
+        ) -> Tuple[bytes, Optional[str]]:
+            token = await run_in_threadpool(acquire_lock, redis_cache, key)
+            if token is None:
+                return stale, "stale"
+            try:
+                async with refresh_sessions(kwargs) as refresh_kwargs:
+                    return await load(redis_cache, key, **refresh_kwargs)
+            except Exception:
+                logger.exception(f"Refreshing {key} failed, serving it stale")
+                return stale, "stale"
+            finally:
+                await run_in_threadpool(release_lock, redis_cache, key, token)
+
+        def get_etag(content: bytes) -> Optional[str]:
+            return content_etag(content) if etag else None
+
+        @wraps(func)
+        async def wrapper(**kwargs: Any) -> Any:
+            redis_cache = FastApiRedisCache()
+            if redis_cache.not_connected:
+                content, _ = await call(**kwargs)
+                headers = {"ETag": get_etag(content)} if etag else None
+                return Response(content=content, media_type=media_type, headers=headers)
+            key = get_cache_key(redis_cache, func, kwargs)
+            with timing.phase("cache"):
+                in_memory = memory_cache.get_entry(key)
+            if in_memory is not None:
+                content, content_tag = in_memory
+                return build_response(
+                    redis_cache,
+                    content,
+                    source="memory",
+                    media_type=media_type,
+                    etag=content_tag or get_etag(content),
+                )
+            generation = memory_cache.generation
+            with timing.phase("cache"):
+                in_cache, ttl = await run_in_threadpool(get_with_ttl, redis_cache, key)
+            if in_cache is not None and 0 <= ttl < stale_expire:
+                coalesce(key, lambda: refresh(redis_cache, key, in_cache, **kwargs))
+                return build_response(
+                    redis_cache,
+                    in_cache,
+                    source="stale",
+                    media_type=media_type,
+                    etag=get_etag(in_cache),
+                )
+            if in_cache is not None:
+                content_tag = get_etag(in_cache)
+                memory_cache.set(key, in_cache, generation=generation, etag=content_tag)
+                return build_response(
+                    redis_cache,
+                    in_cache,
+                    source="redis",
+                    media_type=media_type,
+                    etag=content_tag,
+                )
+            task, coalesced = coalesce(key, lambda: fill(redis_cache, key, **kwargs))
+            content, source = await asyncio.shield(task)
+            content_tag = get_etag(content)
+            if source != "stale":
+                memory_cache.set(key, content, generation=generation, etag=content_tag)
+            return build_response(
+                redis_cache,
+                content,
+                source="coalesced" if coalesced else source,
+                media_type=media_type,
+                etag=content_tag,
+            )
+
+        wrapper.cache_settings = CacheSettings(
+            response_model=response_model,
+            tags=tags,
+            expire=expire,
+            stale_expire=stale_expire,
+            serializer=serializer,
+        )
+        return wrapper
+
+    return decorator
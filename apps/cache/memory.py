@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+
+class MemoryCache:
+    """Bounded, thread-safe LRU cache whose entries also expire after ``ttl``.
+
+    ``generation`` moves on every eviction, so a value read from Redis before
+    an invalidation landed is dropped instead of being stored again. An entry
+    can carry the ETag of its value.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, bytes, Optional[str]]]" = (
+            OrderedDict()
+        )
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[str]]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(
+        self, key: str, value: bytes, generation: int, etag: Optional[str] = None
+    ) -> None:
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value, etag)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def evict(self, keys: Iterable[str]) -> None:
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
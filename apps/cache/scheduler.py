@@ -0,0 +1,53 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Runs callables after a delay on one daemon thread, started on first use.
+
+    Calls run one at a time in due order; a failing call is logged and does
+    not stop the ones after it.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.condition = threading.Condition()
+        self.queue: List[Tuple[float, int, Callable[..., Any], Tuple[Any, ...]]] = []
+        self.counter = itertools.count()
+        self.thread: Optional[threading.Thread] = None
+
+    def call_later(self, delay: float, func: Callable[..., Any], *args: Any) -> None:
+        with self.condition:
+            heapq.heappush(
+                self.queue, (time.monotonic() + delay, next(self.counter), func, args)
+            )
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name=self.name, daemon=True
+                )
+                self.thread.start()
+            self.condition.notify()
+
+    def clear(self) -> None:
+        with self.condition:
+            self.queue.clear()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue or self.queue[0][0] > time.monotonic():
+                    timeout = (
+                        self.queue[0][0] - time.monotonic() if self.queue else None
+                    )
+                    self.condition.wait(timeout)
+                _, _, func, args = heapq.heappop(self.queue)
+            try:
+                func(*args)
+            except Exception:
+                logger.exception(f"Scheduled call {func.__name__} failed")
@@ -1,21 +1,186 @@
 import os
-from typing import Annotated, Generator
+import random
+import time
+from typing import Annotated, Any, AsyncGenerator, Dict, Generator, List, Optional
 
-from fastapi import Depends
+from fastapi import Depends, Request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import SessionTransaction, sessionmaker
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from apps.database import pool
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "false").lower() in ("1", "true", "yes")
+# Comma-separated read replicas of DATABASE_URL that serve GET requests.
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url
+]
+# After a write, the client reads from the primary for this many seconds.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+READ_ONLY_METHODS = frozenset({"GET", "HEAD"})
+PRIMARY_COOKIE = "powerflex-primary-until"
+
+
+def get_async_database_url(url: str) -> str:
+    database_url = make_url(url)
+    driver = ASYNC_DRIVERS.get(database_url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {database_url.drivername}")
+    return database_url.set(
+        drivername=f"{database_url.get_backend_name()}+{driver}"
+    ).render_as_string(hide_password=False)
+
+
+class RoutingSession(Session):
+    """A session that reads from one of the ``replicas`` in its ``info``.
+
+    Only read-only sessions get replicas. Flushes, and every session without
+    replicas, use the bound primary. A session picks one replica and keeps it,
+    so all reads of a request see the same snapshot.
+    """
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Any:
+        replicas = self.info.get("replicas")
+        if replicas and not self._flushing:
+            if "replica" not in self.info:
+                self.info["replica"] = random.choice(replicas)
+            return self.info["replica"]
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+engine = create_engine(
+    url=DATABASE_URL, echo=False, future=True, **pool.engine_options(DATABASE_URL)
+)
+async_engine: Optional[AsyncEngine] = (
+    create_async_engine(
+        url=get_async_database_url(DATABASE_URL),
+        echo=False,
+        **pool.engine_options(DATABASE_URL, is_async=True),
+    )
+    if DATABASE_ASYNC
+    else None
+)
+replica_engines: List[Engine] = [
+    create_engine(url=url, echo=False, future=True, **pool.engine_options(url))
+    for url in DATABASE_REPLICA_URLS
+]
+# Async sessions bind their sync session, so they route to the sync engines.
+async_replica_engines: List[Engine] = [
+    create_async_engine(
+        url=get_async_database_url(url),
+        echo=False,
+        **pool.engine_options(url, is_async=True),
+    ).sync_engine
+    for url in (DATABASE_REPLICA_URLS if DATABASE_ASYNC else [])
+]
+pool.instrument(engine, "primary")
+if async_engine is not None:
+    pool.instrument(async_engine.sync_engine, "async-primary")
+for index, replica_engine in enumerate(replica_engines):
+    pool.instrument(replica_engine, f"replica-{index}")
+for index, replica_engine in enumerate(async_replica_engines):
+    pool.instrument(replica_engine, f"async-replica-{index}")
+
+SessionLocal = sessionmaker(bind=engine, class_=RoutingSession)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
+)
+
 
+@event.listens_for(Session, "after_begin")
+def set_transaction_read_only(
+    session: Session, transaction: SessionTransaction, connection: Connection
+) -> None:
+    if session.info.get("read_only") and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("SET TRANSACTION READ ONLY")
 
-engine = create_engine(url=DATABASE_URL, echo=False, future=True)
 
+def reads_from_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
 
-def get_session() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+
+def session_info(
+    request: Request, response: Response, replicas: List[Engine]
+) -> Dict[str, Any]:
+    """Route GET and HEAD requests to ``replicas``, and writes to the primary.
+
+    A write sets a cookie that keeps the client's reads on the primary for
+    ``REPLICA_STICKY_SECONDS``, so it reads its own writes despite replica lag.
+    """
+    read_only = request.method in READ_ONLY_METHODS
+    if not replicas:
+        return {"read_only": read_only}
+    if not read_only:
+        response.set_cookie(
+            PRIMARY_COOKIE,
+            str(time.time() + REPLICA_STICKY_SECONDS),
+            max_age=int(REPLICA_STICKY_SECONDS) or 1,
+            httponly=True,
+        )
+    if not read_only or reads_from_primary(request):
+        return {"read_only": read_only}
+    return {"read_only": read_only, "replicas": replicas}
+
+
+def get_session(request: Request, response: Response) -> Generator[Session, None, None]:
+    """The session of one request, closed once the response body is built.
+
+    No connection is checked out of the pool until the first query, so cache
+    hits, conditional GETs included, never touch the database. GET and HEAD
+    requests run read-only transactions, on a replica when
+    ``DATABASE_REPLICA_URLS`` is set.
+    """
+    info = session_info(request, response, replica_engines)
+    with RoutingSession(engine, info=info) as session:
+        yield session
+
+
+async def get_async_session(
+    request: Request, response: Response
+) -> AsyncGenerator[AsyncSession, None]:
+    info = session_info(request, response, async_replica_engines)
+    async with AsyncSessionLocal(info=info) as session:
         yield session
 
 
+def get_session_factory(request: Request, response: Response) -> sessionmaker[Session]:
+    info = session_info(request, response, replica_engines)
+    return sessionmaker(bind=engine, class_=RoutingSession, info=info)
+
+
+def get_async_session_factory(
+    request: Request, response: Response
+) -> async_sessionmaker[AsyncSession]:
+    info = session_info(request, response, async_replica_engines)
+    return async_sessionmaker(
+        bind=async_engine,
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        expire_on_commit=False,
+        info=info,
+    )
+
+
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+# Streaming responses outlive the request dependencies, so they open their
+# own session from these factories while the body is being produced.
+SessionFactoryDep = Annotated[sessionmaker[Session], Depends(get_session_factory)]
+AsyncSessionFactoryDep = Annotated[
+    async_sessionmaker[AsyncSession], Depends(get_async_session_factory)
+]
 
 
 def init_db() -> None:
@@ -0,0 +1,23 @@
+"""Helpers shared by the Alembic revisions in ``alembic/versions``."""
+
+from alembic import op
+
+# A CREATE INDEX CONCURRENTLY that fails or is cancelled leaves an INVALID
+# index behind, which IF NOT EXISTS would then skip, so it is dropped first.
+DROP_INVALID_INDEX = """
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_index
+        WHERE indexrelid = to_regclass('{name}') AND NOT indisvalid
+    ) THEN
+        DROP INDEX {name};
+    END IF;
+END $$
+"""
+
+
+def drop_invalid_index(name: str) -> None:
+    """Drop the index ``name`` on Postgres if an earlier build left it INVALID."""
+    if op.get_context().dialect.name == "postgresql":
+        op.execute(DROP_INVALID_INDEX.format(name=name))
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", -1))
+DATABASE_POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Upper bounds, in seconds, of the checkout wait time histogram buckets.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class PoolMetrics:
+    """Checkout counts, wait times and timeouts of one engine's pool.
+
+    Waits are only measured by the metered queue pools below, other pools
+    report their checkouts and connections only.
+    """
+
+    def __init__(self, name: str, engine: Engine) -> None:
+        self.name = name
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+        self.checkouts = 0
+        self.connections = 0
+        self.timeouts = 0
+
+    def observe_wait(self, seconds: float) -> None:
+        with self.lock:
+            self.wait_counts[bisect_left(WAIT_BUCKETS, seconds)] += 1
+            self.wait_sum += seconds
+
+    def on_checkout(self, *args: Any) -> None:
+        with self.lock:
+            self.checkouts += 1
+
+    def on_connect(self, *args: Any) -> None:
+        with self.lock:
+            self.connections += 1
+
+    def on_timeout(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        with self.lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip((*WAIT_BUCKETS, "+Inf"), self.wait_counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            snapshot = {
+                "checkouts": self.checkouts,
+                "connections": self.connections,
+                "timeouts": self.timeouts,
+                "wait_seconds": {
+                    "buckets": buckets,
+                    "sum": self.wait_sum,
+                    "count": cumulative,
+                },
+            }
+        if isinstance(pool, QueuePool):
+            snapshot.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        return snapshot
+
+
+class MeteredQueuePool(QueuePool):
+    """A ``QueuePool`` that times how long each checkout waits for a connection.
+
+    SQLAlchemy has no event before a checkout starts waiting, so the wait is
+    measured around ``_do_get``, where the queue blocks.
+    """
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self) -> Any:
+        if self.metrics is None:
+            return super()._do_get()
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.on_timeout()
+            raise
+        self.metrics.observe_wait(time.perf_counter() - started_at)
+        return connection
+
+    def recreate(self) -> QueuePool:
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class MeteredAsyncAdaptedQueuePool(AsyncAdaptedQueuePool, MeteredQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool = False) -> Dict[str, Any]:
+    """``create_engine`` pool arguments from the ``DATABASE_POOL_*`` settings.
+
+    sqlite keeps its own single-connection pools, only pre-ping and recycle
+    apply to it.
+    """
+    options: Dict[str, Any] = {
+        "pool_pre_ping": DATABASE_POOL_PRE_PING,
+        "pool_recycle": DATABASE_POOL_RECYCLE,
+    }
+    if make_url(url).get_backend_name() == "sqlite":
+        return options
+    return {
+        **options,
+        "poolclass": MeteredAsyncAdaptedQueuePool if is_async else MeteredQueuePool,
+        "pool_size": DATABASE_POOL_SIZE,
+        "max_overflow": DATABASE_MAX_OVERFLOW,
+        "pool_timeout": DATABASE_POOL_TIMEOUT,
+    }
+
+
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+def instrument(engine: Engine, name: str) -> PoolMetrics:
+    """Collect the pool metrics of ``engine`` under ``name``.
+
+    Async engines are instrumented through their ``sync_engine``.
+    """
+    metrics = PoolMetrics(name=name, engine=engine)
+    if isinstance(engine.pool, MeteredQueuePool):
+        engine.pool.metrics = metrics
+    event.listen(engine, "checkout", metrics.on_checkout)
+    event.listen(engine, "connect", metrics.on_connect)
+    pool_metrics[name] = metrics
+    return metrics
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    return {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
@@ -4,10 +4,14 @@ from typing import Any, AsyncGenerator, Dict
 
 from fastapi import FastAPI, Request, Response, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi_redis_cache import FastApiRedisCache
 from sqlalchemy.orm import Session
 
+from apps.cache import cache
+from apps.database import database, pool
+from apps.metrics import metrics
+from apps.sprocket.async_routes import router as async_sprocket_router
 from apps.sprocket.routes import router as sprocket_router
 
 
@@ -20,7 +24,9 @@ async def lifespan(_app: FastAPI) -> AsyncGenerator[Any, Any]:
         response_header="X-PowerFlex-Cache",
         ignore_arg_types=[Request, Response, Session],
     )
+    invalidation_listener = cache.start_invalidation_listener()
     yield
+    cache.stop_invalidation_listener(invalidation_listener)
 
 
 app = FastAPI(
@@ -41,18 +47,11 @@ app = FastAPI(
     },
 )
 
-app.include_router(router=sprocket_router)
-
-
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next: Any) -> Response:
-    response = Response("Internal server error", status_code=500)
-    try:
-        request.state.db = Session()
-        response = await call_next(request)
-    finally:
-        request.state.db.close()
-    return response
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_queries()
+app.include_router(
+    router=async_sprocket_router if database.DATABASE_ASYNC else sprocket_router
+)
 
 
 @app.exception_handler(RequestValidationError)
@@ -66,3 +65,15 @@ async def validation_exception_handler(
 @app.get("/health")
 def health_check() -> Dict[str, str]:
     return {"status": "ok"}
+
+
+@app.get("/metrics/pool")
+def pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """Connection pool usage, checkout wait times and timeouts per engine."""
+    return pool.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics() -> Response:
+    """Request, database, cache and pool metrics in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=metrics.METRICS_MEDIA_TYPE)
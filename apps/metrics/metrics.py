@@ -0,0 +1,378 @@
+"""Prometheus metrics of the API, rendered in the text exposition format.
+
+Recording is plain dict and list arithmetic on the event loop, so the
+middleware adds a few microseconds per request and the query listeners
+about two per statement, see ``benchmarks/metrics_overhead.py``. Like the memory cache, every worker keeps
+its own metrics; Prometheus scrapes each one.
+"""
+
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from apps.cache import cache
+from apps.database import pool
+from apps.metrics import timing
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_ROUTE = "unmatched"
+# Add a Server-Timing header with the db, cache and serialize phases.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+# A statement repeated this many times in one request is reported as an N+1,
+# 0 turns the per-statement counts off.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+CACHE_HIT_SOURCES = ("memory", "redis", "coalesced", "batch")
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+
+class RouteStats:
+    __slots__ = (
+        "buckets",
+        "seconds",
+        "count",
+        "queries",
+        "query_seconds",
+        "n_plus_one",
+    )
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = 0.0
+        self.count = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.n_plus_one = 0
+
+    def observe(self, seconds: float, timings: timing.RequestTimings) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.seconds += seconds
+        self.count += 1
+        self.queries += timings.queries
+        self.query_seconds += timings.db
+
+
+routes: Dict[Tuple[str, str, int], RouteStats] = {}
+in_flight = 0
+
+
+class MetricsMiddleware:
+    """Time every HTTP request by method, route template and status.
+
+    A pure ASGI middleware: it only wraps ``send`` to read the status and add
+    the ``Server-Timing`` header, and the route template is the one FastAPI
+    stored in the scope while routing. Requests that repeat a statement
+    ``N_PLUS_ONE_THRESHOLD`` times are logged as N+1 patterns.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        global in_flight
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    value = timing.server_timing(
+                        timings, time.perf_counter() - started_at
+                    )
+                    message = {
+                        **message,
+                        "headers": [
+                            *message.get("headers", []),
+                            (b"server-timing", value.encode()),
+                        ],
+                    }
+            await send(message)
+
+        timings = timing.RequestTimings()
+        token = timing.current.set(timings)
+        in_flight += 1
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            in_flight -= 1
+            timing.current.reset(token)
+            route = scope.get("route")
+            key = (
+                scope["method"],
+                UNMATCHED_ROUTE if route is None else route.path,
+                status,
+            )
+            stats = routes.get(key)
+            if stats is None:
+                stats = routes[key] = RouteStats()
+            stats.observe(elapsed, timings)
+            repeated = (
+                timing.repeated_statements(timings.statements, N_PLUS_ONE_THRESHOLD)
+                if N_PLUS_ONE_THRESHOLD
+                else []
+            )
+            if repeated:
+                stats.n_plus_one += 1
+                logger.warning(
+                    f"N+1 queries in {key[0]} {key[1]}: "
+                    + "; ".join(
+                        f"{timings.statements[statement]}x {statement}"
+                        for statement in repeated
+                    )
+                )
+
+
+def timed_execute(
+    context: Any, statement: str, execute: Callable[..., Any], *args: Any
+) -> Optional[bool]:
+    """Run ``execute`` for the dialect, recording it in the request timings.
+
+    Returns ``None`` outside of requests so the dialect runs the statement
+    itself, and ``True`` to tell it the statement already ran.
+    """
+    timings = timing.current.get()
+    if timings is None:
+        return None
+    started_at = time.perf_counter()
+    execute(*args)
+    timings.db += time.perf_counter() - started_at
+    timings.queries += 1
+    # Batches of one bulk insert repeat their statement without being an N+1.
+    if N_PLUS_ONE_THRESHOLD and not context.executemany:
+        timings.statements[statement] = timings.statements.get(statement, 0) + 1
+    return True
+
+
+def do_execute(
+    cursor: Any, statement: str, parameters: Any, context: Any
+) -> Optional[bool]:
+    return timed_execute(
+        context,
+        statement,
+        context.dialect.do_execute,
+        cursor,
+        statement,
+        parameters,
+        context,
+    )
+
+
+def do_executemany(
+    cursor: Any, statement: str, parameters: Any, context: Any
+) -> Optional[bool]:
+    return timed_execute(
+        context,
+        statement,
+        context.dialect.do_executemany,
+        cursor,
+        statement,
+        parameters,
+        context,
+    )
+
+
+def do_execute_no_params(cursor: Any, statement: str, context: Any) -> Optional[bool]:
+    return timed_execute(
+        context,
+        statement,
+        context.dialect.do_execute_no_params,
+        cursor,
+        statement,
+        context,
+    )
+
+
+QUERY_LISTENERS = (do_execute, do_executemany, do_execute_no_params)
+
+
+def instrument_queries() -> None:
+    """Count the statements and database time of every engine per request.
+
+    The dialect events wrap the DBAPI call itself; unlike cursor events they
+    keep SQLAlchemy on its fast execution path, so a statement outside of a
+    request costs one ``ContextVar`` lookup. Sync routes and dependencies run
+    in the threadpool with a copy of the request context, and async sessions
+    in a greenlet of the request task, so both see the ``timing.current`` of
+    their request.
+    """
+    for listener in QUERY_LISTENERS:
+        if not event.contains(Engine, listener.__name__, listener):
+            event.listen(Engine, listener.__name__, listener)
+
+
+def escape(value: Any) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def labels(**values: Any) -> str:
+    return ",".join(f'{name}="{escape(value)}"' for name, value in values.items())
+
+
+def header(name: str, kind: str, help: str) -> List[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+
+def histogram(
+    name: str,
+    label_values: str,
+    bounds: Iterable[float],
+    counts: List[int],
+    total: float,
+) -> List[str]:
+    prefix = f"{label_values}," if label_values else ""
+    lines, cumulative = [], 0
+    for bound, count in zip((*bounds, "+Inf"), counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{label_values}}} {total}")
+    lines.append(f"{name}_count{{{label_values}}} {cumulative}")
+    return lines
+
+
+def render_requests() -> List[str]:
+    items = sorted(routes.items())
+    lines = header(
+        "powerflex_http_request_duration_seconds",
+        "histogram",
+        "HTTP request latency by method, route and status.",
+    )
+    for (method, route, status), stats in items:
+        lines += histogram(
+            "powerflex_http_request_duration_seconds",
+            labels(method=method, route=route, status=status),
+            LATENCY_BUCKETS,
+            stats.buckets,
+            stats.seconds,
+        )
+    lines += header(
+        "powerflex_http_requests_in_flight", "gauge", "HTTP requests being served."
+    )
+    lines.append(f"powerflex_http_requests_in_flight {in_flight}")
+    lines += header(
+        "powerflex_db_queries_total",
+        "counter",
+        "SQL statements run by requests, by method, route and status.",
+    )
+    for (method, route, status), stats in items:
+        route_labels = labels(method=method, route=route, status=status)
+        lines.append(f"powerflex_db_queries_total{{{route_labels}}} {stats.queries}")
+    lines += header(
+        "powerflex_db_n_plus_one_total",
+        "counter",
+        "Requests that repeated a statement N_PLUS_ONE_THRESHOLD times or more.",
+    )
+    for (method, route, status), stats in items:
+        route_labels = labels(method=method, route=route, status=status)
+        lines.append(
+            f"powerflex_db_n_plus_one_total{{{route_labels}}} {stats.n_plus_one}"
+        )
+    lines += header(
+        "powerflex_db_query_duration_seconds_total",
+        "counter",
+        "Time requests spent in SQL statements, by method, route and status.",
+    )
+    for (method, route, status), stats in items:
+        route_labels = labels(method=method, route=route, status=status)
+        lines.append(
+            f"powerflex_db_query_duration_seconds_total{{{route_labels}}} "
+            f"{stats.query_seconds}"
+        )
+    return lines
+
+
+def render_cache() -> List[str]:
+    served = dict(cache.served)
+    total = sum(served.values())
+    lines = header(
+        "powerflex_cache_responses_total",
+        "counter",
+        "Cached route responses by source; miss responses were built.",
+    )
+    for source, count in sorted(served.items()):
+        lines.append(
+            f"powerflex_cache_responses_total{{{labels(source=source)}}} {count}"
+        )
+    ratios = {
+        "hit": sum(served.get(source, 0) for source in CACHE_HIT_SOURCES),
+        "stale": served.get("stale", 0),
+        "miss": served.get("miss", 0),
+    }
+    lines += header(
+        "powerflex_cache_ratio",
+        "gauge",
+        "Share of cached route responses that were hits, stale or misses.",
+    )
+    for result, count in ratios.items():
+        ratio = count / total if total else 0.0
+        lines.append(f"powerflex_cache_ratio{{{labels(result=result)}}} {ratio}")
+    lines += header(
+        "powerflex_memory_cache_lookups_total",
+        "counter",
+        "Lookups in this worker's memory cache.",
+    )
+    for result, count in (
+        ("hit", cache.memory_cache.hits),
+        ("miss", cache.memory_cache.misses),
+    ):
+        lines.append(
+            f"powerflex_memory_cache_lookups_total{{{labels(result=result)}}} {count}"
+        )
+    return lines
+
+
+def render_pools() -> List[str]:
+    snapshots = sorted(pool.snapshot().items())
+    lines = []
+    for field, kind, help in (
+        ("checked_out", "gauge", "Connections checked out of the pool."),
+        ("checked_in", "gauge", "Idle connections in the pool."),
+        ("overflow", "gauge", "Connections opened past the pool size."),
+        ("checkouts", "counter", "Connection checkouts."),
+        ("connections", "counter", "Connections opened."),
+        ("timeouts", "counter", "Checkouts that timed out waiting."),
+    ):
+        name = f"powerflex_db_pool_{field}"
+        lines += header(name, kind, help)
+        for engine, snapshot in snapshots:
+            if field in snapshot:
+                lines.append(f"{name}{{{labels(engine=engine)}}} {snapshot[field]}")
+    lines += header(
+        "powerflex_db_pool_wait_seconds",
+        "histogram",
+        "Time checkouts waited for a connection.",
+    )
+    for engine, metrics in sorted(pool.pool_metrics.items()):
+        with metrics.lock:
+            counts, total = list(metrics.wait_counts), metrics.wait_sum
+        lines += histogram(
+            "powerflex_db_pool_wait_seconds",
+            labels(engine=engine),
+            pool.WAIT_BUCKETS,
+            counts,
+            total,
+        )
+    return lines
+
+
+def render() -> bytes:
+    lines = render_requests() + render_cache() + render_pools()
+    return ("\n".join(lines) + "\n").encode()
@@ -0,0 +1,62 @@
+"""Per-request statements and time spent in the db, cache and serialize phases.
+
+This module imports nothing from the app, so the cache layer and the
+serializers can record into the timings of the request they run for.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Mapping, Optional
+
+PHASES = ("db", "cache", "serialize")
+
+
+class RequestTimings:
+    """Statements run by one request and the seconds spent in each phase."""
+
+    __slots__ = ("queries", "statements", *PHASES)
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.statements: Dict[str, int] = {}
+        self.db = 0.0
+        self.cache = 0.0
+        self.serialize = 0.0
+
+
+current: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Add the time spent in the block to the ``name`` phase of the request."""
+    timings = current.get()
+    if timings is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        setattr(timings, name, getattr(timings, name) + elapsed)
+
+
+def repeated_statements(statements: Mapping[str, int], threshold: int) -> List[str]:
+    """Statements run at least ``threshold`` times, the mark of an N+1 pattern."""
+    return [statement for statement, count in statements.items() if count >= threshold]
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    """A ``Server-Timing`` header value with the phases and the total, in ms."""
+    return ", ".join(
+        [
+            f'db;dur={timings.db * 1000:.3f};desc="{timings.queries} queries"',
+            f"cache;dur={timings.cache * 1000:.3f}",
+            f"serialize;dur={timings.serialize * 1000:.3f}",
+            f"total;dur={total * 1000:.3f}",
+        ]
+    )
@@ -0,0 +1,408 @@
+from typing import Annotated, AsyncIterator, List, Optional, Union
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from apps.cache import cache
+from apps.database import database
+from apps.sprocket import async_services, schemas, services
+
+router = APIRouter(prefix="/api/v1")
+
+
+# ChartData CRUD
+@router.post(path="/chart_data", response_model=schemas.ChartDataResponse)
+async def create_chart_data(
+    chart_data: schemas.ChartDataCreate,
+    session: database.AsyncSessionDep,
+) -> schemas.ChartDataResponse:
+    return await async_services.create_chart_data(
+        session=session, chart_data=chart_data
+    )
+
+
+@cache.response_cache(
+    response_model=schemas.ChartDataResponse,
+    tags=services.chart_data_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+)
+async def chart_data_rows(
+    chart_data_id: int, session: AsyncSession
+) -> schemas.ChartDataResponse:
+    chart_data = await async_services.get_chart_data(
+        session=session, chart_data_id=chart_data_id
+    )
+    if not chart_data:
+        raise HTTPException(status_code=404, detail="ChartData not found")
+    return chart_data
+
+
+@cache.response_cache(
+    response_model=schemas.ChartDataColumnarResponse,
+    tags=services.chart_data_columns_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+    media_type=services.COLUMNAR_MEDIA_TYPE,
+)
+async def chart_data_columns(
+    chart_data_id: int, session: AsyncSession
+) -> schemas.ChartDataColumnarResponse:
+    return await async_services.get_chart_data_columns(
+        session=session, chart_data_id=chart_data_id
+    )
+
+
+@router.get(
+    path="/chart_data/{chart_data_id}",
+    response_model=schemas.ChartDataResponse,
+    responses=services.columnar_responses(schemas.ChartDataColumnarResponse),
+)
+async def read_chart_data(
+    chart_data_id: int,
+    request: Request,
+    session: database.AsyncSessionDep,
+    chart_data_format: schemas.ChartDataFormat = Depends(services.chart_data_format),
+) -> Response:
+    async def respond() -> Response:
+        if chart_data_format == schemas.ChartDataFormat.columnar:
+            return await chart_data_columns(
+                chart_data_id=chart_data_id, session=session
+            )
+        return await chart_data_rows(chart_data_id=chart_data_id, session=session)
+
+    return await cache.conditional_response(request, respond)
+
+
+@router.get(
+    path="/chart_data/{chart_data_id}/aggregate",
+    response_model=schemas.SPRocketProductionAggregateResponse,
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketProductionAggregateResponse,
+    tags=services.production_aggregate_cache_tags,
+)
+async def aggregate_chart_data(
+    chart_data_id: int,
+    session: database.AsyncSessionDep,
+    bucket: schemas.AggregationBucket = Query(schemas.AggregationBucket.hour),
+    start: Optional[int] = Query(None),
+    end: Optional[int] = Query(None),
+) -> schemas.SPRocketProductionAggregateResponse:
+    return await async_services.aggregate_chart_data(
+        session=session,
+        chart_data_id=chart_data_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+
+
+@router.post(path="/factories", response_model=schemas.FactoryResponse)
+async def create_factory(
+    factory: schemas.FactoryCreate,
+    session: database.AsyncSessionDep,
+) -> schemas.FactoryResponse:
+    return await async_services.create_factory(session=session, factory=factory)
+
+
+@router.get(
+    path="/factories",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Every factory as a JSON array, or as NDJSON when "
+            f"`Accept: {services.NDJSON_MEDIA_TYPE}` is sent.",
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/FactoryResponse"},
+                    }
+                },
+                services.NDJSON_MEDIA_TYPE: {},
+            },
+        }
+    },
+)
+async def list_factories(
+    request: Request,
+    session_factory: database.AsyncSessionFactoryDep,
+    ids: Optional[List[int]] = Query(None, max_length=services.MAX_BATCH_IDS),
+) -> Response:
+    ndjson = services.NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    if ids and not ndjson:
+        async with session_factory() as session:
+            return await async_services.get_many(
+                session=session,
+                route=factory_rows,
+                id_name="factory_id",
+                ids=ids,
+                service=services.get_factories_by_ids,
+            )
+
+    async def content() -> AsyncIterator[bytes]:
+        async with session_factory() as session:
+            async for chunk in async_services.stream_factories(
+                session=session, factory_ids=ids, ndjson=ndjson
+            ):
+                yield chunk
+
+    return StreamingResponse(
+        content(),
+        media_type=services.NDJSON_MEDIA_TYPE if ndjson else "application/json",
+    )
+
+
+@cache.response_cache(
+    response_model=schemas.FactoryResponse,
+    tags=services.factory_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+)
+async def factory_rows(
+    factory_id: int, session: AsyncSession
+) -> schemas.FactoryResponse:
+    factory = await async_services.get_factory(session=session, factory_id=factory_id)
+    if not factory:
+        raise HTTPException(status_code=404, detail="Factory not found")
+    return factory
+
+
+@cache.response_cache(
+    response_model=schemas.FactoryColumnarResponse,
+    tags=services.factory_columns_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+    media_type=services.COLUMNAR_MEDIA_TYPE,
+)
+async def factory_columns(
+    factory_id: int, session: AsyncSession
+) -> schemas.FactoryColumnarResponse:
+    factory = await async_services.get_factory_columns(
+        session=session, factory_id=factory_id
+    )
+    if not factory:
+        raise HTTPException(status_code=404, detail="Factory not found")
+    return factory
+
+
+@router.get(
+    path="/factories/{factory_id}",
+    response_model=schemas.FactoryResponse,
+    responses=services.columnar_responses(schemas.FactoryColumnarResponse),
+)
+async def read_factory(
+    factory_id: int,
+    request: Request,
+    session: database.AsyncSessionDep,
+    chart_data_format: schemas.ChartDataFormat = Depends(services.chart_data_format),
+) -> Response:
+    async def respond() -> Response:
+        if chart_data_format == schemas.ChartDataFormat.columnar:
+            return await factory_columns(factory_id=factory_id, session=session)
+        return await factory_rows(factory_id=factory_id, session=session)
+
+    return await cache.conditional_response(request, respond)
+
+
+@router.get(
+    path="/factories/{factory_id}/aggregate",
+    response_model=schemas.SPRocketProductionAggregateResponse,
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketProductionAggregateResponse,
+    tags=services.production_aggregate_cache_tags,
+)
+async def aggregate_factory(
+    factory_id: int,
+    session: database.AsyncSessionDep,
+    bucket: schemas.AggregationBucket = Query(schemas.AggregationBucket.hour),
+    start: Optional[int] = Query(None),
+    end: Optional[int] = Query(None),
+) -> schemas.SPRocketProductionAggregateResponse:
+    return await async_services.aggregate_factory(
+        session=session, factory_id=factory_id, bucket=bucket, start=start, end=end
+    )
+
+
+@router.get(path="/sprockets", response_model=List[schemas.SPRocketTypeResponse])
+async def list_sprocket_type(
+    session: database.AsyncSessionDep,
+    response: Response,
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    ids: Optional[List[int]] = Query(None, max_length=services.MAX_BATCH_IDS),
+) -> Union[Response, List[schemas.SPRocketTypeResponse]]:
+    if ids:
+        return await async_services.get_many(
+            session=session,
+            route=get_sprocket_type,
+            id_name="sprocket_id",
+            ids=ids,
+            service=services.get_sprocket_types_by_ids,
+        )
+    sprockets, next_cursor = await async_services.get_sprocket_types(
+        session=session, page=page, limit=limit, cursor=cursor
+    )
+    if next_cursor is not None:
+        response.headers[services.NEXT_CURSOR_HEADER] = next_cursor
+    return sprockets
+
+
+@router.get(
+    path="/sprockets/{sprocket_id}", response_model=schemas.SPRocketTypeResponse
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketTypeResponse, tags=services.sprocket_type_cache_tags
+)
+async def get_sprocket_type(
+    sprocket_id: int, session: database.AsyncSessionDep
+) -> schemas.SPRocketTypeResponse:
+    sprocket = await async_services.get_sprocket_type(
+        session=session, sprocket_type_id=sprocket_id
+    )
+    if not sprocket:
+        raise HTTPException(status_code=404, detail="Sprocket not found")
+    return sprocket
+
+
+@router.get(
+    path="/sprockets/{sprocket_id}/aggregate",
+    response_model=schemas.SPRocketTypeAggregateResponse,
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketTypeAggregateResponse,
+    tags=services.sprocket_type_aggregate_cache_tags,
+)
+async def aggregate_sprocket_type(
+    sprocket_id: int,
+    session: database.AsyncSessionDep,
+    bucket: schemas.AggregationBucket = Query(schemas.AggregationBucket.hour),
+    start: Optional[int] = Query(None),
+    end: Optional[int] = Query(None),
+) -> schemas.SPRocketTypeAggregateResponse:
+    return await async_services.aggregate_sprocket_type(
+        session=session,
+        sprocket_type_id=sprocket_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+
+
+@router.post(path="/sprockets", response_model=schemas.SPRocketTypeResponse)
+async def create_sprocket_type(
+    sprocket: schemas.SPRocketTypeCreate,
+    session: database.AsyncSessionDep,
+) -> schemas.SPRocketTypeResponse:
+    return await async_services.create_sprocket_type(
+        session=session, sprocket_type=sprocket
+    )
+
+
+@router.post(path="/sprockets/bulk", response_model=schemas.BulkCreateResponse)
+async def create_sprocket_types(
+    sprockets: Annotated[
+        List[schemas.SPRocketTypeCreate], Body(max_length=services.MAX_BULK_ITEMS)
+    ],
+    session: database.AsyncSessionDep,
+) -> schemas.BulkCreateResponse:
+    return await async_services.create_sprocket_types(
+        session=session, sprocket_types=sprockets
+    )
+
+
+@router.put(
+    path="/sprockets/{sprocket_id}", response_model=schemas.SPRocketTypeResponse
+)
+async def update_sprocket_type(
+    sprocket_id: int,
+    sprocket: schemas.SPRocketTypeCreate,
+    session: database.AsyncSessionDep,
+) -> schemas.SPRocketTypeResponse:
+    updated_sprocket = await async_services.update_sprocket_type(
+        session=session, sprocket_type_id=sprocket_id, sprocket_type=sprocket
+    )
+    if not updated_sprocket:
+        raise HTTPException(status_code=404, detail="Sprocket not found")
+    return updated_sprocket
+
+
+@router.post(
+    path="/sprocket_production/", response_model=schemas.SPRocketProductionResponse
+)
+async def create_sprocket_production(
+    sprocket_production: schemas.SPRocketProductionCreate,
+    session: database.AsyncSessionDep,
+) -> schemas.SPRocketProductionResponse:
+    return await async_services.create_sprocket_production(
+        session=session, sprocket_production=sprocket_production
+    )
+
+
+@router.post(
+    path="/sprocket_production/bulk", response_model=schemas.BulkCreateResponse
+)
+async def create_sprocket_productions(
+    sprocket_productions: Annotated[
+        List[schemas.SPRocketProductionCreate],
+        Body(max_length=services.MAX_BULK_ITEMS),
+    ],
+    session: database.AsyncSessionDep,
+) -> schemas.BulkCreateResponse:
+    return await async_services.create_sprocket_productions(
+        session=session, sprocket_productions=sprocket_productions
+    )
+
+
+@router.get(
+    path="/sprocket_production/{sprocket_production_id}",
+    response_model=schemas.SPRocketProductionResponse,
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketProductionResponse,
+    tags=services.sprocket_production_cache_tags,
+)
+async def read_sprocket_production(
+    sprocket_production_id: int,
+    session: database.AsyncSessionDep,
+) -> schemas.SPRocketProductionResponse:
+    sprocket_production = await async_services.get_sprocket_production(
+        session=session, sprocket_production_id=sprocket_production_id
+    )
+    if sprocket_production is None:
+        raise HTTPException(status_code=404, detail="Sprocket production not found")
+    return sprocket_production
+
+
+@router.get(
+    path="/sprocket_production/",
+    response_model=List[schemas.SPRocketProductionResponse],
+)
+async def list_sprocket_production(
+    session: database.AsyncSessionDep,
+    response: Response,
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    ids: Optional[List[int]] = Query(None, max_length=services.MAX_BATCH_IDS),
+) -> Union[Response, List[schemas.SPRocketProductionResponse]]:
+    if ids:
+        return await async_services.get_many(
+            session=session,
+            route=read_sprocket_production,
+            id_name="sprocket_production_id",
+            ids=ids,
+            service=services.get_sprocket_productions_by_ids,
+        )
+    sprocket_productions, next_cursor = (
+        await async_services.get_all_sprocket_production(
+            session=session, page=page, limit=limit, cursor=cursor
+        )
+    )
+    if next_cursor is not None:
+        response.headers[services.NEXT_CURSOR_HEADER] = next_cursor
+    return sprocket_productions
@@ -0,0 +1,330 @@
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, Type, TypeVar
+
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from apps.cache import cache
+from apps.sprocket import schemas, services
+
+ResponseT = TypeVar("ResponseT", bound=BaseModel)
+
+
+async def run_service(
+    session: AsyncSession,
+    service: Callable[..., Any],
+    response_model: Type[ResponseT],
+    **kwargs: Any,
+) -> Optional[ResponseT]:
+    """Run a sync service on the async connection and validate its result.
+
+    The service and the response validation both run inside ``run_sync``, so
+    lazy-loaded relationships are awaited on the event loop instead of
+    blocking a threadpool worker. The cache invalidations of writes are
+    deferred until the service returned and run in the threadpool.
+    """
+
+    def call(sync_session: Session) -> Optional[ResponseT]:
+        result = service(session=sync_session, **kwargs)
+        if result is None:
+            return None
+        return response_model.model_validate(result)
+
+    async with cache.invalidate_after():
+        return await session.run_sync(call)
+
+
+async def run_page_service(
+    session: AsyncSession,
+    service: Callable[..., Any],
+    response_model: Type[ResponseT],
+    limit: int,
+    **kwargs: Any,
+) -> Tuple[List[ResponseT], Optional[str]]:
+    def call(sync_session: Session) -> Tuple[List[ResponseT], Optional[str]]:
+        items = service(session=sync_session, limit=limit, **kwargs)
+        return (
+            [response_model.model_validate(item) for item in items],
+            services.next_cursor(items=items, limit=limit),
+        )
+
+    return await session.run_sync(call)
+
+
+async def get_many(
+    session: AsyncSession,
+    route: Callable[..., Any],
+    id_name: str,
+    ids: List[int],
+    service: Callable[..., Any],
+) -> Response:
+    """``cache.get_many`` with the Redis I/O in the threadpool.
+
+    Only the load and rendering of the misses run inside ``run_sync``, so
+    the event loop never waits on Redis.
+    """
+    batch = await run_in_threadpool(cache.lookup_many, route, id_name, ids)
+    rendered: List[Tuple[Any, bytes]] = []
+    if batch.misses:
+        rendered = await session.run_sync(
+            lambda sync_session: cache.render_many(
+                route, service(session=sync_session, ids=batch.misses)
+            )
+        )
+    return await run_in_threadpool(cache.store_many, route, batch, rendered)
+
+
+async def create_sprocket_type(
+    session: AsyncSession, sprocket_type: schemas.SPRocketTypeCreate
+) -> schemas.SPRocketTypeResponse:
+    return await run_service(
+        session,
+        services.create_sprocket_type,
+        schemas.SPRocketTypeResponse,
+        sprocket_type=sprocket_type,
+    )
+
+
+async def create_sprocket_types(
+    session: AsyncSession, sprocket_types: List[schemas.SPRocketTypeCreate]
+) -> schemas.BulkCreateResponse:
+    return await run_service(
+        session,
+        services.create_sprocket_types,
+        schemas.BulkCreateResponse,
+        sprocket_types=sprocket_types,
+    )
+
+
+async def create_sprocket_productions(
+    session: AsyncSession,
+    sprocket_productions: List[schemas.SPRocketProductionCreate],
+) -> schemas.BulkCreateResponse:
+    return await run_service(
+        session,
+        services.create_sprocket_productions,
+        schemas.BulkCreateResponse,
+        sprocket_productions=sprocket_productions,
+    )
+
+
+async def create_sprocket_production(
+    session: AsyncSession, sprocket_production: schemas.SPRocketProductionCreate
+) -> schemas.SPRocketProductionResponse:
+    return await run_service(
+        session,
+        services.create_sprocket_production,
+        schemas.SPRocketProductionResponse,
+        sprocket_production=sprocket_production,
+    )
+
+
+async def get_sprocket_production(
+    session: AsyncSession, sprocket_production_id: int
+) -> Optional[schemas.SPRocketProductionResponse]:
+    return await run_service(
+        session,
+        services.get_sprocket_production,
+        schemas.SPRocketProductionResponse,
+        sprocket_production_id=sprocket_production_id,
+    )
+
+
+async def get_all_sprocket_production(
+    session: AsyncSession, page: int = 1, limit: int = 10, cursor: Optional[str] = None
+) -> Tuple[List[schemas.SPRocketProductionResponse], Optional[str]]:
+    return await run_page_service(
+        session,
+        services.get_all_sprocket_production,
+        schemas.SPRocketProductionResponse,
+        limit=limit,
+        page=page,
+        cursor=cursor,
+    )
+
+
+async def create_chart_data(
+    session: AsyncSession, chart_data: schemas.ChartDataCreate
+) -> schemas.ChartDataResponse:
+    return await run_service(
+        session,
+        services.create_chart_data,
+        schemas.ChartDataResponse,
+        chart_data=chart_data,
+    )
+
+
+async def get_chart_data(
+    session: AsyncSession, chart_data_id: int
+) -> schemas.ChartDataResponse:
+    return await run_service(
+        session,
+        services.get_chart_data,
+        schemas.ChartDataResponse,
+        chart_data_id=chart_data_id,
+    )
+
+
+async def get_chart_data_columns(
+    session: AsyncSession, chart_data_id: int
+) -> schemas.ChartDataColumnarResponse:
+    return await run_service(
+        session,
+        services.get_chart_data_columns,
+        schemas.ChartDataColumnarResponse,
+        chart_data_id=chart_data_id,
+    )
+
+
+async def create_factory(
+    session: AsyncSession, factory: schemas.FactoryCreate
+) -> schemas.FactoryResponse:
+    return await run_service(
+        session, services.create_factory, schemas.FactoryResponse, factory=factory
+    )
+
+
+async def get_factory(
+    session: AsyncSession, factory_id: int
+) -> Optional[schemas.FactoryResponse]:
+    return await run_service(
+        session, services.get_factory, schemas.FactoryResponse, factory_id=factory_id
+    )
+
+
+async def get_factory_columns(
+    session: AsyncSession, factory_id: int
+) -> Optional[schemas.FactoryColumnarResponse]:
+    return await run_service(
+        session,
+        services.get_factory_columns,
+        schemas.FactoryColumnarResponse,
+        factory_id=factory_id,
+    )
+
+
+async def aggregate_chart_data(
+    session: AsyncSession,
+    chart_data_id: int,
+    bucket: schemas.AggregationBucket,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> schemas.SPRocketProductionAggregateResponse:
+    return await run_service(
+        session,
+        services.aggregate_chart_data,
+        schemas.SPRocketProductionAggregateResponse,
+        chart_data_id=chart_data_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+
+
+async def aggregate_factory(
+    session: AsyncSession,
+    factory_id: int,
+    bucket: schemas.AggregationBucket,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> schemas.SPRocketProductionAggregateResponse:
+    return await run_service(
+        session,
+        services.aggregate_factory,
+        schemas.SPRocketProductionAggregateResponse,
+        factory_id=factory_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+
+
+async def aggregate_sprocket_type(
+    session: AsyncSession,
+    sprocket_type_id: int,
+    bucket: schemas.AggregationBucket,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> schemas.SPRocketTypeAggregateResponse:
+    return await run_service(
+        session,
+        services.aggregate_sprocket_type,
+        schemas.SPRocketTypeAggregateResponse,
+        sprocket_type_id=sprocket_type_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+
+
+async def get_sprocket_type(
+    session: AsyncSession, sprocket_type_id: int
+) -> Optional[schemas.SPRocketTypeResponse]:
+    return await run_service(
+        session,
+        services.get_sprocket_type,
+        schemas.SPRocketTypeResponse,
+        sprocket_type_id=sprocket_type_id,
+    )
+
+
+async def get_sprocket_types(
+    session: AsyncSession, page: int = 1, limit: int = 10, cursor: Optional[str] = None
+) -> Tuple[List[schemas.SPRocketTypeResponse], Optional[str]]:
+    return await run_page_service(
+        session,
+        services.get_sprocket_types,
+        schemas.SPRocketTypeResponse,
+        limit=limit,
+        page=page,
+        cursor=cursor,
+    )
+
+
+async def update_sprocket_type(
+    session: AsyncSession,
+    sprocket_type_id: int,
+    sprocket_type: schemas.SPRocketTypeCreate,
+) -> schemas.SPRocketTypeResponse:
+    return await run_service(
+        session,
+        services.update_sprocket_type,
+        schemas.SPRocketTypeResponse,
+        sprocket_type_id=sprocket_type_id,
+        sprocket_type=sprocket_type,
+    )
+
+
+async def stream_factories(
+    session: AsyncSession,
+    factory_ids: Optional[List[int]] = None,
+    ndjson: bool = False,
+) -> AsyncIterator[bytes]:
+    if not ndjson:
+        yield b"["
+    factories = await session.stream_scalars(
+        services.stream_factories_statement(factory_ids=factory_ids)
+    )
+    index = 0
+    async for factory in factories:
+        if index and not ndjson:
+            yield b","
+        index += 1
+        yield services.render_factory_head(factory)
+        if factory.chart_data_id is not None:
+            productions = await session.stream_scalars(
+                services.stream_productions_statement(
+                    chart_data_id=factory.chart_data_id
+                )
+            )
+            separator = b""
+            async for partition in productions.partitions():
+                yield separator + services.render_productions(partition)
+                separator = b","
+        yield services.render_factory_tail(factory)
+        if ndjson:
+            yield b"\n"
+    if not ndjson:
+        yield b"]"
@@ -1,15 +1,15 @@
 from datetime import datetime
 from typing import Any, List, Optional
 
-from sqlalchemy import event
+from sqlalchemy import Index, event
 from sqlmodel import Field, Relationship, SQLModel
 
 metadata = SQLModel.metadata
 
 
 class BaseSQLModel(SQLModel):
-    created_at: datetime = Field(default=datetime.now())
-    updated_at: datetime = Field(default=datetime.now())
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
 
     def __init_subclass__(cls, **kwargs: Any) -> None:
         super().__init_subclass__(**kwargs)
@@ -21,6 +21,14 @@ class BaseSQLModel(SQLModel):
 
 
 class SPRocketTypeSPRocketProductionLink(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_sprockettypesprocketproductionlink_sprocket_production_id",
+            "sprocket_production_id",
+            "sprocket_type_id",
+        ),
+    )
+
     sprocket_type_id: Optional[int] = Field(
         default=None, foreign_key="sprockettype.id", primary_key=True
     )
@@ -30,6 +38,8 @@ class SPRocketTypeSPRocketProductionLink(SQLModel, table=True):
 
 
 class SPRocketType(BaseSQLModel, table=True):
+    __table_args__ = (Index("ix_sprockettype_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     teeth: int
     pitch_diameter: float
@@ -44,6 +54,21 @@ class SPRocketType(BaseSQLModel, table=True):
 
 
 class SPRocketProduction(BaseSQLModel, table=True):
+    __table_args__ = (
+        # Covers the per-chart time-bucketed aggregation with index-only scans.
+        Index(
+            "ix_sprocketproduction_chart_data_id_time_totals",
+            "chart_data_id",
+            "time",
+            postgresql_include=[
+                "sprocket_production_actual",
+                "sprocket_production_goal",
+            ],
+        ),
+        Index("ix_sprocketproduction_time", "time"),
+        Index("ix_sprocketproduction_created_at_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     sprocket_production_actual: int
     sprocket_production_goal: int
@@ -75,6 +100,8 @@ class ChartData(BaseSQLModel, table=True):
 
 
 class Factory(BaseSQLModel, table=True):
+    __table_args__ = (Index("ix_factory_chart_data_id", "chart_data_id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     chart_data_id: Optional[int] = Field(default=None, foreign_key="chartdata.id")
     chart_data: Optional[ChartData] = Relationship(back_populates="factory")
@@ -83,9 +110,55 @@ class Factory(BaseSQLModel, table=True):
         return f"{self.id}"
 
 
+class ProductionRollupBase(SQLModel):
+    """Production totals of one owner over one ``granularity`` time bucket.
+
+    ``attainment_sum`` and ``attainment_count`` only cover productions with a
+    non-zero goal, so their ratio is the mean attainment of the bucket.
+    """
+
+    count: int = 0
+    sprocket_production_actual: int = 0
+    sprocket_production_goal: int = 0
+    attainment_sum: float = 0
+    attainment_count: int = 0
+
+
+class ChartDataRollup(ProductionRollupBase, table=True):
+    chart_data_id: int = Field(foreign_key="chartdata.id", primary_key=True)
+    granularity: str = Field(primary_key=True)
+    bucket: datetime = Field(primary_key=True)
+
+
+class SPRocketTypeRollup(ProductionRollupBase, table=True):
+    sprocket_type_id: int = Field(foreign_key="sprockettype.id", primary_key=True)
+    granularity: str = Field(primary_key=True)
+    bucket: datetime = Field(primary_key=True)
+
+
 class InitialDataLoad(BaseSQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     loaded: bool = False
 
     def __str__(self) -> str:
         return f"{self.id}"
+
+
+class InitialDataLoadSPRocketType(BaseSQLModel, table=True):
+    """A sprocket type a parallel load inserted, by position in the seed file."""
+
+    position: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    sprocket_type_id: int = Field(foreign_key="sprockettype.id")
+
+    def __str__(self) -> str:
+        return f"{self.position}"
+
+
+class InitialDataLoadFactory(BaseSQLModel, table=True):
+    """A seed factory a parallel load committed, by position in the seed file."""
+
+    position: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    chart_data_id: int = Field(foreign_key="chartdata.id")
+
+    def __str__(self) -> str:
+        return f"{self.position}"
@@ -1,15 +1,24 @@
-from typing import List, Sequence, Type
+from typing import Annotated, Iterator, List, Optional, Sequence, Type
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi_redis_cache import cache
-from sqlalchemy import ScalarResult
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
 
+from apps.cache import cache
 from apps.database import database
-from apps.sprocket import models, schemas, services
+from apps.sprocket import models, schemas, serializers, services
 
 router = APIRouter(prefix="/api/v1")
 
 
+def set_next_cursor(
+    response: Response, items: Sequence[models.BaseSQLModel], limit: int
+) -> None:
+    cursor = services.next_cursor(items=items, limit=limit)
+    if cursor is not None:
+        response.headers[services.NEXT_CURSOR_HEADER] = cursor
+
+
 # ChartData CRUD
 @router.post(path="/chart_data", response_model=schemas.ChartDataResponse)
 def create_chart_data(
@@ -19,20 +28,78 @@ def create_chart_data(
     return services.create_chart_data(session=session, chart_data=chart_data)
 
 
-@router.get(
-    path="/chart_data/{chart_data_id}", response_model=schemas.ChartDataResponse
+@cache.response_cache(
+    response_model=schemas.ChartDataResponse,
+    tags=services.chart_data_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+    serializer=serializers.json_serializer(schemas.ChartDataResponse),
 )
-@cache(expire=60)
-def read_chart_data(
-    chart_data_id: int,
-    session: database.SessionDep,
-) -> Type[models.ChartData]:
+def chart_data_rows(chart_data_id: int, session: Session) -> Type[models.ChartData]:
     chart_data = services.get_chart_data(session=session, chart_data_id=chart_data_id)
     if not chart_data:
         raise HTTPException(status_code=404, detail="ChartData not found")
     return chart_data
 
 
+@cache.response_cache(
+    response_model=schemas.ChartDataColumnarResponse,
+    tags=services.chart_data_columns_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+    media_type=services.COLUMNAR_MEDIA_TYPE,
+)
+def chart_data_columns(
+    chart_data_id: int, session: Session
+) -> schemas.ChartDataColumnarResponse:
+    return services.get_chart_data_columns(session=session, chart_data_id=chart_data_id)
+
+
+@router.get(
+    path="/chart_data/{chart_data_id}",
+    response_model=schemas.ChartDataResponse,
+    responses=services.columnar_responses(schemas.ChartDataColumnarResponse),
+)
+async def read_chart_data(
+    chart_data_id: int,
+    request: Request,
+    session: database.SessionDep,
+    chart_data_format: schemas.ChartDataFormat = Depends(services.chart_data_format),
+) -> Response:
+    async def respond() -> Response:
+        if chart_data_format == schemas.ChartDataFormat.columnar:
+            return await chart_data_columns(
+                chart_data_id=chart_data_id, session=session
+            )
+        return await chart_data_rows(chart_data_id=chart_data_id, session=session)
+
+    return await cache.conditional_response(request, respond)
+
+
+@router.get(
+    path="/chart_data/{chart_data_id}/aggregate",
+    response_model=schemas.SPRocketProductionAggregateResponse,
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketProductionAggregateResponse,
+    tags=services.production_aggregate_cache_tags,
+)
+def aggregate_chart_data(
+    chart_data_id: int,
+    session: database.SessionDep,
+    bucket: schemas.AggregationBucket = Query(schemas.AggregationBucket.hour),
+    start: Optional[int] = Query(None),
+    end: Optional[int] = Query(None),
+) -> schemas.SPRocketProductionAggregateResponse:
+    return services.aggregate_chart_data(
+        session=session,
+        chart_data_id=chart_data_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+
+
 @router.post(path="/factories", response_model=schemas.FactoryResponse)
 def create_factory(
     factory: schemas.FactoryCreate,
@@ -41,35 +108,188 @@ def create_factory(
     return services.create_factory(session=session, factory=factory)
 
 
-@router.get(path="/factories/{factory_id}", response_model=schemas.FactoryResponse)
-@cache(expire=60)
-def read_factory(factory_id: int, session: database.SessionDep) -> models.Factory:
+@router.get(
+    path="/factories",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Every factory as a JSON array, or as NDJSON when "
+            f"`Accept: {services.NDJSON_MEDIA_TYPE}` is sent.",
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/FactoryResponse"},
+                    }
+                },
+                services.NDJSON_MEDIA_TYPE: {},
+            },
+        }
+    },
+)
+def list_factories(
+    request: Request,
+    session_factory: database.SessionFactoryDep,
+    ids: Optional[List[int]] = Query(None, max_length=services.MAX_BATCH_IDS),
+) -> Response:
+    ndjson = services.NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    if ids and not ndjson:
+
+        def load(missing: List[int]) -> Iterator[models.Factory]:
+            with session_factory() as session:
+                yield from services.get_factories_by_ids(session=session, ids=missing)
+
+        return cache.get_many(
+            route=factory_rows, id_name="factory_id", ids=ids, load=load
+        )
+
+    def content() -> Iterator[bytes]:
+        with session_factory() as session:
+            yield from services.stream_factories(
+                session=session, factory_ids=ids, ndjson=ndjson
+            )
+
+    return StreamingResponse(
+        content(),
+        media_type=services.NDJSON_MEDIA_TYPE if ndjson else "application/json",
+    )
+
+
+@cache.response_cache(
+    response_model=schemas.FactoryResponse,
+    tags=services.factory_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+    serializer=serializers.json_serializer(schemas.FactoryResponse),
+)
+def factory_rows(factory_id: int, session: Session) -> models.Factory:
     factory = services.get_factory(session=session, factory_id=factory_id)
     if not factory:
         raise HTTPException(status_code=404, detail="Factory not found")
     return factory
 
 
+@cache.response_cache(
+    response_model=schemas.FactoryColumnarResponse,
+    tags=services.factory_columns_cache_tags,
+    stale_expire=cache.CACHE_STALE_EXPIRE,
+    etag=True,
+    media_type=services.COLUMNAR_MEDIA_TYPE,
+)
+def factory_columns(
+    factory_id: int, session: Session
+) -> schemas.FactoryColumnarResponse:
+    factory = services.get_factory_columns(session=session, factory_id=factory_id)
+    if not factory:
+        raise HTTPException(status_code=404, detail="Factory not found")
+    return factory
+
+
+@router.get(
+    path="/factories/{factory_id}",
+    response_model=schemas.FactoryResponse,
+    responses=services.columnar_responses(schemas.FactoryColumnarResponse),
+)
+async def read_factory(
+    factory_id: int,
+    request: Request,
+    session: database.SessionDep,
+    chart_data_format: schemas.ChartDataFormat = Depends(services.chart_data_format),
+) -> Response:
+    async def respond() -> Response:
+        if chart_data_format == schemas.ChartDataFormat.columnar:
+            return await factory_columns(factory_id=factory_id, session=session)
+        return await factory_rows(factory_id=factory_id, session=session)
+
+    return await cache.conditional_response(request, respond)
+
+
+@router.get(
+    path="/factories/{factory_id}/aggregate",
+    response_model=schemas.SPRocketProductionAggregateResponse,
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketProductionAggregateResponse,
+    tags=services.production_aggregate_cache_tags,
+)
+def aggregate_factory(
+    factory_id: int,
+    session: database.SessionDep,
+    bucket: schemas.AggregationBucket = Query(schemas.AggregationBucket.hour),
+    start: Optional[int] = Query(None),
+    end: Optional[int] = Query(None),
+) -> schemas.SPRocketProductionAggregateResponse:
+    return services.aggregate_factory(
+        session=session, factory_id=factory_id, bucket=bucket, start=start, end=end
+    )
+
+
 @router.get(path="/sprockets", response_model=List[schemas.SPRocketTypeResponse])
 def list_sprocket_type(
     session: database.SessionDep,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
-) -> ScalarResult[models.SPRocketType]:
-    return services.get_sprocket_types(session=session, page=page, limit=limit)
+    cursor: Optional[str] = Query(None),
+    ids: Optional[List[int]] = Query(None, max_length=services.MAX_BATCH_IDS),
+) -> Response:
+    if ids:
+        return cache.get_many(
+            route=get_sprocket_type,
+            id_name="sprocket_id",
+            ids=ids,
+            load=lambda missing: services.get_sprocket_types_by_ids(
+                session=session, ids=missing
+            ),
+        )
+    sprockets = services.get_sprocket_types(
+        session=session, page=page, limit=limit, cursor=cursor
+    )
+    response = serializers.json_response(schemas.SPRocketTypeResponse, sprockets)
+    set_next_cursor(response=response, items=sprockets, limit=limit)
+    return response
 
 
 @router.get(
     path="/sprockets/{sprocket_id}", response_model=schemas.SPRocketTypeResponse
 )
-@cache(expire=60)
-def get_sprocket_type(sprocket_id: int, session: database.SessionDep) -> models.SPRocketType:
+@cache.response_cache(
+    response_model=schemas.SPRocketTypeResponse,
+    tags=services.sprocket_type_cache_tags,
+    serializer=serializers.json_serializer(schemas.SPRocketTypeResponse),
+)
+def get_sprocket_type(
+    sprocket_id: int, session: database.SessionDep
+) -> models.SPRocketType:
     sprocket = services.get_sprocket_type(session=session, sprocket_type_id=sprocket_id)
     if not sprocket:
         raise HTTPException(status_code=404, detail="Sprocket not found")
     return sprocket
 
 
+@router.get(
+    path="/sprockets/{sprocket_id}/aggregate",
+    response_model=schemas.SPRocketTypeAggregateResponse,
+)
+@cache.response_cache(
+    response_model=schemas.SPRocketTypeAggregateResponse,
+    tags=services.sprocket_type_aggregate_cache_tags,
+)
+def aggregate_sprocket_type(
+    sprocket_id: int,
+    session: database.SessionDep,
+    bucket: schemas.AggregationBucket = Query(schemas.AggregationBucket.hour),
+    start: Optional[int] = Query(None),
+    end: Optional[int] = Query(None),
+) -> schemas.SPRocketTypeAggregateResponse:
+    return services.aggregate_sprocket_type(
+        session=session,
+        sprocket_type_id=sprocket_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+
+
 @router.post(path="/sprockets", response_model=schemas.SPRocketTypeResponse)
 def create_sprocket_type(
     sprocket: schemas.SPRocketTypeCreate,
@@ -78,6 +298,16 @@ def create_sprocket_type(
     return services.create_sprocket_type(session=session, sprocket_type=sprocket)
 
 
+@router.post(path="/sprockets/bulk", response_model=schemas.BulkCreateResponse)
+def create_sprocket_types(
+    sprockets: Annotated[
+        List[schemas.SPRocketTypeCreate], Body(max_length=services.MAX_BULK_ITEMS)
+    ],
+    session: database.SessionDep,
+) -> schemas.BulkCreateResponse:
+    return services.create_sprocket_types(session=session, sprocket_types=sprockets)
+
+
 @router.put(
     path="/sprockets/{sprocket_id}", response_model=schemas.SPRocketTypeResponse
 )
@@ -106,11 +336,30 @@ def create_sprocket_production(
     )
 
 
+@router.post(
+    path="/sprocket_production/bulk", response_model=schemas.BulkCreateResponse
+)
+def create_sprocket_productions(
+    sprocket_productions: Annotated[
+        List[schemas.SPRocketProductionCreate],
+        Body(max_length=services.MAX_BULK_ITEMS),
+    ],
+    session: database.SessionDep,
+) -> schemas.BulkCreateResponse:
+    return services.create_sprocket_productions(
+        session=session, sprocket_productions=sprocket_productions
+    )
+
+
 @router.get(
     path="/sprocket_production/{sprocket_production_id}",
     response_model=schemas.SPRocketProductionResponse,
 )
-@cache(expire=60)
+@cache.response_cache(
+    response_model=schemas.SPRocketProductionResponse,
+    tags=services.sprocket_production_cache_tags,
+    serializer=serializers.json_serializer(schemas.SPRocketProductionResponse),
+)
 def read_sprocket_production(
     sprocket_production_id: int,
     session: database.SessionDep,
@@ -131,8 +380,23 @@ def list_sprocket_production(
     session: database.SessionDep,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
-) -> Sequence[models.SPRocketProduction]:
-    response = services.get_all_sprocket_production(
-        session=session, page=page, limit=limit
+    cursor: Optional[str] = Query(None),
+    ids: Optional[List[int]] = Query(None, max_length=services.MAX_BATCH_IDS),
+) -> Response:
+    if ids:
+        return cache.get_many(
+            route=read_sprocket_production,
+            id_name="sprocket_production_id",
+            ids=ids,
+            load=lambda missing: services.get_sprocket_productions_by_ids(
+                session=session, ids=missing
+            ),
+        )
+    sprocket_productions = services.get_all_sprocket_production(
+        session=session, page=page, limit=limit, cursor=cursor
+    )
+    response = serializers.json_response(
+        schemas.SPRocketProductionResponse, sprocket_productions
     )
+    set_next_cursor(response=response, items=sprocket_productions, limit=limit)
     return response
@@ -1,5 +1,6 @@
 from datetime import datetime
-from typing import Annotated, Any, Dict, List
+from enum import Enum
+from typing import Annotated, Any, Dict, List, Optional
 
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 
@@ -70,6 +71,20 @@ class ChartDataResponse(ChartDataBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ChartDataFormat(str, Enum):
+    rows = "rows"
+    columnar = "columnar"
+
+
+class ChartDataColumnarResponse(ChartDataBase):
+    """A chart's productions as parallel arrays ordered by ``time``."""
+
+    id: int
+    time: List[int]
+    sprocket_production_actual: List[int]
+    sprocket_production_goal: List[int]
+
+
 class FactoryBase(BaseModel):
     pass
 
@@ -83,3 +98,44 @@ class FactoryResponse(FactoryBase):
     chart_data: ChartDataResponse
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class FactoryColumnarResponse(FactoryBase):
+    id: int
+    chart_data: ChartDataColumnarResponse
+
+
+class BulkCreateResult(BaseModel):
+    index: int
+    id: int
+
+
+class BulkCreateResponse(BaseModel):
+    created: int
+    results: List[BulkCreateResult]
+
+
+class AggregationBucket(str, Enum):
+    minute = "minute"
+    hour = "hour"
+    day = "day"
+
+
+class SPRocketProductionBucket(BaseModel):
+    time: int
+    count: int
+    sprocket_production_actual: int
+    sprocket_production_goal: int
+    attainment: Optional[float]
+
+
+class SPRocketProductionAggregateResponse(BaseModel):
+    chart_data_id: int
+    bucket: AggregationBucket
+    buckets: List[SPRocketProductionBucket]
+
+
+class SPRocketTypeAggregateResponse(BaseModel):
+    sprocket_type_id: int
+    bucket: AggregationBucket
+    buckets: List[SPRocketProductionBucket]
@@ -0,0 +1,81 @@
+"""Response serializers that skip Pydantic validation.
+
+Each function builds the dict of one response schema straight from the
+loaded ORM rows, and ``json_serializer`` writes it with orjson. The output
+matches ``schema.model_validate(row).model_dump_json()``, the schemas stay
+the documented ``response_model`` of their routes.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Type
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+from apps.metrics import timing
+from apps.sprocket import schemas
+
+Serializer = Callable[[Any], Dict[str, Any]]
+
+
+def sprocket_type(row: Any) -> Dict[str, Any]:
+    return {
+        "teeth": row.teeth,
+        "pitch_diameter": float(row.pitch_diameter),
+        "outside_diameter": float(row.outside_diameter),
+        "pitch": float(row.pitch),
+        "id": row.id,
+    }
+
+
+def sprocket_production(row: Any) -> Dict[str, Any]:
+    return {
+        "sprocket_production_actual": row.sprocket_production_actual,
+        "sprocket_production_goal": row.sprocket_production_goal,
+        "chart_data_id": row.chart_data_id,
+        "id": row.id,
+        "sprocket_types": [sprocket_type(type_row) for type_row in row.sprocket_types],
+        "time": int(row.time.timestamp()),
+    }
+
+
+def chart_data(row: Any) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "sprocket_productions": [
+            sprocket_production(production) for production in row.sprocket_productions
+        ],
+    }
+
+
+def factory(row: Any) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "chart_data": None if row.chart_data is None else chart_data(row.chart_data),
+    }
+
+
+SERIALIZERS: Dict[Type[BaseModel], Serializer] = {
+    schemas.SPRocketTypeResponse: sprocket_type,
+    schemas.SPRocketProductionResponse: sprocket_production,
+    schemas.ChartDataResponse: chart_data,
+    schemas.FactoryResponse: factory,
+}
+
+
+def json_serializer(response_model: Type[BaseModel]) -> Callable[[Any], bytes]:
+    serialize = SERIALIZERS[response_model]
+    return lambda row: orjson.dumps(serialize(row))
+
+
+def dumps_many(response_model: Type[BaseModel], rows: Iterable[Any]) -> bytes:
+    serialize = SERIALIZERS[response_model]
+    with timing.phase("serialize"):
+        return orjson.dumps([serialize(row) for row in rows])
+
+
+def json_response(response_model: Type[BaseModel], rows: Iterable[Any]) -> Response:
+    """A JSON array response of ``rows`` serialized as ``response_model``."""
+    return Response(
+        content=dumps_many(response_model, rows), media_type="application/json"
+    )
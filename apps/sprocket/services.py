@@ -1,11 +1,250 @@
-from typing import Optional, Sequence, Type
+import base64
+import json
+from datetime import datetime
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from fastapi import HTTPException
-from sqlalchemy import ScalarResult
-from sqlmodel import Session, select
+from fastapi import HTTPException, Query, Request
+from pydantic import BaseModel
+from sqlalchemy import (
+    Float,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    literal_column,
+    true,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, SQLModel, select
+from sqlmodel.sql.expression import SelectOfScalar
 
-from apps.sprocket import models, schemas
-from apps.sprocket.models import ChartData
+from apps.cache import cache
+from apps.sprocket import models, schemas, serializers
+from apps.sprocket.models import BaseSQLModel, ChartData
+
+ModelT = TypeVar("ModelT", bound=BaseSQLModel)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+COLUMNAR_MEDIA_TYPE = "application/vnd.powerflex.columnar+json"
+MAX_BATCH_IDS = 500
+MAX_BULK_ITEMS = 5000
+STREAM_FACTORIES_YIELD_PER = 100
+STREAM_PRODUCTIONS_YIELD_PER = 1000
+# strftime patterns truncating a time to its bucket on databases without
+# date_trunc. They keep the microseconds SQLAlchemy stores datetimes with on
+# sqlite, so stored buckets compare correctly with datetime parameters.
+BUCKET_FORMATS = {
+    schemas.AggregationBucket.minute: "%Y-%m-%d %H:%M:00.000000",
+    schemas.AggregationBucket.hour: "%Y-%m-%d %H:00:00.000000",
+    schemas.AggregationBucket.day: "%Y-%m-%d 00:00:00.000000",
+}
+BUCKET_PARSE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+ROLLUP_BUCKETS = (schemas.AggregationBucket.hour, schemas.AggregationBucket.day)
+ROLLUP_MODELS = {
+    "chart_data_id": models.ChartDataRollup,
+    "sprocket_type_id": models.SPRocketTypeRollup,
+}
+ROLLUP_TOTALS = (
+    "count",
+    "sprocket_production_actual",
+    "sprocket_production_goal",
+    "attainment_sum",
+    "attainment_count",
+)
+PRODUCTION_AGGREGATE_TAG = "production_aggregate"
+
+# Loader options matching each nested response schema, so building the
+# response never lazy-loads relationships one row at a time.
+SPROCKET_PRODUCTION_RESPONSE_OPTIONS = (
+    selectinload(models.SPRocketProduction.sprocket_types),
+)
+CHART_DATA_RESPONSE_OPTIONS = (
+    selectinload(models.ChartData.sprocket_productions).selectinload(
+        models.SPRocketProduction.sprocket_types
+    ),
+)
+FACTORY_RESPONSE_OPTIONS = (
+    joinedload(models.Factory.chart_data)
+    .selectinload(models.ChartData.sprocket_productions)
+    .selectinload(models.SPRocketProduction.sprocket_types),
+)
+
+
+def sprocket_type_tag(sprocket_type_id: int) -> str:
+    return f"sprocket_type:{sprocket_type_id}"
+
+
+def sprocket_production_tag(sprocket_production_id: int) -> str:
+    return f"sprocket_production:{sprocket_production_id}"
+
+
+def chart_data_tag(chart_data_id: int) -> str:
+    return f"chart_data:{chart_data_id}"
+
+
+def factory_tag(factory_id: int) -> str:
+    return f"factory:{factory_id}"
+
+
+def sprocket_type_aggregate_tag(sprocket_type_id: int) -> str:
+    return f"sprocket_type_aggregate:{sprocket_type_id}"
+
+
+def sprocket_type_cache_tags(sprocket_type: schemas.SPRocketTypeResponse) -> Set[str]:
+    return {sprocket_type_tag(sprocket_type.id)}
+
+
+def sprocket_production_cache_tags(
+    sprocket_production: schemas.SPRocketProductionResponse,
+) -> Set[str]:
+    return {sprocket_production_tag(sprocket_production.id)} | {
+        sprocket_type_tag(sprocket_type.id)
+        for sprocket_type in sprocket_production.sprocket_types
+    }
+
+
+def chart_data_cache_tags(chart_data: schemas.ChartDataResponse) -> Set[str]:
+    """Tag a chart data entry with itself and the sprocket types it embeds.
+
+    Productions are never updated in place, and adding or moving one evicts
+    its chart data tag, so per-production tags would only bloat the index.
+    """
+    return {chart_data_tag(chart_data.id)} | {
+        sprocket_type_tag(sprocket_type.id)
+        for sprocket_production in chart_data.sprocket_productions
+        for sprocket_type in sprocket_production.sprocket_types
+    }
+
+
+def factory_cache_tags(factory: schemas.FactoryResponse) -> Set[str]:
+    return {factory_tag(factory.id)} | chart_data_cache_tags(factory.chart_data)
+
+
+def chart_data_columns_cache_tags(
+    chart_data: schemas.ChartDataColumnarResponse,
+) -> Set[str]:
+    return {chart_data_tag(chart_data.id)}
+
+
+def factory_columns_cache_tags(factory: schemas.FactoryColumnarResponse) -> Set[str]:
+    return {factory_tag(factory.id), chart_data_tag(factory.chart_data.id)}
+
+
+def production_aggregate_cache_tags(
+    aggregate: schemas.SPRocketProductionAggregateResponse,
+) -> Set[str]:
+    return {chart_data_tag(aggregate.chart_data_id), PRODUCTION_AGGREGATE_TAG}
+
+
+def sprocket_type_aggregate_cache_tags(
+    aggregate: schemas.SPRocketTypeAggregateResponse,
+) -> Set[str]:
+    return {
+        sprocket_type_aggregate_tag(aggregate.sprocket_type_id),
+        PRODUCTION_AGGREGATE_TAG,
+    }
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    payload = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+def paginate(
+    stmt: SelectOfScalar[ModelT],
+    model: Type[ModelT],
+    page: int,
+    limit: int,
+    cursor: Optional[str],
+) -> SelectOfScalar[ModelT]:
+    """Order by the unique ``(created_at, id)`` key and page by offset or cursor.
+
+    With a cursor the page starts right after the last row of the previous
+    one through a keyset predicate, so deep pages cost the same as the first.
+    """
+    stmt = stmt.order_by(model.created_at, model.id).limit(limit)
+    if cursor is None:
+        return stmt.offset((page - 1) * limit)
+    created_at, id = decode_cursor(cursor)
+    return stmt.where(tuple_(model.created_at, model.id) > (created_at, id))
+
+
+def next_cursor(items: Sequence[BaseSQLModel], limit: int) -> Optional[str]:
+    if len(items) < limit:
+        return None
+    return encode_cursor(created_at=items[-1].created_at, id=items[-1].id)
+
+
+def insert_returning_ids(
+    session: Session, model: Type[SQLModel], rows: Sequence[Dict[str, Any]]
+) -> List[int]:
+    if not rows:
+        return []
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return list(session.scalars(stmt, rows))
+
+
+def get_by_ids(
+    session: Session,
+    model: Type[ModelT],
+    ids: Iterable[int],
+    options: Sequence[Any] = (),
+) -> Sequence[ModelT]:
+    ids = set(ids)
+    if not ids:
+        return []
+    stmt = select(model).where(model.id.in_(ids)).options(*options)
+    return session.exec(stmt).all()
+
+
+def resolve_ids(
+    session: Session, model: Type[ModelT], ids: Sequence[int], label: str
+) -> List[ModelT]:
+    """Load the ``model`` rows of ``ids`` with one ``IN`` query, in ``ids`` order.
+
+    Unknown ids are all reported in a single 422, like the bulk creates do,
+    instead of failing on the first one or silently turning into ``None``.
+    """
+    found = {row.id: row for row in get_by_ids(session=session, model=model, ids=ids)}
+    missing = sorted(set(ids) - found.keys())
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Unknown {label} ids {missing}")
+    return [found[id] for id in dict.fromkeys(ids)]
+
+
+def bulk_create_response(ids: Sequence[int]) -> schemas.BulkCreateResponse:
+    return schemas.BulkCreateResponse(
+        created=len(ids),
+        results=[
+            schemas.BulkCreateResult(index=index, id=id) for index, id in enumerate(ids)
+        ],
+    )
 
 
 def create_sprocket_type(
@@ -21,9 +260,12 @@ def create_sprocket_type(
 def create_sprocket_production(
     session: Session, sprocket_production: schemas.SPRocketProductionCreate
 ) -> models.SPRocketProduction:
-    sprocket_types = [
-        get_sprocket_type(session, st) for st in sprocket_production.sprocket_types
-    ]
+    sprocket_types = resolve_ids(
+        session=session,
+        model=models.SPRocketType,
+        ids=sprocket_production.sprocket_types,
+        label="sprocket type",
+    )
     session_sprocket_production = models.SPRocketProduction(
         sprocket_production_actual=sprocket_production.sprocket_production_actual,
         sprocket_production_goal=sprocket_production.sprocket_production_goal,
@@ -32,65 +274,608 @@ def create_sprocket_production(
         chart_data_id=sprocket_production.chart_data_id,
     )
     session.add(session_sprocket_production)
+    session.flush()
+    add_production_rollups(
+        session=session,
+        where=models.SPRocketProduction.id == session_sprocket_production.id,
+    )
+    session.commit()
+    cache.invalidate(
+        chart_data_tag(sprocket_production.chart_data_id),
+        *map(sprocket_type_aggregate_tag, sprocket_production.sprocket_types),
+    )
+    return get_sprocket_production(
+        session=session, sprocket_production_id=session_sprocket_production.id
+    )
+
+
+def create_sprocket_types(
+    session: Session, sprocket_types: Sequence[schemas.SPRocketTypeCreate]
+) -> schemas.BulkCreateResponse:
+    now = datetime.now()
+    ids = insert_returning_ids(
+        session=session,
+        model=models.SPRocketType,
+        rows=[
+            {**sprocket_type.model_dump(), "created_at": now, "updated_at": now}
+            for sprocket_type in sprocket_types
+        ],
+    )
     session.commit()
-    session.refresh(session_sprocket_production)
-    return session_sprocket_production
+    return bulk_create_response(ids)
+
+
+def create_sprocket_productions(
+    session: Session,
+    sprocket_productions: Sequence[schemas.SPRocketProductionCreate],
+) -> schemas.BulkCreateResponse:
+    """Insert a batch of productions and their links in one transaction.
+
+    Every referenced chart data and sprocket type is checked up front with
+    one query each; if any item references an unknown id nothing is written
+    and the errors of all items are reported together.
+    """
+    chart_data_ids = {p.chart_data_id for p in sprocket_productions}
+    sprocket_type_ids = {id for p in sprocket_productions for id in p.sprocket_types}
+    found_chart_data_ids = {
+        chart_data.id
+        for chart_data in get_by_ids(
+            session=session, model=models.ChartData, ids=chart_data_ids
+        )
+    }
+    found_sprocket_type_ids = {
+        sprocket_type.id
+        for sprocket_type in get_by_ids(
+            session=session, model=models.SPRocketType, ids=sprocket_type_ids
+        )
+    }
+    errors = []
+    for index, sprocket_production in enumerate(sprocket_productions):
+        if sprocket_production.chart_data_id not in found_chart_data_ids:
+            errors.append(
+                {
+                    "index": index,
+                    "error": f"Unknown chart data id {sprocket_production.chart_data_id}",
+                }
+            )
+        missing = sorted(
+            set(sprocket_production.sprocket_types) - found_sprocket_type_ids
+        )
+        if missing:
+            errors.append(
+                {"index": index, "error": f"Unknown sprocket type ids {missing}"}
+            )
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    now = datetime.now()
+    ids = insert_returning_ids(
+        session=session,
+        model=models.SPRocketProduction,
+        rows=[
+            {
+                "sprocket_production_actual": p.sprocket_production_actual,
+                "sprocket_production_goal": p.sprocket_production_goal,
+                "time": p.time,
+                "chart_data_id": p.chart_data_id,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for p in sprocket_productions
+        ],
+    )
+    link_rows = [
+        {"sprocket_production_id": id, "sprocket_type_id": sprocket_type_id}
+        for id, p in zip(ids, sprocket_productions)
+        for sprocket_type_id in dict.fromkeys(p.sprocket_types)
+    ]
+    if link_rows:
+        session.execute(insert(models.SPRocketTypeSPRocketProductionLink), link_rows)
+    add_production_rollups(session=session, where=models.SPRocketProduction.id.in_(ids))
+    session.commit()
+    cache.invalidate(
+        *(chart_data_tag(id) for id in chart_data_ids),
+        *(sprocket_type_aggregate_tag(id) for id in sprocket_type_ids),
+    )
+    return bulk_create_response(ids)
 
 
 def get_sprocket_production(
     session: Session, sprocket_production_id: int
 ) -> Type[models.SPRocketProduction]:
-    return session.get(models.SPRocketProduction, sprocket_production_id)
+    stmt = (
+        select(models.SPRocketProduction)
+        .where(models.SPRocketProduction.id == sprocket_production_id)
+        .options(*SPROCKET_PRODUCTION_RESPONSE_OPTIONS)
+    )
+    return session.exec(stmt).first()
 
 
 def get_all_sprocket_production(
-    session: Session, page: int = 1, limit: int = 10
+    session: Session, page: int = 1, limit: int = 10, cursor: Optional[str] = None
 ) -> Sequence[models.SPRocketProduction]:
-    offset = (page - 1) * limit
-    stmt = (
-        select(models.SPRocketProduction)
-        .order_by(models.SPRocketProduction.created_at)
-        .limit(limit)
-        .offset(offset)
+    stmt = paginate(
+        stmt=select(models.SPRocketProduction).options(
+            *SPROCKET_PRODUCTION_RESPONSE_OPTIONS
+        ),
+        model=models.SPRocketProduction,
+        page=page,
+        limit=limit,
+        cursor=cursor,
     )
     result = session.exec(stmt)
     return result.all()
 
 
+def get_sprocket_productions_by_ids(
+    session: Session, ids: Sequence[int]
+) -> Sequence[models.SPRocketProduction]:
+    return get_by_ids(
+        session=session,
+        model=models.SPRocketProduction,
+        ids=ids,
+        options=SPROCKET_PRODUCTION_RESPONSE_OPTIONS,
+    )
+
+
 def create_chart_data(
     session: Session, chart_data: schemas.ChartDataCreate
 ) -> models.ChartData:
-    sprocket_productions = [
-        get_sprocket_production(session, sp) for sp in chart_data.sprocket_productions
-    ]
+    sprocket_productions = resolve_ids(
+        session=session,
+        model=models.SPRocketProduction,
+        ids=chart_data.sprocket_productions,
+        label="sprocket production",
+    )
+    # Moved productions leave their previous chart data and change their own
+    # chart_data_id, so both cached representations are stale afterwards.
+    stale_tags = {
+        sprocket_production_tag(sprocket_production.id)
+        for sprocket_production in sprocket_productions
+    } | {
+        chart_data_tag(sprocket_production.chart_data_id)
+        for sprocket_production in sprocket_productions
+        if sprocket_production.chart_data_id is not None
+    }
+    # Moving productions changes chart totals only, sprocket type rollups stay.
+    moved = models.SPRocketProduction.id.in_(
+        [sprocket_production.id for sprocket_production in sprocket_productions]
+    )
+    if sprocket_productions:
+        add_production_rollups(
+            session=session, where=moved, sign=-1, sprocket_types=False
+        )
     session_chart_data = models.ChartData(sprocket_productions=sprocket_productions)
     session.add(session_chart_data)
+    if sprocket_productions:
+        add_production_rollups(session=session, where=moved, sprocket_types=False)
     session.commit()
-    session.refresh(session_chart_data)
-    return session_chart_data
+    cache.invalidate(*stale_tags)
+    return get_chart_data(session=session, chart_data_id=session_chart_data.id)
 
 
 def get_chart_data(session: Session, chart_data_id: int) -> Type[ChartData]:
-    result = session.get(models.ChartData, chart_data_id)
+    stmt = (
+        select(models.ChartData)
+        .where(models.ChartData.id == chart_data_id)
+        .options(*CHART_DATA_RESPONSE_OPTIONS)
+    )
+    result = session.exec(stmt).first()
     if not result:
         raise HTTPException(status_code=404, detail="Chart data not found")
     return result
 
 
+def columnar_responses(model: Type[BaseModel]) -> Dict[Union[int, str], Any]:
+    """Document the columnar alternative of a route's 200 response."""
+    return {
+        200: {"content": {COLUMNAR_MEDIA_TYPE: {"schema": model.model_json_schema()}}}
+    }
+
+
+def chart_data_format(
+    request: Request,
+    chart_data_format: Optional[schemas.ChartDataFormat] = Query(None, alias="format"),
+) -> schemas.ChartDataFormat:
+    """Pick the chart data representation from ``?format=`` or ``Accept``."""
+    if chart_data_format is not None:
+        return chart_data_format
+    if COLUMNAR_MEDIA_TYPE in request.headers.get("accept", ""):
+        return schemas.ChartDataFormat.columnar
+    return schemas.ChartDataFormat.rows
+
+
+def get_chart_data_columns(
+    session: Session, chart_data_id: int
+) -> schemas.ChartDataColumnarResponse:
+    """Read a chart's productions as columns, without one object per point.
+
+    The query selects the three columns only and the rows are transposed
+    with ``zip``; times are converted to timestamps like in the row format.
+    """
+    if session.get(models.ChartData, chart_data_id) is None:
+        raise HTTPException(status_code=404, detail="Chart data not found")
+    production = models.SPRocketProduction
+    stmt = (
+        select(
+            production.time,
+            production.sprocket_production_actual,
+            production.sprocket_production_goal,
+        )
+        .where(production.chart_data_id == chart_data_id)
+        .order_by(production.time, production.id)
+    )
+    times, actuals, goals = list(zip(*session.exec(stmt))) or [(), (), ()]
+    return schemas.ChartDataColumnarResponse(
+        id=chart_data_id,
+        time=[int(time.timestamp()) for time in times],
+        sprocket_production_actual=actuals,
+        sprocket_production_goal=goals,
+    )
+
+
+def get_factory_columns(
+    session: Session, factory_id: int
+) -> Optional[schemas.FactoryColumnarResponse]:
+    factory = session.get(models.Factory, factory_id)
+    if factory is None:
+        return None
+    return schemas.FactoryColumnarResponse(
+        id=factory.id,
+        chart_data=get_chart_data_columns(
+            session=session, chart_data_id=factory.chart_data_id
+        ),
+    )
+
+
 def create_factory(session: Session, factory: schemas.FactoryCreate) -> models.Factory:
     chart_data = get_chart_data(session=session, chart_data_id=factory.chart_data)
     session_factory = models.Factory(chart_data_id=chart_data.id)
     session.add(session_factory)
     session.commit()
-    session.refresh(session_factory)
-    return session_factory
+    return get_factory(session=session, factory_id=session_factory.id)
 
 
 def get_factory(session: Session, factory_id: int) -> Optional[models.Factory]:
-    result = session.get(models.Factory, factory_id)
+    stmt = (
+        select(models.Factory)
+        .where(models.Factory.id == factory_id)
+        .options(*FACTORY_RESPONSE_OPTIONS)
+    )
+    result = session.exec(stmt).first()
     return result
 
 
+def get_factories_by_ids(
+    session: Session, ids: Sequence[int]
+) -> Sequence[models.Factory]:
+    return get_by_ids(
+        session=session, model=models.Factory, ids=ids, options=FACTORY_RESPONSE_OPTIONS
+    )
+
+
+def time_bucket(session: Session, bucket: schemas.AggregationBucket) -> Any:
+    # The unit is inlined rather than bound, so Postgres sees the same
+    # expression in the select list and in GROUP BY.
+    time = models.SPRocketProduction.time
+    if session.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(literal_column(f"'{bucket.value}'"), time)
+    return func.strftime(literal_column(f"'{BUCKET_FORMATS[bucket]}'"), time)
+
+
+def bucket_timestamp(label: Union[datetime, str]) -> int:
+    if isinstance(label, str):
+        label = datetime.fromisoformat(label)
+    return int(label.timestamp())
+
+
+def truncate_time(time: datetime, bucket: schemas.AggregationBucket) -> datetime:
+    return datetime.strptime(time.strftime(BUCKET_FORMATS[bucket]), BUCKET_PARSE_FORMAT)
+
+
+def rollup_covers(
+    bucket: schemas.AggregationBucket, start: Optional[int], end: Optional[int]
+) -> bool:
+    """Whether the rollups hold ``bucket`` and the range starts and ends on one."""
+    if bucket not in ROLLUP_BUCKETS:
+        return False
+    for timestamp in (start, end):
+        if timestamp is None:
+            continue
+        time = datetime.fromtimestamp(timestamp)
+        if truncate_time(time=time, bucket=bucket) != time:
+            return False
+    return True
+
+
+def upsert(session: Session, model: Type[SQLModel]) -> Any:
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def add_production_rollups(
+    session: Session, where: Any, sign: int = 1, sprocket_types: bool = True
+) -> None:
+    """Add the productions matching ``where`` to their hourly and daily rollups.
+
+    With ``sign=-1`` they are subtracted instead. Totals are grouped in SQL
+    and merged with ``INSERT ... ON CONFLICT DO UPDATE`` in key order, so
+    concurrent writers lock the rollup rows they share in the same order.
+    Pass ``sprocket_types=False`` to leave the sprocket type rollups alone.
+    """
+    production = models.SPRocketProduction
+    link = models.SPRocketTypeSPRocketProductionLink
+    owners = [(models.ChartDataRollup, production.chart_data_id)]
+    if sprocket_types:
+        owners.append((models.SPRocketTypeRollup, link.sprocket_type_id))
+    goal = func.nullif(production.sprocket_production_goal, 0)
+    session.flush()
+    for model, owner in owners:
+        for bucket in ROLLUP_BUCKETS:
+            bucket_start = time_bucket(session=session, bucket=bucket).label("bucket")
+            totals = (
+                select(
+                    owner,
+                    literal(bucket.value),
+                    bucket_start,
+                    sign * func.count(),
+                    sign * func.sum(production.sprocket_production_actual),
+                    sign * func.sum(production.sprocket_production_goal),
+                    sign
+                    * func.coalesce(
+                        func.sum(
+                            cast(production.sprocket_production_actual, Float) / goal
+                        ),
+                        0,
+                    ),
+                    sign * func.count(goal),
+                )
+                .where(where, owner.is_not(None))
+                .group_by(owner, bucket_start)
+                .order_by(owner, bucket_start)
+            )
+            if owner is link.sprocket_type_id:
+                totals = totals.join_from(
+                    production, link, link.sprocket_production_id == production.id
+                )
+            stmt = upsert(session=session, model=model)
+            stmt = stmt.from_select(
+                [owner.key, "granularity", "bucket", *ROLLUP_TOTALS], totals
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[owner.key, "granularity", "bucket"],
+                set_={
+                    total: getattr(model, total) + stmt.excluded[total]
+                    for total in ROLLUP_TOTALS
+                },
+            )
+            session.execute(stmt)
+
+
+def rebuild_production_rollups(session: Session) -> None:
+    """Recompute every rollup from the raw productions, e.g. after a backfill."""
+    session.execute(delete(models.ChartDataRollup))
+    session.execute(delete(models.SPRocketTypeRollup))
+    add_production_rollups(session=session, where=true())
+    session.commit()
+    cache.invalidate(PRODUCTION_AGGREGATE_TAG)
+
+
+def aggregate_sprocket_production(
+    session: Session,
+    owner: str,
+    owner_id: int,
+    bucket: schemas.AggregationBucket,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> List[schemas.SPRocketProductionBucket]:
+    """Sum the productions of one chart data or sprocket type per time bucket.
+
+    ``owner`` is ``"chart_data_id"`` or ``"sprocket_type_id"`` and the range
+    is ``[start, end)``. Hour and day buckets over a range aligned on them
+    are read from the rollup tables, anything else is grouped in SQL from
+    the productions over the covering ``(chart_data_id, time)`` index.
+    """
+    if rollup_covers(bucket=bucket, start=start, end=end):
+        rollup = ROLLUP_MODELS[owner]
+        stmt = (
+            select(
+                rollup.bucket,
+                rollup.count,
+                rollup.sprocket_production_actual,
+                rollup.sprocket_production_goal,
+                rollup.attainment_sum / func.nullif(rollup.attainment_count, 0),
+            )
+            .where(
+                getattr(rollup, owner) == owner_id,
+                rollup.granularity == bucket.value,
+                rollup.count > 0,
+            )
+            .order_by(rollup.bucket)
+        )
+        time = rollup.bucket
+    else:
+        production = models.SPRocketProduction
+        link = models.SPRocketTypeSPRocketProductionLink
+        bucket_start = time_bucket(session=session, bucket=bucket).label("bucket")
+        stmt = (
+            select(
+                bucket_start,
+                func.count(),
+                func.sum(production.sprocket_production_actual),
+                func.sum(production.sprocket_production_goal),
+                func.avg(
+                    cast(production.sprocket_production_actual, Float)
+                    / func.nullif(production.sprocket_production_goal, 0)
+                ),
+            )
+            .group_by(bucket_start)
+            .order_by(bucket_start)
+        )
+        if owner == "sprocket_type_id":
+            stmt = stmt.join_from(
+                production, link, link.sprocket_production_id == production.id
+            ).where(link.sprocket_type_id == owner_id)
+        else:
+            stmt = stmt.where(production.chart_data_id == owner_id)
+        time = production.time
+    if start is not None:
+        stmt = stmt.where(time >= datetime.fromtimestamp(start))
+    if end is not None:
+        stmt = stmt.where(time < datetime.fromtimestamp(end))
+    return [
+        schemas.SPRocketProductionBucket(
+            time=bucket_timestamp(label),
+            count=count,
+            sprocket_production_actual=actual,
+            sprocket_production_goal=goal,
+            attainment=attainment,
+        )
+        for label, count, actual, goal, attainment in session.exec(stmt)
+    ]
+
+
+def aggregate_chart_data(
+    session: Session,
+    chart_data_id: int,
+    bucket: schemas.AggregationBucket,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> schemas.SPRocketProductionAggregateResponse:
+    if session.get(models.ChartData, chart_data_id) is None:
+        raise HTTPException(status_code=404, detail="Chart data not found")
+    buckets = aggregate_sprocket_production(
+        session=session,
+        owner="chart_data_id",
+        owner_id=chart_data_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+    return schemas.SPRocketProductionAggregateResponse(
+        chart_data_id=chart_data_id, bucket=bucket, buckets=buckets
+    )
+
+
+def aggregate_factory(
+    session: Session,
+    factory_id: int,
+    bucket: schemas.AggregationBucket,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> schemas.SPRocketProductionAggregateResponse:
+    factory = session.get(models.Factory, factory_id)
+    if factory is None or factory.chart_data_id is None:
+        raise HTTPException(status_code=404, detail="Factory not found")
+    buckets = aggregate_sprocket_production(
+        session=session,
+        owner="chart_data_id",
+        owner_id=factory.chart_data_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+    return schemas.SPRocketProductionAggregateResponse(
+        chart_data_id=factory.chart_data_id, bucket=bucket, buckets=buckets
+    )
+
+
+def aggregate_sprocket_type(
+    session: Session,
+    sprocket_type_id: int,
+    bucket: schemas.AggregationBucket,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> schemas.SPRocketTypeAggregateResponse:
+    if session.get(models.SPRocketType, sprocket_type_id) is None:
+        raise HTTPException(status_code=404, detail="Sprocket type not found")
+    buckets = aggregate_sprocket_production(
+        session=session,
+        owner="sprocket_type_id",
+        owner_id=sprocket_type_id,
+        bucket=bucket,
+        start=start,
+        end=end,
+    )
+    return schemas.SPRocketTypeAggregateResponse(
+        sprocket_type_id=sprocket_type_id, bucket=bucket, buckets=buckets
+    )
+
+
+def stream_factories_statement(
+    factory_ids: Optional[List[int]] = None,
+) -> SelectOfScalar[models.Factory]:
+    stmt = (
+        select(models.Factory)
+        .order_by(models.Factory.id)
+        .execution_options(yield_per=STREAM_FACTORIES_YIELD_PER)
+    )
+    if factory_ids:
+        stmt = stmt.where(models.Factory.id.in_(factory_ids))
+    return stmt
+
+
+def stream_productions_statement(
+    chart_data_id: int,
+) -> SelectOfScalar[models.SPRocketProduction]:
+    return (
+        select(models.SPRocketProduction)
+        .where(models.SPRocketProduction.chart_data_id == chart_data_id)
+        .options(*SPROCKET_PRODUCTION_RESPONSE_OPTIONS)
+        .order_by(models.SPRocketProduction.id)
+        .execution_options(yield_per=STREAM_PRODUCTIONS_YIELD_PER)
+    )
+
+
+def render_factory_head(factory: models.Factory) -> bytes:
+    if factory.chart_data_id is None:
+        return f'{{"id":{factory.id},"chart_data":null'.encode()
+    return (
+        f'{{"id":{factory.id},"chart_data":'
+        f'{{"id":{factory.chart_data_id},"sprocket_productions":['
+    ).encode()
+
+
+def render_factory_tail(factory: models.Factory) -> bytes:
+    return b"}" if factory.chart_data_id is None else b"]}}"
+
+
+def render_productions(productions: Sequence[models.SPRocketProduction]) -> bytes:
+    serialize = serializers.json_serializer(schemas.SPRocketProductionResponse)
+    return b",".join(map(serialize, productions))
+
+
+def stream_factories(
+    session: Session, factory_ids: Optional[List[int]] = None, ndjson: bool = False
+) -> Iterator[bytes]:
+    """Yield every factory as ``FactoryResponse`` JSON, a chunk at a time.
+
+    Factories and their productions are read through server-side cursors in
+    ``yield_per`` partitions, so memory stays flat whatever the data size.
+    Factories are emitted as a JSON array, or one per line with ``ndjson``.
+    """
+    if not ndjson:
+        yield b"["
+    factories = session.exec(stream_factories_statement(factory_ids=factory_ids))
+    for index, factory in enumerate(factories):
+        if index and not ndjson:
+            yield b","
+        yield render_factory_head(factory)
+        if factory.chart_data_id is not None:
+            productions = session.exec(
+                stream_productions_statement(chart_data_id=factory.chart_data_id)
+            )
+            for partition_index, partition in enumerate(productions.partitions()):
+                separator = b"," if partition_index else b""
+                yield separator + render_productions(partition)
+        yield render_factory_tail(factory)
+        if ndjson:
+            yield b"\n"
+    if not ndjson:
+        yield b"]"
+
+
 def get_sprocket_type(
     session: Session, sprocket_type_id: int
 ) -> Optional[models.SPRocketType]:
@@ -98,18 +883,24 @@ def get_sprocket_type(
     return result
 
 
+def get_sprocket_types_by_ids(
+    session: Session, ids: Sequence[int]
+) -> Sequence[models.SPRocketType]:
+    return get_by_ids(session=session, model=models.SPRocketType, ids=ids)
+
+
 def get_sprocket_types(
-    session: Session, page: int = 1, limit: int = 10
-) -> ScalarResult[models.SPRocketType]:
-    offset = (page - 1) * limit
-    stmt = (
-        select(models.SPRocketType)
-        .order_by(models.SPRocketType.created_at)
-        .limit(limit)
-        .offset(offset)
+    session: Session, page: int = 1, limit: int = 10, cursor: Optional[str] = None
+) -> Sequence[models.SPRocketType]:
+    stmt = paginate(
+        stmt=select(models.SPRocketType),
+        model=models.SPRocketType,
+        page=page,
+        limit=limit,
+        cursor=cursor,
     )
     result = session.exec(stmt)
-    return result
+    return result.all()
 
 
 def update_sprocket_type(
@@ -123,5 +914,6 @@ def update_sprocket_type(
         setattr(result, key, value)
     session.add(result)
     session.commit()
+    cache.invalidate(sprocket_type_tag(sprocket_type_id))
     session.refresh(result)
     return result
@@ -0,0 +1,220 @@
+import json
+import re
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+CHUNK_SIZE = 64 * 1024
+
+CHART_DATA_KEYS = ("sprocket_production_actual", "sprocket_production_goal", "time")
+
+Token = Tuple[str, Any, int]
+
+TOKEN_PATTERN = re.compile(
+    rb"\s*(?:"
+    rb"(?P<punct>[{}\[\]:,])"
+    rb'|"(?P<string>(?:[^"\\]|\\.)*)"'
+    rb"|(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)"
+    rb"|(?P<literal>true|false|null)"
+    rb")"
+)
+WHITESPACE_PATTERN = re.compile(rb"\s*")
+LITERALS = {b"true": True, b"false": False, b"null": None}
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+def iter_tokens(file: BinaryIO, offset: int = 0) -> Iterator[Token]:
+    """Yield ``(kind, value, offset)`` JSON tokens reading ``file`` in fixed chunks.
+
+    Only the current chunk is kept in memory, so arbitrarily large documents
+    can be walked with a flat memory profile.
+    """
+    file.seek(offset)
+    buffer = b""
+    position = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - position < CHUNK_SIZE:
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            offset += position
+            buffer = buffer[position:] + chunk
+            position = 0
+        match = TOKEN_PATTERN.match(buffer, position)
+        # A token that touches the end of the buffer may continue in the next chunk.
+        if match is None or (match.end() == len(buffer) and not eof):
+            if eof:
+                if WHITESPACE_PATTERN.fullmatch(buffer, position):
+                    return
+                raise JSONStreamError(f"Invalid JSON at byte {offset + position}")
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        kind = match.lastgroup
+        raw = match.group(kind)
+        start = offset + match.start(kind)
+        position = match.end()
+        if kind == "punct":
+            yield kind, raw.decode(), start
+        elif kind == "string":
+            yield kind, decode_string(raw), start
+        elif kind == "number":
+            yield kind, decode_number(raw), start
+        else:
+            yield kind, LITERALS[raw], start
+
+
+def decode_string(raw: bytes) -> str:
+    if b"\\" not in raw:
+        return raw.decode()
+    return json.loads(b'"' + raw + b'"')
+
+
+def decode_number(raw: bytes) -> Union[int, float]:
+    if raw.isdigit() or (raw[:1] == b"-" and raw[1:].isdigit()):
+        return int(raw)
+    return float(raw)
+
+
+def build_value(first: Token, tokens: Iterator[Token]) -> Any:
+    kind, value, _ = first
+    if kind != "punct":
+        return value
+    if value == "[":
+        items: List[Any] = []
+        for token in tokens:
+            if token[1] == "]" and token[0] == "punct":
+                return items
+            if token[1] == "," and token[0] == "punct":
+                continue
+            items.append(build_value(token, tokens))
+    elif value == "{":
+        obj: Dict[str, Any] = {}
+        for token in tokens:
+            if token[1] == "}" and token[0] == "punct":
+                return obj
+            if token[1] == "," and token[0] == "punct":
+                continue
+            next(tokens)  # ':'
+            obj[token[1]] = build_value(next(tokens), tokens)
+    raise JSONStreamError(f"Unexpected token {value!r}")
+
+
+def skip_value(first: Token, tokens: Iterator[Token]) -> None:
+    kind, value, _ = first
+    if kind != "punct":
+        return
+    depth = 1
+    for token_kind, token_value, _ in tokens:
+        if token_kind != "punct":
+            continue
+        if token_value in "[{":
+            depth += 1
+        elif token_value in "]}":
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def iter_object_items(tokens: Iterator[Token]) -> Iterator[Tuple[str, Token]]:
+    """Iterate ``(key, first value token)`` pairs of the object just opened.
+
+    The caller must consume (build or skip) every value before advancing.
+    """
+    for kind, value, _ in tokens:
+        if kind == "punct" and value == "}":
+            return
+        if kind == "punct" and value == ",":
+            continue
+        next(tokens)  # ':'
+        yield value, next(tokens)
+
+
+def iter_array_items(tokens: Iterator[Token]) -> Iterator[Token]:
+    """Iterate the first token of each item of the array just opened."""
+    for token in tokens:
+        if token[0] == "punct" and token[1] == "]":
+            return
+        if token[0] == "punct" and token[1] == ",":
+            continue
+        yield token
+
+
+def find_key(tokens: Iterator[Token], key: str) -> Optional[Token]:
+    for item_key, first in iter_object_items(tokens):
+        if item_key == key:
+            return first
+        skip_value(first, tokens)
+    return None
+
+
+def iter_numbers(file: BinaryIO, offset: int) -> Iterator[Union[int, float]]:
+    tokens = iter_tokens(file, offset)
+    next(tokens)  # '['
+    for kind, value, position in iter_array_items(tokens):
+        if kind != "number":
+            raise JSONStreamError(f"Expected a number at byte {position}")
+        yield value
+
+
+def iter_sprockets(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as file:
+        tokens = iter_tokens(file)
+        next(tokens)  # '{'
+        first = find_key(tokens, "sprockets")
+        if first is None:
+            return
+        for item in iter_array_items(tokens):
+            yield build_value(item, tokens)
+
+
+def iter_chart_data_offsets(path: str) -> Iterator[Dict[str, int]]:
+    """Yield, per factory, the byte offset of each chart data array.
+
+    The arrays themselves are skipped, never materialised.
+    """
+    with open(path, "rb") as file:
+        tokens = iter_tokens(file)
+        next(tokens)  # '{'
+        if find_key(tokens, "factories") is None:
+            return
+        for _ in iter_array_items(tokens):
+            offsets: Dict[str, int] = {}
+            for key, first in iter_object_items(tokens):
+                if key != "factory":
+                    skip_value(first, tokens)
+                    continue
+                for factory_key, factory_first in iter_object_items(tokens):
+                    if factory_key != "chart_data":
+                        skip_value(factory_first, tokens)
+                        continue
+                    for chart_key, chart_first in iter_object_items(tokens):
+                        if chart_key in CHART_DATA_KEYS:
+                            offsets[chart_key] = chart_first[2]
+                        skip_value(chart_first, tokens)
+            yield offsets
+
+
+def iter_chart_data_points(
+    path: str, offsets: Dict[str, int]
+) -> Iterator[Tuple[int, int, int]]:
+    """Zip the parallel chart data arrays of one factory lazily.
+
+    Each array is read through its own file handle positioned at the array,
+    so only one chunk per array is held in memory.
+    """
+    missing = [key for key in CHART_DATA_KEYS if key not in offsets]
+    if missing:
+        raise JSONStreamError(f"Chart data is missing {', '.join(missing)}")
+    with (
+        open(path, "rb") as actual_file,
+        open(path, "rb") as goal_file,
+        open(path, "rb") as time_file,
+    ):
+        yield from zip(
+            iter_numbers(actual_file, offsets["sprocket_production_actual"]),
+            iter_numbers(goal_file, offsets["sprocket_production_goal"]),
+            iter_numbers(time_file, offsets["time"]),
+        )
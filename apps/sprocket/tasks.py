@@ -1,77 +1,415 @@
-import json
+import csv
+import io
 import logging
+import time
 from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
 
-from sqlmodel import Session, select
+from celery import Task, chord, shared_task
+from celery.result import AsyncResult, GroupResult
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, select
 
-from apps.sprocket import models
+from apps.celery import app as celery_app
+from apps.database import database
+from apps.sprocket import models, services, streaming
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_SHARD_SIZE = 1
+PROGRESS = "PROGRESS"
+# The InitialDataLoad row every load claims first, so only one runs at a time.
+INITIAL_DATA_LOAD_ID = 1
+
+
+class InitialDataLoadError(RuntimeError):
+    pass
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    if size < 1:
+        raise ValueError(f"Batch size must be at least 1, got {size}")
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def insert_rows(
+    session: Session, model: Type[SQLModel], rows: Sequence[Dict[str, Any]]
+) -> None:
+    if not rows:
+        return
+    connection = session.connection()
+    if connection.dialect.driver == "psycopg2":
+        copy_rows(session=session, table_name=model.__tablename__, rows=rows)
+    else:
+        session.execute(insert(model), rows)
+
+
+def copy_rows(
+    session: Session, table_name: str, rows: Sequence[Dict[str, Any]]
+) -> None:
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([row[column] for column in columns] for row in rows)
+    buffer.seek(0)
+    dbapi_connection = session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+
+def load_sprocket_types(
+    session: Session, sprockets: Iterable[Dict[str, Any]], now: datetime
+) -> List[int]:
+    rows = [
+        {
+            "teeth": sprocket["teeth"],
+            "pitch_diameter": sprocket["pitch_diameter"],
+            "outside_diameter": sprocket["outside_diameter"],
+            "pitch": sprocket["pitch"],
+            "created_at": now,
+            "updated_at": now,
+        }
+        for sprocket in sprockets
+    ]
+    return services.insert_returning_ids(
+        session=session, model=models.SPRocketType, rows=rows
+    )
+
+
+def load_chart_data(
+    session: Session,
+    points: Iterable[Tuple[int, int, int]],
+    sprocket_type_ids: Sequence[int],
+    batch_size: int,
+    now: datetime,
+) -> Tuple[int, int]:
+    """Insert one chart data, its factory and productions.
+
+    Returns the chart data id and the number of inserted rows. Rollups are
+    left to the caller, which adds every chart of its transaction at once.
+    """
+    chart_data_id = services.insert_returning_ids(
+        session=session,
+        model=models.ChartData,
+        rows=[{"created_at": now, "updated_at": now}],
+    )[0]
+    services.insert_returning_ids(
+        session=session,
+        model=models.Factory,
+        rows=[{"chart_data_id": chart_data_id, "created_at": now, "updated_at": now}],
+    )
+    inserted_rows = 2
+    for batch in batched(points, batch_size):
+        production_ids = services.insert_returning_ids(
+            session=session,
+            model=models.SPRocketProduction,
+            rows=[
+                {
+                    "sprocket_production_actual": actual,
+                    "sprocket_production_goal": goal,
+                    "time": datetime.fromtimestamp(timestamp),
+                    "chart_data_id": chart_data_id,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for actual, goal, timestamp in batch
+            ],
+        )
+        link_rows = [
+            {
+                "sprocket_type_id": sprocket_type_id,
+                "sprocket_production_id": production_id,
+            }
+            for production_id in production_ids
+            for sprocket_type_id in sprocket_type_ids
+        ]
+        for link_batch in batched(link_rows, batch_size):
+            insert_rows(
+                session=session,
+                model=models.SPRocketTypeSPRocketProductionLink,
+                rows=link_batch,
+            )
+        inserted_rows += len(production_ids) + len(link_rows)
+    return chart_data_id, inserted_rows
+
+
+def add_chart_data_rollups(session: Session, chart_data_ids: Sequence[int]) -> None:
+    # One statement per rollup table and granularity for the whole
+    # transaction, so parallel shards take the shared sprocket type rollup
+    # rows in the same order and cannot deadlock on them.
+    services.add_production_rollups(
+        session=session,
+        where=models.SPRocketProduction.chart_data_id.in_(chart_data_ids),
+    )
+
+
+def initial_data_loaded(session: Session) -> bool:
+    stmt = select(models.InitialDataLoad).where(models.InitialDataLoad.loaded == True)
+    results = session.exec(stmt)
+    return results.first() is not None
+
+
+def claim_initial_data_load(session: Session, loaded: bool, now: datetime) -> None:
+    """Insert the load marker, failing if another load already holds it.
+
+    The marker has a fixed id, so a concurrent load fails on its insert. A
+    marker left unloaded means a parallel load is running or stopped partway.
+    """
+    marker = session.get(models.InitialDataLoad, INITIAL_DATA_LOAD_ID)
+    if marker is not None and not marker.loaded:
+        raise InitialDataLoadError(
+            "A parallel initial data load is running or stopped partway, "
+            "resume it instead of starting another"
+        )
+    session.add(
+        models.InitialDataLoad(
+            id=INITIAL_DATA_LOAD_ID, loaded=loaded, created_at=now, updated_at=now
+        )
+    )
+    try:
+        session.flush()
+    except IntegrityError as e:
+        session.rollback()
+        raise InitialDataLoadError("Another initial data load started first") from e
+
 
 def load_data_from_json(
-    factory_file_path: str, sprocket_file_path: str, session: Session
+    factory_file_path: str,
+    sprocket_file_path: str,
+    session: Session,
+    batch_size: int = DEFAULT_BATCH_SIZE,
 ) -> str:
     try:
-        with (
-            open(factory_file_path, "r") as factory_file,
-            open(sprocket_file_path, "r") as sprocket_file,
-        ):
-            factory_data = json.load(factory_file)
-            sprocket_data = json.load(sprocket_file)
+        if not initial_data_loaded(session=session):
+            started_at = time.perf_counter()
+            now = datetime.now()
+            claim_initial_data_load(session=session, loaded=True, now=now)
+            sprocket_type_ids = load_sprocket_types(
+                session=session,
+                sprockets=streaming.iter_sprockets(sprocket_file_path),
+                now=now,
+            )
+            inserted_rows = len(sprocket_type_ids)
 
-        stmt = select(models.InitialDataLoad).where(
-            models.InitialDataLoad.loaded == True
-        )
-        results = session.exec(stmt)
-        initial_data_load = results.first()
-        if initial_data_load is None:
-            sprocket_types = []
-            for sprocket in sprocket_data["sprockets"]:
-                sprocket_obj = models.SPRocketType(
-                    teeth=sprocket["teeth"],
-                    pitch_diameter=sprocket["pitch_diameter"],
-                    outside_diameter=sprocket["outside_diameter"],
-                    pitch=sprocket["pitch"],
-                )
-                session.add(sprocket_obj)
-                session.flush()
-                sprocket_types.append(sprocket_obj)
-
-            for factory in factory_data["factories"]:
-                chart_data_info = factory["factory"]["chart_data"]
-
-                sprocket_productions = []
-                chart_data = models.ChartData(sprocket_productions=sprocket_productions)
-                session.add(chart_data)
-                session.flush()
-                for actual, goal, timestamp in zip(
-                    chart_data_info["sprocket_production_actual"],
-                    chart_data_info["sprocket_production_goal"],
-                    chart_data_info["time"],
-                ):
-                    sprocket_production = models.SPRocketProduction(
-                        sprocket_production_actual=actual,
-                        sprocket_production_goal=goal,
-                        time=datetime.fromtimestamp(timestamp),
-                        sprocket_types=sprocket_types,
-                        chart_data_id=chart_data.id,
-                    )
-                    session.add(sprocket_production)
-                    session.flush()
-                    sprocket_productions.append(sprocket_production)
-
-                factory_obj = models.Factory(
-                    chart_data_id=chart_data.id, chart_data=chart_data
+            chart_data_ids = []
+            for offsets in streaming.iter_chart_data_offsets(factory_file_path):
+                chart_data_id, chart_rows = load_chart_data(
+                    session=session,
+                    points=streaming.iter_chart_data_points(factory_file_path, offsets),
+                    sprocket_type_ids=sprocket_type_ids,
+                    batch_size=batch_size,
+                    now=now,
                 )
-                session.add(factory_obj)
-
-            session.add(models.InitialDataLoad(loaded=True))
+                chart_data_ids.append(chart_data_id)
+                inserted_rows += chart_rows
+            add_chart_data_rollups(session=session, chart_data_ids=chart_data_ids)
             session.commit()
-            return "Initial data load completed successfully."
+            elapsed = time.perf_counter() - started_at
+            rows_per_second = (
+                inserted_rows / elapsed if elapsed else float(inserted_rows)
+            )
+            logger.info(
+                f"Inserted {inserted_rows} rows in {elapsed:.2f}s "
+                f"({rows_per_second:.0f} rows/s, batch size {batch_size})"
+            )
+            return (
+                f"Initial data load completed successfully. Inserted {inserted_rows} "
+                f"rows in {elapsed:.2f}s ({rows_per_second:.0f} rows/s)."
+            )
         else:
             return "Initial data already loaded. Skipping data load."
 
     except Exception as e:
         logger.error(f"Error during data loading: {e}")
         raise
+
+
+def shard_factories(
+    factory_file_path: str, shard_size: int
+) -> List[List[Dict[str, int]]]:
+    return list(
+        batched(streaming.iter_chart_data_offsets(factory_file_path), shard_size)
+    )
+
+
+@shared_task(bind=True)
+def load_factory_shard(
+    self: Task,
+    factory_file_path: str,
+    first_position: int,
+    shard: List[Dict[str, int]],
+    sprocket_type_ids: List[int],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """Load the factories of one shard in one transaction.
+
+    Each factory is recorded by its position in the seed file together with
+    its rows, so a retried or resumed shard skips the factories already
+    committed, whatever the shard size.
+    """
+    now = datetime.now()
+    inserted_rows = 0
+    chart_data_ids = []
+    positions = range(first_position, first_position + len(shard))
+    with Session(database.engine) as session:
+        loaded = set(
+            session.exec(
+                select(models.InitialDataLoadFactory.position).where(
+                    models.InitialDataLoadFactory.position.in_(positions)
+                )
+            )
+        )
+        for loaded_factories, (position, offsets) in enumerate(
+            zip(positions, shard), start=1
+        ):
+            if position in loaded:
+                continue
+            chart_data_id, chart_rows = load_chart_data(
+                session=session,
+                points=streaming.iter_chart_data_points(factory_file_path, offsets),
+                sprocket_type_ids=sprocket_type_ids,
+                batch_size=batch_size,
+                now=now,
+            )
+            session.add(
+                models.InitialDataLoadFactory(
+                    position=position, chart_data_id=chart_data_id
+                )
+            )
+            chart_data_ids.append(chart_data_id)
+            inserted_rows += chart_rows
+            if not self.request.called_directly:
+                self.update_state(
+                    state=PROGRESS,
+                    meta={
+                        "factories": loaded_factories,
+                        "total": len(shard),
+                        "rows": inserted_rows,
+                    },
+                )
+        add_chart_data_rollups(session=session, chart_data_ids=chart_data_ids)
+        session.commit()
+    return inserted_rows
+
+
+@shared_task
+def mark_initial_data_loaded(shard_rows: List[int]) -> int:
+    with Session(database.engine) as session:
+        marker = session.get(models.InitialDataLoad, INITIAL_DATA_LOAD_ID)
+        if marker is None:
+            marker = models.InitialDataLoad(id=INITIAL_DATA_LOAD_ID)
+        marker.loaded = True
+        session.add(marker)
+        session.execute(delete(models.InitialDataLoadFactory))
+        session.execute(delete(models.InitialDataLoadSPRocketType))
+        session.commit()
+    inserted_rows = sum(shard_rows)
+    logger.info(f"Inserted {inserted_rows} rows across {len(shard_rows)} shards")
+    return inserted_rows
+
+
+@shared_task
+def rebuild_production_rollups() -> None:
+    started_at = time.perf_counter()
+    with Session(database.engine) as session:
+        services.rebuild_production_rollups(session=session)
+    logger.info(
+        f"Rebuilt production rollups in {time.perf_counter() - started_at:.2f}s"
+    )
+
+
+def load_data_in_parallel(
+    factory_file_path: str,
+    sprocket_file_path: str,
+    session: Session,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    resume: bool = False,
+) -> Optional[AsyncResult]:
+    """Fan the factories of the seed file out to Celery workers.
+
+    The load marker and the sprocket types are committed up front, then
+    every shard of ``shard_size`` factories is loaded by its own task in its
+    own transaction. The chord callback flips ``InitialDataLoad`` once all
+    shards succeeded. The seed file must be readable by the workers at the
+    same path.
+
+    A load that stopped partway, e.g. on a failed shard, keeps its marker
+    unloaded and refuses a new load; ``resume`` dispatches it again with the
+    sprocket type ids recorded by the first run, and the shards skip the
+    factories already committed.
+    """
+    # Checked before the marker is claimed, the workers would only fail later.
+    for name, size in (("Shard", shard_size), ("Batch", batch_size)):
+        if size < 1:
+            raise ValueError(f"{name} size must be at least 1, got {size}")
+    if initial_data_loaded(session=session):
+        return None
+    marker = session.get(models.InitialDataLoad, INITIAL_DATA_LOAD_ID)
+    if resume and marker is not None:
+        sprocket_type_ids = list(
+            session.exec(
+                select(models.InitialDataLoadSPRocketType.sprocket_type_id).order_by(
+                    models.InitialDataLoadSPRocketType.position
+                )
+            )
+        )
+    else:
+        now = datetime.now()
+        claim_initial_data_load(session=session, loaded=False, now=now)
+        sprocket_type_ids = load_sprocket_types(
+            session=session,
+            sprockets=streaming.iter_sprockets(sprocket_file_path),
+            now=now,
+        )
+        session.add_all(
+            models.InitialDataLoadSPRocketType(
+                position=position, sprocket_type_id=sprocket_type_id
+            )
+            for position, sprocket_type_id in enumerate(sprocket_type_ids)
+        )
+        session.commit()
+    shards = shard_factories(factory_file_path, shard_size)
+    header = [
+        load_factory_shard.s(
+            factory_file_path, index * shard_size, shard, sprocket_type_ids, batch_size
+        )
+        for index, shard in enumerate(shards)
+    ]
+    result = chord(header)(mark_initial_data_loaded.s())
+    if result.parent is not None:
+        result.parent.save()
+    return result
+
+
+def get_load_progress(group_id: str) -> Dict[str, Any]:
+    group_result = GroupResult.restore(group_id, app=celery_app)
+    if group_result is None:
+        raise ValueError(f"Unknown load {group_id}")
+    shards = []
+    for shard_result in group_result.results:
+        info = shard_result.info
+        if shard_result.state == PROGRESS:
+            rows = info["rows"]
+        elif shard_result.successful():
+            rows = shard_result.result
+        else:
+            rows = 0
+        shards.append(
+            {"id": shard_result.id, "state": shard_result.state, "rows": rows}
+        )
+    return {
+        "shards": len(shards),
+        "completed": group_result.completed_count(),
+        "failed": any(shard["state"] == "FAILURE" for shard in shards),
+        "rows": sum(shard["rows"] for shard in shards),
+        "detail": shards,
+    }
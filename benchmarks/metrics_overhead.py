@@ -0,0 +1,102 @@
+"""Per-request cost of the metrics middleware and per-query cost of its listeners.
+
+The middleware wraps a bare ASGI app that answers at once, so the difference
+with the bare app is the instrumentation itself; the query listeners are
+timed the same way on ``SELECT 1`` against in-memory sqlite, in a request::
+
+    python -m benchmarks.metrics_overhead --requests 200000 --queries 50000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, Dict
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlmodel import create_engine
+
+from apps.metrics import metrics, timing
+
+ROUTE = APIRoute(path="/api/v1/factories/{factory_id}", endpoint=lambda: None)
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+ROUND_QUERIES = 2000
+
+
+async def bare_app(scope: Dict[str, Any], receive: Any, send: Any) -> None:
+    scope["route"] = ROUTE
+    await send(START)
+    await send(BODY)
+
+
+async def receive() -> Dict[str, Any]:
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message: Dict[str, Any]) -> None:
+    pass
+
+
+async def time_requests(app: Callable[..., Any], requests: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET"}, receive, send)
+    return time.perf_counter() - started_at
+
+
+def time_queries(engine: Engine, queries: int) -> float:
+    statement = text("SELECT 1")
+    with engine.connect() as connection:
+        started_at = time.perf_counter()
+        for _ in range(queries):
+            connection.execute(statement)
+        return time.perf_counter() - started_at
+
+
+def listen_to_queries(listen: bool) -> None:
+    for listener in metrics.QUERY_LISTENERS:
+        if event.contains(Engine, listener.__name__, listener):
+            event.remove(Engine, listener.__name__, listener)
+    if listen:
+        metrics.instrument_queries()
+
+
+def report(label: str, count: int, bare: float, instrumented: float) -> None:
+    overhead = (instrumented - bare) / count * 1e6
+    print(
+        f"{label:>10}: bare {bare / count * 1e6:.2f}us, "
+        f"instrumented {instrumented / count * 1e6:.2f}us, "
+        f"overhead {overhead:.2f}us"
+    )
+
+
+def run(requests: int, queries: int) -> None:
+    bare = asyncio.run(time_requests(bare_app, requests))
+    instrumented = asyncio.run(
+        time_requests(metrics.MetricsMiddleware(bare_app), requests)
+    )
+    report("request", requests, bare, instrumented)
+
+    # Query timings are noisy next to the listeners' cost, so bare and
+    # instrumented rounds alternate and the fastest of each is kept.
+    engine = create_engine("sqlite://")
+    timing.current.set(timing.RequestTimings())
+    rounds = max(queries // ROUND_QUERIES, 1)
+    bare = instrumented = float("inf")
+    for _ in range(rounds):
+        listen_to_queries(False)
+        bare = min(bare, time_queries(engine, ROUND_QUERIES))
+        listen_to_queries(True)
+        instrumented = min(instrumented, time_queries(engine, ROUND_QUERIES))
+    report("query", ROUND_QUERIES, bare, instrumented)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+    run(requests=args.requests, queries=args.queries)
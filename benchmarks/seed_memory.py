@@ -0,0 +1,97 @@
+"""Peak memory of the seed loader on scaled copies of the factory seed file.
+
+Run from the project root::
+
+    python -m benchmarks.seed_memory --scales 10 100 1000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from apps.sprocket import tasks
+
+FACTORY_SEED = "data/seed_factory_data.json"
+SPROCKET_SEED = "data/seed_sprocket_types.json"
+
+
+def write_scaled_seed(path: str, scale: int) -> None:
+    with open(FACTORY_SEED, "r") as factory_file:
+        factories = json.load(factory_file)["factories"]
+    scaled: Dict[str, List[Any]] = {"factories": []}
+    for factory in factories:
+        chart_data = factory["factory"]["chart_data"]
+        scaled["factories"].append(
+            {
+                "factory": {
+                    "chart_data": {
+                        key: values * scale for key, values in chart_data.items()
+                    }
+                }
+            }
+        )
+    with open(path, "w") as scaled_file:
+        json.dump(scaled, scaled_file, indent=2)
+
+
+def measure_json_load(path: str) -> int:
+    tracemalloc.start()
+    with open(path, "r") as factory_file:
+        json.load(factory_file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def measure_streaming_load(path: str, workdir: str, batch_size: int) -> Dict[str, Any]:
+    database_path = os.path.join(workdir, "benchmark.sqlite")
+    if os.path.exists(database_path):
+        os.remove(database_path)
+    engine = create_engine(f"sqlite:///{database_path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        log = tasks.load_data_from_json(
+            factory_file_path=path,
+            sprocket_file_path=SPROCKET_SEED,
+            session=session,
+            batch_size=batch_size,
+        )
+        elapsed = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    engine.dispose()
+    return {"peak": peak, "elapsed": elapsed, "log": log}
+
+
+def run(scales: List[int], batch_size: int) -> None:
+    print(
+        f"{'scale':>6} {'file MiB':>9} {'json.load MiB':>14} "
+        f"{'streaming MiB':>14} {'seconds':>8}"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            path = os.path.join(workdir, f"seed_factory_data_x{scale}.json")
+            write_scaled_seed(path, scale)
+            size = os.path.getsize(path)
+            json_peak = measure_json_load(path)
+            result = measure_streaming_load(path, workdir, batch_size)
+            print(
+                f"{scale:>6} {size / 2**20:>9.2f} {json_peak / 2**20:>14.2f} "
+                f"{result['peak'] / 2**20:>14.2f} {result['elapsed']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--batch-size", type=int, default=tasks.DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    run(scales=args.scales, batch_size=args.batch_size)
@@ -0,0 +1,100 @@
+"""Cost of serializing loaded factories through Pydantic and through orjson.
+
+Every path starts from the same ORM rows, so only the serialization is timed:
+``jsonable_encoder`` is what FastAPI does for a plain ``response_model``,
+``model_dump_json`` is what the response cache did, and ``orjson`` is the
+``apps.sprocket.serializers`` path the sync routes use now::
+
+    python -m benchmarks.serialization --factories 20 --productions 500
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import Session, SQLModel, create_engine
+
+from apps.sprocket import models, schemas, serializers, services
+
+
+def seed(session: Session, factories: int, productions: int) -> List[int]:
+    sprocket_types = [
+        models.SPRocketType(
+            teeth=i, pitch_diameter=5.0, outside_diameter=6.0, pitch=1.0
+        )
+        for i in range(3)
+    ]
+    started_at = datetime(2024, 1, 1)
+    factory_rows = []
+    for _ in range(factories):
+        chart_data = models.ChartData()
+        chart_data.sprocket_productions = [
+            models.SPRocketProduction(
+                sprocket_production_actual=i % 40,
+                sprocket_production_goal=30,
+                time=started_at + timedelta(minutes=i),
+                sprocket_types=sprocket_types,
+            )
+            for i in range(productions)
+        ]
+        factory_rows.append(models.Factory(chart_data=chart_data))
+    session.add_all(factory_rows)
+    session.commit()
+    return [factory.id for factory in factory_rows]
+
+
+def measure(label: str, render: Callable[[Any], bytes], rows: List[Any]) -> None:
+    started_at = time.perf_counter()
+    size = sum(len(render(row)) for row in rows)
+    elapsed = time.perf_counter() - started_at
+    print(f"{label:>18}: {len(rows)} factories, {size:,} bytes in {elapsed:.3f}s")
+
+
+def run(url: str, factories: int, productions: int, rounds: int) -> None:
+    engine = create_engine(url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        ids = seed(session, factories=factories, productions=productions)
+        rows = list(services.get_factories_by_ids(session=session, ids=ids))
+        validate = schemas.FactoryResponse.model_validate
+        for _ in range(rounds):
+            measure(
+                "jsonable_encoder",
+                lambda row: json.dumps(jsonable_encoder(validate(row))).encode(),
+                rows,
+            )
+            measure(
+                "model_dump_json",
+                lambda row: validate(row).model_dump_json().encode(),
+                rows,
+            )
+            measure(
+                "orjson",
+                serializers.json_serializer(schemas.FactoryResponse),
+                rows,
+            )
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="Scratch database URL, its tables are dropped.")
+    parser.add_argument("--factories", type=int, default=10)
+    parser.add_argument("--productions", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    options = dict(
+        factories=args.factories, productions=args.productions, rounds=args.rounds
+    )
+    if args.url:
+        run(url=args.url, **options)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            database_path = os.path.join(workdir, "serialization.sqlite")
+            run(url=f"sqlite:///{database_path}", **options)
@@ -1,17 +1,87 @@
+import argparse
+import os
+import time
+
 from sqlmodel import Session
 
 from apps.database import database
 from apps.sprocket import tasks as sprocket_tasks
 
+FACTORY_FILE_PATH = "data/seed_factory_data.json"
+SPROCKET_FILE_PATH = "data/seed_sprocket_types.json"
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
-def run() -> None:
+
+def run(batch_size: int) -> None:
     with Session(database.engine) as session:
         log = sprocket_tasks.load_data_from_json(
-            factory_file_path="data/seed_factory_data.json",
-            sprocket_file_path="data/seed_sprocket_types.json",
+            factory_file_path=FACTORY_FILE_PATH,
+            sprocket_file_path=SPROCKET_FILE_PATH,
             session=session,
+            batch_size=batch_size,
         )
         print(f"{'*'*50} {log} {'*'*50}")
 
 
-run()
+def run_in_parallel(batch_size: int, shard_size: int, resume: bool) -> None:
+    with Session(database.engine) as session:
+        result = sprocket_tasks.load_data_in_parallel(
+            factory_file_path=os.path.abspath(FACTORY_FILE_PATH),
+            sprocket_file_path=SPROCKET_FILE_PATH,
+            session=session,
+            shard_size=shard_size,
+            batch_size=batch_size,
+            resume=resume,
+        )
+    if result is None:
+        print(f"{'*'*50} Initial data already loaded. Skipping data load. {'*'*50}")
+        return
+    print(f"Load {result.parent.id} dispatched")
+    while not result.ready():
+        progress = sprocket_tasks.get_load_progress(result.parent.id)
+        print(
+            f"{progress['completed']}/{progress['shards']} shards, "
+            f"{progress['rows']} rows"
+        )
+        if progress["failed"]:
+            break
+        time.sleep(1)
+    print(f"{'*'*50} Inserted {result.get()} rows {'*'*50}")
+
+
+parser = argparse.ArgumentParser(description="Load the factory and sprocket seed data.")
+parser.add_argument(
+    "--batch-size",
+    type=positive_int,
+    default=os.getenv("LOAD_BATCH_SIZE", str(sprocket_tasks.DEFAULT_BATCH_SIZE)),
+    help="Number of rows written per multi-row insert.",
+)
+parser.add_argument(
+    "--parallel",
+    action="store_true",
+    help="Fan the factories out to the Celery workers instead of loading in-process.",
+)
+parser.add_argument(
+    "--shard-size",
+    type=positive_int,
+    default=os.getenv("LOAD_SHARD_SIZE", str(sprocket_tasks.DEFAULT_SHARD_SIZE)),
+    help="Number of factories loaded by each Celery task.",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="With --parallel, dispatch again a load that stopped partway.",
+)
+args = parser.parse_args()
+if args.parallel:
+    run_in_parallel(
+        batch_size=args.batch_size, shard_size=args.shard_size, resume=args.resume
+    )
+else:
+    run(batch_size=args.batch_size)
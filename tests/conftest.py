@@ -3,6 +3,7 @@ from typing import Generator
 import pytest
 from fastapi.testclient import TestClient
 
+from apps.cache import cache
 from apps.database import database
 from sqlmodel import Session
 from apps.main import app
@@ -11,16 +12,25 @@ import os
 from typing import Annotated
 
 from fastapi import Depends
+from fastapi_redis_cache import FastApiRedisCache
+from fastapi_redis_cache.enums import RedisStatus
 from sqlmodel import Field, Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
+from sqlalchemy.orm import sessionmaker
 
 
-@pytest.fixture(name="session")
-def session_fixture():
+@pytest.fixture(name="engine")
+def engine_fixture():
     engine = create_engine(
         "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
     )
     SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(name="session")
+def session_fixture(engine):
     with Session(engine) as session:
         yield session
 
@@ -31,7 +41,25 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[database.get_session] = get_session_override
+    app.dependency_overrides[database.get_session_factory] = lambda: sessionmaker(
+        bind=session.get_bind(), class_=Session
+    )
 
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+
+
+@pytest.fixture(name="redis_cache")
+def redis_cache_fixture(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("CACHE_ENV", "TEST")
+    redis_cache = FastApiRedisCache()
+    redis_cache.init(
+        host_url="redis://test",
+        prefix="powerflex-cache",
+        response_header="X-PowerFlex-Cache",
+    )
+    yield redis_cache
+    redis_cache.redis.flushall()
+    redis_cache.status = RedisStatus.NONE
+    cache.memory_cache.clear()
@@ -0,0 +1,242 @@
+import asyncio
+from pathlib import Path
+from typing import Any, AsyncGenerator, Generator, List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_redis_cache import FastApiRedisCache
+from redis.client import Pipeline
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from apps.cache import cache
+from apps.database import database
+from apps.sprocket.async_routes import router
+
+
+@pytest.fixture(name="async_client")
+def async_client_fixture(tmp_path: Path) -> Generator[TestClient, None, None]:
+    database_path = tmp_path / "async.sqlite"
+    sync_engine = create_engine(f"sqlite:///{database_path}")
+    SQLModel.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool
+    )
+
+    session_factory = async_sessionmaker(
+        bind=async_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    async def get_async_session_override() -> AsyncGenerator[AsyncSession, None]:
+        async with session_factory() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(router=router)
+    app.dependency_overrides[database.get_async_session] = get_async_session_override
+    app.dependency_overrides[database.get_async_session_factory] = (
+        lambda: session_factory
+    )
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.unittest
+def test_get_async_database_url() -> None:
+    assert (
+        database.get_async_database_url("postgresql://user:secret@db:5432/powerflex")
+        == "postgresql+asyncpg://user:secret@db:5432/powerflex"
+    )
+    assert (
+        database.get_async_database_url("postgresql+psycopg2://db/powerflex")
+        == "postgresql+asyncpg://db/powerflex"
+    )
+    assert database.get_async_database_url("sqlite://") == "sqlite+aiosqlite://"
+
+
+@pytest.mark.unittest
+def test_async_factory_round_trip(async_client: TestClient) -> None:
+    sprocket = async_client.post(
+        url="/api/v1/sprockets",
+        json={"teeth": 5, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1.0},
+    ).json()
+    chart_data = async_client.post(
+        url="/api/v1/chart_data", json={"sprocket_productions": []}
+    ).json()
+    sprocket_production = async_client.post(
+        url="/api/v1/sprocket_production",
+        json={
+            "sprocket_production_actual": 10,
+            "sprocket_production_goal": 20,
+            "time": 1633194818,
+            "sprocket_types": [sprocket["id"]],
+            "chart_data_id": chart_data["id"],
+        },
+    ).json()
+    assert sprocket_production["sprocket_types"][0]["teeth"] == 5
+
+    factory = async_client.post(
+        url="/api/v1/factories", json={"chart_data": chart_data["id"]}
+    ).json()
+
+    response = async_client.get(url=f"/api/v1/factories/{factory['id']}")
+    assert response.status_code == 200
+    data = response.json()
+    productions = data["chart_data"]["sprocket_productions"]
+    assert productions[0]["sprocket_production_actual"] == 10
+    assert productions[0]["sprocket_types"][0]["id"] == sprocket["id"]
+    response = async_client.get(
+        url=f"/api/v1/factories/{factory['id']}",
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
+
+    response = async_client.get(url=f"/api/v1/factories/{factory['id']}/aggregate")
+    assert response.json()["buckets"] == [
+        {
+            "time": sprocket_production["time"] - sprocket_production["time"] % 3600,
+            "count": 1,
+            "sprocket_production_actual": 10,
+            "sprocket_production_goal": 20,
+            "attainment": 0.5,
+        }
+    ]
+
+    response = async_client.get(url="/api/v1/sprocket_production")
+    assert [item["id"] for item in response.json()] == [sprocket_production["id"]]
+
+
+@pytest.mark.unittest
+def test_async_update_sprocket(async_client: TestClient) -> None:
+    sprocket = async_client.post(
+        url="/api/v1/sprockets",
+        json={"teeth": 5, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1.0},
+    ).json()
+
+    response = async_client.put(
+        url=f"/api/v1/sprockets/{sprocket['id']}",
+        json={
+            "teeth": 25,
+            "pitch_diameter": 5.5,
+            "outside_diameter": 6.5,
+            "pitch": 2.5,
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["teeth"] == 25
+
+    response = async_client.get(url="/api/v1/sprockets/999")
+    assert response.status_code == 404
+
+
+@pytest.mark.unittest
+def test_async_list_factories_streams_ndjson(async_client: TestClient) -> None:
+    chart_data = async_client.post(
+        url="/api/v1/chart_data", json={"sprocket_productions": []}
+    ).json()
+    factory = async_client.post(
+        url="/api/v1/factories", json={"chart_data": chart_data["id"]}
+    ).json()
+
+    response = async_client.get(
+        url="/api/v1/factories", headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.text.splitlines() == [
+        '{"id":%d,"chart_data":{"id":%d,"sprocket_productions":[]}}'
+        % (factory["id"], chart_data["id"])
+    ]
+    assert async_client.get(url="/api/v1/factories").json() == [factory]
+
+
+@pytest.mark.unittest
+def test_async_batch_get_by_ids(async_client: TestClient) -> None:
+    sprocket_ids = [
+        async_client.post(
+            url="/api/v1/sprockets",
+            json={
+                "teeth": teeth,
+                "pitch_diameter": 5.0,
+                "outside_diameter": 6.0,
+                "pitch": 1.0,
+            },
+        ).json()["id"]
+        for teeth in (5, 6)
+    ]
+    response = async_client.get(
+        url="/api/v1/sprockets", params={"ids": [sprocket_ids[1], 999, sprocket_ids[0]]}
+    )
+    assert [sprocket["teeth"] for sprocket in response.json()] == [6, 5]
+
+
+@pytest.fixture(name="redis_on_event_loop")
+def redis_on_event_loop_fixture(
+    redis_cache: FastApiRedisCache, monkeypatch: pytest.MonkeyPatch
+) -> List[str]:
+    """The Redis commands issued from a running event loop."""
+    on_event_loop: List[str] = []
+    redis_class = type(redis_cache.redis)
+    execute_command = redis_class.execute_command
+    pipeline_execute = Pipeline.execute
+
+    def on_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    def record_execute_command(self: Any, *args: Any, **kwargs: Any) -> Any:
+        if on_loop():
+            on_event_loop.append(args[0])
+        return execute_command(self, *args, **kwargs)
+
+    def record_pipeline_execute(self: Any, *args: Any, **kwargs: Any) -> Any:
+        if on_loop():
+            on_event_loop.extend(command[0][0] for command in self.command_stack)
+        return pipeline_execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(redis_class, "execute_command", record_execute_command)
+    monkeypatch.setattr(Pipeline, "execute", record_pipeline_execute)
+    return on_event_loop
+
+
+@pytest.mark.unittest
+def test_async_batch_get_keeps_redis_off_the_event_loop(
+    async_client: TestClient, redis_on_event_loop: List[str]
+) -> None:
+    sprocket_id = async_client.post(
+        url="/api/v1/sprockets",
+        json={"teeth": 5, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1},
+    ).json()["id"]
+    for status in ("Miss", "Hit"):
+        response = async_client.get(
+            url="/api/v1/sprockets", params={"ids": [sprocket_id]}
+        )
+        assert response.json()[0]["teeth"] == 5
+        assert response.headers["X-PowerFlex-Cache"].startswith(status)
+    assert redis_on_event_loop == []
+
+
+@pytest.mark.unittest
+def test_async_cached_gets_and_writes_keep_redis_off_the_event_loop(
+    async_client: TestClient, redis_on_event_loop: List[str]
+) -> None:
+    sprocket = {"teeth": 5, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1}
+    sprocket_id = async_client.post(url="/api/v1/sprockets", json=sprocket).json()["id"]
+    url = f"/api/v1/sprockets/{sprocket_id}"
+    assert async_client.get(url=url).headers["X-PowerFlex-Cache"].startswith("Miss")
+    cache.memory_cache.clear()
+    response = async_client.get(url=url)
+    assert response.headers["X-PowerFlex-Cache"].startswith("Hit; source=redis")
+
+    response = async_client.put(url=url, json={**sprocket, "teeth": 7})
+    assert response.status_code == 200
+    response = async_client.get(url=url)
+    assert response.headers["X-PowerFlex-Cache"].startswith("Miss")
+    assert response.json()["teeth"] == 7
+    assert redis_on_event_loop == []
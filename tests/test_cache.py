@@ -0,0 +1,560 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi_redis_cache import FastApiRedisCache
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from apps.cache import cache
+from apps.cache.memory import MemoryCache
+from apps.cache.scheduler import Scheduler
+from apps.database import database
+from apps.main import app
+from apps.sprocket import models, routes, schemas, services
+
+SPROCKET = {"teeth": 5, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1.0}
+
+
+def create_factory(session: Session) -> schemas.FactoryResponse:
+    sprocket_type = services.create_sprocket_type(
+        session=session, sprocket_type=schemas.SPRocketTypeCreate(**SPROCKET)
+    )
+    chart_data = services.create_chart_data(
+        session=session, chart_data=schemas.ChartDataCreate(sprocket_productions=[])
+    )
+    services.create_sprocket_production(
+        session=session,
+        sprocket_production=schemas.SPRocketProductionCreate(
+            sprocket_production_actual=10,
+            sprocket_production_goal=20,
+            time=datetime(2024, 5, 30, 12, 0, 0),
+            sprocket_types=[sprocket_type.id],
+            chart_data_id=chart_data.id,
+        ),
+    )
+    factory = services.create_factory(
+        session=session, factory=schemas.FactoryCreate(chart_data=chart_data.id)
+    )
+    return schemas.FactoryResponse.model_validate(factory)
+
+
+def read(client: TestClient, url: str) -> str:
+    response = client.get(url=url)
+    assert response.status_code == 200
+    return response.headers["X-PowerFlex-Cache"].split(";")[0]
+
+
+@pytest.mark.unittest
+def test_factory_cache_tags(session: Session) -> None:
+    factory = create_factory(session=session)
+    sprocket_type_id = factory.chart_data.sprocket_productions[0].sprocket_types[0].id
+    assert services.factory_cache_tags(factory) == {
+        services.factory_tag(factory.id),
+        services.chart_data_tag(factory.chart_data.id),
+        services.sprocket_type_tag(sprocket_type_id),
+    }
+
+
+@pytest.mark.unittest
+def test_sprocket_type_update_evicts_embedding_entries(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    factory = create_factory(session=session)
+    other = create_factory(session=session)
+    sprocket_type_id = factory.chart_data.sprocket_productions[0].sprocket_types[0].id
+    urls = [
+        f"/api/v1/factories/{factory.id}",
+        f"/api/v1/chart_data/{factory.chart_data.id}",
+        f"/api/v1/sprockets/{sprocket_type_id}",
+        f"/api/v1/sprocket_production/{factory.chart_data.sprocket_productions[0].id}",
+    ]
+    other_url = f"/api/v1/factories/{other.id}"
+    assert [read(client, url) for url in urls + [other_url]] == ["Miss"] * 5
+    assert [read(client, url) for url in urls + [other_url]] == ["Hit"] * 5
+
+    response = client.put(
+        url=f"/api/v1/sprockets/{sprocket_type_id}", json={**SPROCKET, "teeth": 9}
+    )
+    assert response.status_code == 200
+
+    assert [read(client, url) for url in urls] == ["Miss"] * 4
+    assert read(client, other_url) == "Hit"
+    chart_data = client.get(url=f"/api/v1/factories/{factory.id}").json()["chart_data"]
+    assert chart_data["sprocket_productions"][0]["sprocket_types"][0]["teeth"] == 9
+
+
+@pytest.mark.unittest
+def test_sprocket_production_create_evicts_chart_data_entries(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    factory = create_factory(session=session)
+    urls = [
+        f"/api/v1/factories/{factory.id}",
+        f"/api/v1/chart_data/{factory.chart_data.id}",
+    ]
+    assert [read(client, url) for url in urls] == ["Miss", "Miss"]
+    assert [read(client, url) for url in urls] == ["Hit", "Hit"]
+
+    response = client.post(
+        url="/api/v1/sprocket_production",
+        json={
+            "sprocket_production_actual": 11,
+            "sprocket_production_goal": 20,
+            "time": 1633194818,
+            "sprocket_types": [],
+            "chart_data_id": factory.chart_data.id,
+        },
+    )
+    assert response.status_code == 200
+
+    assert [read(client, url) for url in urls] == ["Miss", "Miss"]
+    productions = client.get(url=urls[1]).json()["sprocket_productions"]
+    assert len(productions) == 2
+
+
+@pytest.mark.unittest
+def test_memory_cache_lru_ttl_and_generation(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 100.0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    memory_cache = MemoryCache(maxsize=2, ttl=10)
+    for key in ("a", "b"):
+        memory_cache.set(key, key.encode(), generation=memory_cache.generation)
+    assert memory_cache.get("a") == b"a"
+    memory_cache.set("c", b"c", generation=memory_cache.generation)
+    assert memory_cache.get("b") is None
+    assert memory_cache.get("a") == b"a"
+
+    generation = memory_cache.generation
+    memory_cache.evict(["a"])
+    memory_cache.set("a", b"stale", generation=generation)
+    assert memory_cache.get("a") is None
+
+    now = 110.0
+    assert memory_cache.get("c") is None
+    assert (memory_cache.hits, memory_cache.misses) == (2, 3)
+
+
+@pytest.mark.unittest
+def test_memory_cache_serves_hits_and_reports_counts(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    factory = create_factory(session=session)
+    url = f"/api/v1/factories/{factory.id}"
+    headers = [client.get(url=url).headers["X-PowerFlex-Cache"] for _ in range(2)]
+    assert headers == [
+        "Miss; memory-hits=0; memory-misses=1",
+        "Hit; source=memory; memory-hits=1; memory-misses=1",
+    ]
+
+    cache.memory_cache.clear()
+    assert client.get(url=url).headers["X-PowerFlex-Cache"] == (
+        "Hit; source=redis; memory-hits=0; memory-misses=1"
+    )
+
+
+@pytest.mark.unittest
+def test_invalidation_messages_evict_memory_cache(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    factory = create_factory(session=session)
+    url = f"/api/v1/factories/{factory.id}"
+    client.get(url=url)
+    key = next(iter(cache.memory_cache.entries))
+
+    listener = cache.start_invalidation_listener()
+    try:
+        redis_cache.redis.publish(cache.get_channel(redis_cache), json.dumps([key]))
+        deadline = time.monotonic() + 5
+        while key in cache.memory_cache.entries and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        cache.stop_invalidation_listener(listener)
+    assert key not in cache.memory_cache.entries
+
+
+def counting_route(calls: list) -> object:
+    @cache.response_cache(
+        response_model=schemas.SPRocketTypeResponse,
+        tags=services.sprocket_type_cache_tags,
+    )
+    async def read_sprocket(sprocket_id: int) -> schemas.SPRocketTypeResponse:
+        calls.append(sprocket_id)
+        await asyncio.sleep(0.05)
+        return schemas.SPRocketTypeResponse(id=sprocket_id, **SPROCKET)
+
+    return read_sprocket
+
+
+@pytest.mark.unittest
+def test_concurrent_misses_are_coalesced(redis_cache: FastApiRedisCache) -> None:
+    calls: list = []
+    read_sprocket = counting_route(calls)
+
+    async def read_concurrently() -> list:
+        return await asyncio.gather(*(read_sprocket(sprocket_id=1) for _ in range(5)))
+
+    responses = asyncio.run(read_concurrently())
+    assert calls == [1]
+    statuses = [r.headers["X-PowerFlex-Cache"].split("; memory")[0] for r in responses]
+    assert sorted(statuses) == ["Hit; source=coalesced"] * 4 + ["Miss"]
+    assert {r.body for r in responses} == {responses[0].body}
+    assert cache.in_flight == {}
+
+
+@pytest.mark.unittest
+def test_fills_that_raced_an_invalidation_are_not_stored(
+    redis_cache: FastApiRedisCache,
+) -> None:
+    @cache.response_cache(
+        response_model=schemas.SPRocketTypeResponse,
+        tags=services.sprocket_type_cache_tags,
+    )
+    def read_sprocket(sprocket_id: int) -> schemas.SPRocketTypeResponse:
+        # The write lands after the database was read.
+        cache.invalidate(services.sprocket_type_tag(sprocket_id))
+        return schemas.SPRocketTypeResponse(id=sprocket_id, **SPROCKET)
+
+    response = asyncio.run(read_sprocket(sprocket_id=1))
+    assert response.headers["X-PowerFlex-Cache"].startswith("Miss")
+    key = cache.get_cache_key(redis_cache, read_sprocket, {"sprocket_id": 1})
+    assert redis_cache.redis.get(key) is None
+
+
+@pytest.mark.unittest
+def test_fills_between_the_tag_read_and_delete_are_not_orphaned(
+    redis_cache: FastApiRedisCache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    tag = "sprocket_type:1"
+    tag_key = cache.get_tag_key(redis_cache, tag)
+    generation = cache.get_generation(redis_cache)
+    entry = cache.CacheEntry(key="stale", content=b"{}", expire=1000, tags=[tag])
+    sunion = redis_cache.redis.sunion
+
+    def fill_after_sunion(*args: Any, **kwargs: Any) -> Any:
+        # A fill that read the database before the write stores its result
+        # once the tag sets were read for the eviction.
+        keys = sunion(*args, **kwargs)
+        cache.add_to_cache(redis_cache, [entry], generation)
+        return keys
+
+    monkeypatch.setattr(redis_cache.redis, "sunion", fill_after_sunion)
+    cache.evict_tags(tag)
+    assert redis_cache.redis.get("stale") is None
+    assert not redis_cache.redis.exists(tag_key)
+
+
+@pytest.mark.unittest
+def test_tag_sets_keep_their_longest_ttl_and_are_pruned(
+    redis_cache: FastApiRedisCache,
+) -> None:
+    tag_key = cache.get_tag_key(redis_cache, "sprocket_type:1")
+    generation = cache.get_generation(redis_cache)
+    for key, expire in (("long", 1000), ("short", 10), ("gone", 10)):
+        entry = cache.CacheEntry(
+            key=key, content=b"{}", expire=expire, tags=["sprocket_type:1"]
+        )
+        assert cache.add_to_cache(redis_cache, [entry], generation)
+    assert redis_cache.redis.ttl(tag_key) == 1000
+
+    redis_cache.redis.delete("gone")
+    assert cache.prune_tags() == 1
+    assert redis_cache.redis.smembers(tag_key) == {b"long", b"short"}
+
+
+@pytest.mark.unittest
+def test_scheduler_runs_calls_in_due_order() -> None:
+    scheduler = Scheduler(name="test-scheduler")
+    calls: list = []
+    done = threading.Event()
+    scheduler.call_later(0.05, lambda: (calls.append("late"), done.set()))
+    scheduler.call_later(0, lambda: 1 / 0)
+    scheduler.call_later(0.01, calls.append, "early")
+    assert done.wait(timeout=2)
+    assert calls == ["early", "late"]
+
+
+@pytest.mark.unittest
+def test_miss_waits_for_fill_of_another_worker(
+    redis_cache: FastApiRedisCache,
+) -> None:
+    calls: list = []
+    read_sprocket = counting_route(calls)
+    key = cache.get_cache_key(redis_cache, read_sprocket, {"sprocket_id": 1})
+    token = cache.acquire_lock(redis_cache, key)
+    content = schemas.SPRocketTypeResponse(id=1, **SPROCKET).model_dump_json()
+
+    def fill_elsewhere() -> None:
+        time.sleep(0.2)
+        redis_cache.redis.set(key, content)
+        cache.release_lock(redis_cache, key, token)
+
+    listener = cache.start_invalidation_listener()
+    thread = threading.Thread(target=fill_elsewhere)
+    thread.start()
+    try:
+        started_at = time.monotonic()
+        response = asyncio.run(read_sprocket(sprocket_id=1))
+        waited = time.monotonic() - started_at
+    finally:
+        thread.join()
+        cache.stop_invalidation_listener(listener)
+    assert calls == []
+    assert response.headers["X-PowerFlex-Cache"].startswith("Hit; source=redis")
+    assert response.body == content.encode()
+    # Woken by the release of the lock, not by the end of CACHE_LOCK_WAIT.
+    assert waited < cache.CACHE_LOCK_WAIT
+    assert cache.fill_waiters == {}
+
+
+@pytest.mark.unittest
+def test_miss_wait_for_another_worker_is_bounded(
+    redis_cache: FastApiRedisCache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(cache, "CACHE_LOCK_WAIT", 0.1)
+    calls: list = []
+    read_sprocket = counting_route(calls)
+    key = cache.get_cache_key(redis_cache, read_sprocket, {"sprocket_id": 1})
+    assert cache.acquire_lock(redis_cache, key) is not None
+
+    response = asyncio.run(read_sprocket(sprocket_id=1))
+    assert calls == [1]
+    assert response.headers["X-PowerFlex-Cache"].startswith("Miss")
+
+
+def stale_sprocket_type_route() -> object:
+    @cache.response_cache(
+        response_model=schemas.SPRocketTypeResponse,
+        tags=services.sprocket_type_cache_tags,
+        expire=100,
+        stale_expire=50,
+    )
+    def read_sprocket_type(sprocket_id: int, session: Session) -> object:
+        sprocket_type = services.get_sprocket_type(
+            session=session, sprocket_type_id=sprocket_id
+        )
+        if sprocket_type.teeth < 0:
+            raise RuntimeError("Database unavailable")
+        return sprocket_type
+
+    return read_sprocket_type
+
+
+def read_then_refresh(route: object, **kwargs: object) -> object:
+    async def run() -> object:
+        response = await route(**kwargs)
+        await asyncio.gather(*cache.in_flight.values())
+        return response
+
+    return asyncio.run(run())
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize("teeth,refreshed_teeth", [(9, 9), (-1, 5)])
+def test_stale_entries_are_served_while_refreshed(
+    session: Session,
+    redis_cache: FastApiRedisCache,
+    teeth: int,
+    refreshed_teeth: int,
+) -> None:
+    route = stale_sprocket_type_route()
+    sprocket_type = services.create_sprocket_type(
+        session=session, sprocket_type=schemas.SPRocketTypeCreate(**SPROCKET)
+    )
+    response = read_then_refresh(route, sprocket_id=sprocket_type.id, session=session)
+    key = cache.get_cache_key(redis_cache, route, {"sprocket_id": sprocket_type.id})
+    assert redis_cache.redis.ttl(key) == 150
+
+    sprocket_type.teeth = teeth
+    session.add(sprocket_type)
+    session.commit()
+    redis_cache.redis.expire(key, 20)
+    cache.memory_cache.clear()
+
+    stale = read_then_refresh(route, sprocket_id=sprocket_type.id, session=session)
+    assert stale.headers["X-PowerFlex-Cache"].startswith("Hit; source=stale")
+    assert stale.body == response.body
+    assert json.loads(redis_cache.redis.get(key))["teeth"] == refreshed_teeth
+    assert (redis_cache.redis.ttl(key) == 150) is (teeth == refreshed_teeth)
+
+
+@pytest.mark.unittest
+def test_etags_describe_the_cached_body(
+    client: TestClient,
+    session: Session,
+    redis_cache: FastApiRedisCache,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    factory = create_factory(session)
+    url = f"/api/v1/factories/{factory.id}"
+    response = client.get(url=url)
+    etag = response.headers["etag"]
+    assert etag == cache.content_etag(response.content)
+
+    # A write whose invalidation has not landed yet.
+    sprocket_type = session.get(
+        models.SPRocketType,
+        factory.chart_data.sprocket_productions[0].sprocket_types[0].id,
+    )
+    sprocket_type.teeth = 9
+    session.add(sprocket_type)
+    session.commit()
+    response = client.get(url=url)
+    assert response.headers["etag"] == etag
+    assert cache.content_etag(response.content) == etag
+
+    key = cache.get_cache_key(
+        redis_cache, routes.factory_rows, {"factory_id": factory.id}
+    )
+    redis_cache.redis.expire(key, 20)
+    cache.memory_cache.clear()
+
+    def get_factory(**kwargs: object) -> None:
+        raise exc.OperationalError("SELECT", {}, Exception("Database unavailable"))
+
+    monkeypatch.setattr(services, "get_factory", get_factory)
+    response = client.get(url=url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get(url=url)
+    assert response.status_code == 200
+    assert response.headers["X-PowerFlex-Cache"].startswith("Hit; source=stale")
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.unittest
+def test_batch_get_only_loads_misses(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    sprocket_type_ids = [
+        services.create_sprocket_type(
+            session=session,
+            sprocket_type=schemas.SPRocketTypeCreate(**{**SPROCKET, "teeth": teeth}),
+        ).id
+        for teeth in range(1, 4)
+    ]
+    assert read(client, f"/api/v1/sprockets/{sprocket_type_ids[0]}") == "Miss"
+
+    def read_batch() -> str:
+        response = client.get(
+            url="/api/v1/sprockets", params={"ids": sprocket_type_ids}
+        )
+        assert [s["teeth"] for s in response.json()] == [1, 2, 3]
+        return response.headers["X-PowerFlex-Cache"].split("; memory")[0]
+
+    assert read_batch() == "Miss; hits=1; misses=2"
+    cache.memory_cache.clear()
+    assert read_batch() == "Hit; hits=3; misses=0"
+    assert read(client, f"/api/v1/sprockets/{sprocket_type_ids[2]}") == "Hit"
+
+    client.put(url=f"/api/v1/sprockets/{sprocket_type_ids[1]}", json=SPROCKET)
+    response = client.get(url="/api/v1/sprockets", params={"ids": sprocket_type_ids})
+    assert response.headers["X-PowerFlex-Cache"].startswith("Miss; hits=2; misses=1")
+    assert response.json()[1]["teeth"] == SPROCKET["teeth"]
+
+
+@pytest.mark.unittest
+def test_columnar_reads_are_cached_apart_from_rows(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    factory = create_factory(session=session)
+    url = f"/api/v1/factories/{factory.id}"
+    columnar = f"{url}?format=columnar"
+    assert read(client, url) == "Miss"
+    assert read(client, columnar) == "Miss"
+    assert read(client, columnar) == "Hit"
+    assert client.get(url=columnar).json()["chart_data"]["time"] == [
+        factory.chart_data.sprocket_productions[0].time
+    ]
+
+    services.create_sprocket_production(
+        session=session,
+        sprocket_production=schemas.SPRocketProductionCreate(
+            sprocket_production_actual=30,
+            sprocket_production_goal=20,
+            time=datetime(2024, 5, 30, 13, 0, 0),
+            sprocket_types=[],
+            chart_data_id=factory.chart_data.id,
+        ),
+    )
+    assert read(client, columnar) == "Miss"
+    chart_data = client.get(url=columnar).json()["chart_data"]
+    assert chart_data["sprocket_production_actual"] == [10, 30]
+
+
+@pytest.mark.unittest
+def test_cache_hits_and_health_checks_do_not_check_out_connections(
+    client: TestClient,
+    engine: Engine,
+    session: Session,
+    redis_cache: FastApiRedisCache,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    factory = create_factory(session)
+    sprocket_type_id = factory.chart_data.sprocket_productions[0].sprocket_types[0].id
+    url = f"/api/v1/sprockets/{sprocket_type_id}"
+    reads = [
+        url,
+        f"/api/v1/factories/{factory.id}",
+        f"/api/v1/chart_data/{factory.chart_data.id}",
+    ]
+    session.close()
+    monkeypatch.setattr(database, "engine", engine)
+    del app.dependency_overrides[database.get_session]
+    checkouts, read_only = [], []
+
+    def on_checkout(*args) -> None:
+        checkouts.append(args)
+
+    def on_begin(session: Session, *args) -> None:
+        read_only.append(session.info.get("read_only"))
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(Session, "after_begin", on_begin)
+    try:
+        for read_url in reads:
+            assert read(client, read_url) == "Miss"
+        for read_url in reads:
+            assert read(client, read_url) == "Hit"
+        for read_url in reads[1:]:
+            etag = client.get(url=read_url).headers["etag"]
+            response = client.get(url=read_url, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+        assert client.get(url="/health").status_code == 200
+        assert len(checkouts) == len(reads)
+        assert read_only == [True] * len(reads)
+
+        client.put(url=url, json=SPROCKET)
+        assert len(read_only) > len(reads)
+        assert not any(read_only[len(reads) :])
+    finally:
+        event.remove(engine, "checkout", on_checkout)
+        event.remove(Session, "after_begin", on_begin)
+
+
+@pytest.mark.unittest
+def test_invalidation_repeats_after_replica_lag(
+    client: TestClient,
+    session: Session,
+    redis_cache: FastApiRedisCache,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(cache, "CACHE_REINVALIDATE_AFTER", 0.05)
+    sprocket_type = services.create_sprocket_type(
+        session=session, sprocket_type=schemas.SPRocketTypeCreate(**SPROCKET)
+    )
+    url = f"/api/v1/sprockets/{sprocket_type.id}"
+    assert read(client, url) == "Miss"
+    for _ in range(3):
+        cache.invalidate(services.sprocket_type_tag(sprocket_type.id))
+    threads = [thread.name for thread in threading.enumerate()]
+    assert threads.count(cache.scheduler.name) == 1
+    assert read(client, url) == "Miss"
+    assert read(client, url) == "Hit"
+    time.sleep(0.2)
+    assert read(client, url) == "Miss"
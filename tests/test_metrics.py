@@ -0,0 +1,137 @@
+import logging
+from typing import Dict
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_redis_cache import FastApiRedisCache
+from sqlalchemy import text
+from sqlmodel import Session
+
+from apps.metrics import metrics, timing
+from apps.sprocket import schemas, services
+
+SPROCKET = {"teeth": 5, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1.0}
+
+
+def scrape(client: TestClient) -> Dict[str, float]:
+    response = client.get(url="/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return {
+        series: float(value)
+        for series, value in (
+            line.rsplit(" ", 1)
+            for line in response.text.splitlines()
+            if not line.startswith("#")
+        )
+    }
+
+
+@pytest.mark.unittest
+def test_metrics_endpoint_reports_routes_and_queries(
+    client: TestClient, session: Session
+) -> None:
+    sprocket_type = services.create_sprocket_type(
+        session=session, sprocket_type=schemas.SPRocketTypeCreate(**SPROCKET)
+    )
+    route = 'method="GET",route="/api/v1/sprockets/{sprocket_id}"'
+    before = scrape(client)
+    count = f'powerflex_http_request_duration_seconds_count{{{route},status="200"}}'
+    queries = f'powerflex_db_queries_total{{{route},status="200"}}'
+
+    for _ in range(2):
+        session.expunge_all()
+        response = client.get(url=f"/api/v1/sprockets/{sprocket_type.id}")
+        assert response.status_code == 200
+    assert client.get(url="/not-a-route").status_code == 404
+    after = scrape(client)
+
+    assert after[count] - before.get(count, 0) == 2
+    assert after[queries] - before.get(queries, 0) >= 2
+    assert (
+        after[
+            f"powerflex_http_request_duration_seconds_bucket{{{route},"
+            'status="200",le="+Inf"}'
+        ]
+        == after[count]
+    )
+    unmatched = (
+        'powerflex_http_request_duration_seconds_count{method="GET",'
+        'route="unmatched",status="404"}'
+    )
+    assert after[unmatched] >= 1
+    assert after["powerflex_http_requests_in_flight"] == 1
+    assert 'powerflex_db_pool_checkouts{engine="primary"}' in after
+
+
+@pytest.mark.unittest
+def test_metrics_endpoint_reports_cache_sources(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    sprocket_type = services.create_sprocket_type(
+        session=session, sprocket_type=schemas.SPRocketTypeCreate(**SPROCKET)
+    )
+    before = scrape(client)
+    for _ in range(3):
+        client.get(url=f"/api/v1/sprockets/{sprocket_type.id}")
+    after = scrape(client)
+
+    def served(source: str) -> float:
+        series = f'powerflex_cache_responses_total{{source="{source}"}}'
+        return after.get(series, 0) - before.get(series, 0)
+
+    assert served("miss") == 1
+    assert served("memory") == 2
+    assert 0 < after['powerflex_cache_ratio{result="hit"}'] <= 1
+
+
+@pytest.mark.unittest
+def test_server_timing_and_n_plus_one_detection(
+    session: Session, caplog: pytest.LogCaptureFixture
+) -> None:
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/loop/{times}")
+    def loop(times: int) -> int:
+        for i in range(times):
+            session.execute(text("SELECT :i"), {"i": i})
+        return times
+
+    client = TestClient(app)
+    key = ("GET", "/loop/{times}", 200)
+
+    response = client.get(url="/loop/2")
+    server_timing = response.headers["server-timing"]
+    assert server_timing.startswith("db;dur=")
+    assert 'desc="2 queries"' in server_timing
+    assert all(
+        f"{phase};dur=" in server_timing for phase in ("cache", "serialize", "total")
+    )
+    with caplog.at_level(logging.WARNING, logger=metrics.__name__):
+        client.get(url=f"/loop/{metrics.N_PLUS_ONE_THRESHOLD}")
+    assert "N+1 queries in GET /loop/{times}" in caplog.text
+    assert metrics.routes[key].n_plus_one == 1
+    assert "powerflex_db_n_plus_one_total{" in metrics.render().decode()
+    del metrics.routes[key]
+
+
+@pytest.mark.unittest
+def test_query_listeners_only_count_statements_when_needed(
+    session: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    metrics.instrument_queries()
+    assert session.execute(text("SELECT 1")).scalar() == 1
+
+    timings = timing.RequestTimings()
+    token = timing.current.set(timings)
+    try:
+        session.execute(text("SELECT 1"))
+        monkeypatch.setattr(metrics, "N_PLUS_ONE_THRESHOLD", 0)
+        assert session.execute(text("SELECT 2")).scalar() == 2
+    finally:
+        timing.current.reset(token)
+    assert timings.queries == 2
+    assert timings.db > 0
+    assert timings.statements == {"SELECT 1": 1}
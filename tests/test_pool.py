@@ -0,0 +1,46 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import exc, text
+from sqlmodel import create_engine
+
+from apps.database import pool
+
+
+@pytest.mark.unittest
+def test_metered_pool_records_waits_and_timeouts(tmp_path) -> None:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.sqlite'}",
+        poolclass=pool.MeteredQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    metrics = pool.instrument(engine, "test")
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            assert metrics.snapshot()["checked_out"] == 1
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        engine.dispose()
+        with engine.connect():
+            pass
+
+        snapshot = metrics.snapshot()
+        assert snapshot["checkouts"] == 2
+        assert snapshot["connections"] == 2
+        assert snapshot["timeouts"] == 1
+        assert snapshot["checked_out"] == 0
+        assert snapshot["size"] == 1
+        assert snapshot["wait_seconds"]["count"] == 2
+        assert snapshot["wait_seconds"]["buckets"]["+Inf"] == 2
+    finally:
+        pool.pool_metrics.pop("test")
+        engine.dispose()
+
+
+@pytest.mark.unittest
+def test_pool_metrics_endpoint(client: TestClient) -> None:
+    response = client.get(url="/metrics/pool")
+    assert response.status_code == 200
+    assert response.json()["primary"]["wait_seconds"]["buckets"]["+Inf"] >= 0
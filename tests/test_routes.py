@@ -1,10 +1,19 @@
+import json
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Iterator, List
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from fastapi_redis_cache import FastApiRedisCache
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine
 
-from apps.sprocket import schemas, services
+from apps.database import database
+from apps.main import app
+from apps.metrics import metrics, timing
+from apps.sprocket import schemas, serializers, services
 
 
 def create_sprocket_type(
@@ -81,6 +90,151 @@ def assert_sprocket_production_response(
         assert data["sprocket_types"][i]["pitch"] == sprocket_type_obj.pitch
 
 
+@contextmanager
+def count_queries(session: Session) -> Iterator[List[str]]:
+    statements: List[str] = []
+
+    def before_cursor_execute(
+        conn: Any, cursor: Any, statement: str, *args: Any
+    ) -> None:
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(session: Session, limit: int) -> Iterator[List[str]]:
+    """Fail if the block runs more than ``limit`` statements or an N+1 pattern."""
+    with count_queries(session) as statements:
+        yield statements
+    listing = "\n".join(statements)
+    assert (
+        len(statements) <= limit
+    ), f"{len(statements)} queries, expected at most {limit}:\n{listing}"
+    repeated = timing.repeated_statements(
+        Counter(statements), metrics.N_PLUS_ONE_THRESHOLD
+    )
+    assert not repeated, "N+1 queries:\n" + "\n".join(repeated)
+
+
+def create_factory_with_productions(
+    session: Session, productions: int, sprocket_types: int
+) -> int:
+    sprocket_type_ids = [
+        create_sprocket_type(
+            session=session,
+            teeth=5 * i,
+            pitch_diameter=5.0 * i,
+            outside_diameter=6.0 * i,
+            pitch=1.0 * i,
+        )
+        for i in range(1, sprocket_types + 1)
+    ]
+    chart_data = create_chart_data(session=session)
+    for i in range(productions):
+        create_sprocket_production(
+            session=session,
+            actual=10 + i,
+            goal=20 + i,
+            time=datetime(2024, 5, 30, 12, i, 0),
+            sprocket_types=sprocket_type_ids,
+            chart_data_id=chart_data.id,
+        )
+    factory = services.create_factory(
+        session=session, factory=schemas.FactoryCreate(chart_data=chart_data.id)
+    )
+    session.expire_all()
+    return factory.id
+
+
+@pytest.mark.unittest
+def test_read_factory_query_count_is_constant(
+    client: TestClient, session: Session
+) -> None:
+    query_counts = []
+    for productions, sprocket_types in [(1, 1), (6, 4)]:
+        factory_id = create_factory_with_productions(
+            session=session, productions=productions, sprocket_types=sprocket_types
+        )
+        with count_queries(session) as statements:
+            response = client.get(url=f"/api/v1/factories/{factory_id}")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["chart_data"]["sprocket_productions"]) == productions
+        assert all(
+            len(production["sprocket_types"]) == sprocket_types
+            for production in data["chart_data"]["sprocket_productions"]
+        )
+        query_counts.append(len(statements))
+
+    assert query_counts[0] == query_counts[1]
+    assert query_counts[1] <= 3
+
+
+@pytest.mark.unittest
+def test_read_chart_data_query_count_is_constant(
+    client: TestClient, session: Session
+) -> None:
+    query_counts = []
+    for productions in [1, 6]:
+        factory_id = create_factory_with_productions(
+            session=session, productions=productions, sprocket_types=3
+        )
+        chart_data_id = services.get_factory(
+            session=session, factory_id=factory_id
+        ).chart_data_id
+        session.expire_all()
+        with count_queries(session) as statements:
+            response = client.get(url=f"/api/v1/chart_data/{chart_data_id}")
+        assert response.status_code == 200
+        query_counts.append(len(statements))
+
+    assert query_counts[0] == query_counts[1]
+    assert query_counts[1] <= 3
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize(
+    "url, limit",
+    [
+        ("/api/v1/factories/{factory_id}", 3),
+        ("/api/v1/factories/{factory_id}/aggregate", 2),
+        ("/api/v1/factories?ids={factory_id}", 3),
+        ("/api/v1/chart_data/{chart_data_id}", 3),
+        ("/api/v1/chart_data/{chart_data_id}/aggregate", 2),
+        ("/api/v1/sprockets", 1),
+        ("/api/v1/sprockets/{sprocket_id}", 1),
+        ("/api/v1/sprockets/{sprocket_id}/aggregate", 2),
+        ("/api/v1/sprocket_production/", 2),
+        ("/api/v1/sprocket_production/{sprocket_production_id}", 2),
+    ],
+)
+def test_read_query_budgets(
+    client: TestClient, session: Session, url: str, limit: int
+) -> None:
+    factory_id = create_factory_with_productions(
+        session=session, productions=6, sprocket_types=4
+    )
+    factory = services.get_factory(session=session, factory_id=factory_id)
+    production = factory.chart_data.sprocket_productions[0]
+    ids = dict(
+        factory_id=factory_id,
+        chart_data_id=factory.chart_data_id,
+        sprocket_id=production.sprocket_types[0].id,
+        sprocket_production_id=production.id,
+    )
+    session.expunge_all()
+    with assert_max_queries(session, limit):
+        response = client.get(url=url.format(**ids))
+    assert response.status_code == 200
+    assert response.headers["server-timing"].startswith("db;dur=")
+
+
 @pytest.mark.unittest
 def test_create_chart_data(client: TestClient, session: Session) -> None:
     sprocket_types = [
@@ -437,3 +591,615 @@ def test_get_all_sprocket_production(client: TestClient, session: Session) -> No
             == sprocket_type_obj.outside_diameter
         )
         assert data[i]["sprocket_types"][0]["pitch"] == sprocket_type_obj.pitch
+
+
+@pytest.mark.unittest
+def test_get_sprockets_with_cursor(client: TestClient, session: Session) -> None:
+    sprocket_ids = [
+        create_sprocket_type(
+            session=session,
+            teeth=i,
+            pitch_diameter=5.0,
+            outside_diameter=6.0,
+            pitch=1.0,
+        )
+        for i in range(1, 6)
+    ]
+
+    seen_ids = []
+    response = client.get(url="/api/v1/sprockets", params={"limit": 2})
+    while True:
+        assert response.status_code == 200
+        seen_ids.extend(sprocket["id"] for sprocket in response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        response = client.get(
+            url="/api/v1/sprockets", params={"limit": 2, "cursor": next_cursor}
+        )
+
+    assert seen_ids == sprocket_ids
+
+
+@pytest.mark.unittest
+def test_get_all_sprocket_production_with_cursor(
+    client: TestClient, session: Session
+) -> None:
+    sprocket_types = [
+        create_sprocket_type(
+            session=session,
+            teeth=20,
+            pitch_diameter=5.5,
+            outside_diameter=6.0,
+            pitch=2.5,
+        )
+    ]
+    chart_data = create_chart_data(session=session)
+    sprocket_production_ids = [
+        create_sprocket_production(
+            session=session,
+            actual=i,
+            goal=i,
+            time=datetime(2024, 5, 30, 12, 0, 0),
+            sprocket_types=sprocket_types,
+            chart_data_id=chart_data.id,
+        ).id
+        for i in range(3)
+    ]
+
+    response = client.get(url="/api/v1/sprocket_production", params={"limit": 2})
+    first_page = [item["id"] for item in response.json()]
+    response = client.get(
+        url="/api/v1/sprocket_production",
+        params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]},
+    )
+    second_page = [item["id"] for item in response.json()]
+
+    assert first_page + second_page == sprocket_production_ids
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.unittest
+def test_get_sprockets_with_invalid_cursor(client: TestClient) -> None:
+    response = client.get(url="/api/v1/sprockets", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.unittest
+def test_list_factories_streams_json(client: TestClient, session: Session) -> None:
+    factory_ids = [
+        create_factory_with_productions(
+            session=session, productions=3, sprocket_types=2
+        )
+        for _ in range(2)
+    ]
+
+    response = client.get(url="/api/v1/factories")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    assert response.json() == [
+        client.get(url=f"/api/v1/factories/{factory_id}").json()
+        for factory_id in factory_ids
+    ]
+
+
+@pytest.mark.unittest
+def test_list_factories_streams_ndjson(client: TestClient, session: Session) -> None:
+    factory_ids = [
+        create_factory_with_productions(
+            session=session, productions=2, sprocket_types=1
+        )
+        for _ in range(3)
+    ]
+
+    response = client.get(
+        url="/api/v1/factories",
+        params={"ids": factory_ids[1:]},
+        headers={"Accept": services.NDJSON_MEDIA_TYPE},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(services.NDJSON_MEDIA_TYPE)
+    lines = response.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == factory_ids[1:]
+    assert json.loads(lines[0]) == (
+        client.get(url=f"/api/v1/factories/{factory_ids[1]}").json()
+    )
+
+
+@pytest.mark.unittest
+def test_batch_get_by_ids(client: TestClient, session: Session) -> None:
+    sprocket_type_ids = [
+        create_sprocket_type(
+            session=session,
+            teeth=i,
+            pitch_diameter=5.0,
+            outside_diameter=6.0,
+            pitch=1.0,
+        )
+        for i in range(1, 4)
+    ]
+    factory_ids = [
+        create_factory_with_productions(
+            session=session, productions=2, sprocket_types=2
+        )
+        for _ in range(2)
+    ]
+    production_ids = [
+        production["id"]
+        for production in client.get(url="/api/v1/sprocket_production/").json()
+    ]
+    session.expire_all()
+
+    with count_queries(session) as statements:
+        response = client.get(
+            url="/api/v1/sprockets",
+            params={"ids": [sprocket_type_ids[2], sprocket_type_ids[0], 999, 3]},
+        )
+    assert len(statements) == 1
+    assert [sprocket["id"] for sprocket in response.json()] == [3, 1]
+
+    response = client.get(
+        url="/api/v1/sprocket_production/", params={"ids": production_ids[::-1]}
+    )
+    assert [p["id"] for p in response.json()] == production_ids[::-1]
+    assert (
+        response.json()[0]
+        == client.get(url=f"/api/v1/sprocket_production/{production_ids[-1]}").json()
+    )
+
+    response = client.get(url="/api/v1/factories", params={"ids": factory_ids})
+    assert response.json() == [
+        client.get(url=f"/api/v1/factories/{factory_id}").json()
+        for factory_id in factory_ids
+    ]
+
+
+@pytest.mark.unittest
+def test_batch_get_limits_ids(client: TestClient) -> None:
+    response = client.get(
+        url="/api/v1/sprockets",
+        params={"ids": list(range(services.MAX_BATCH_IDS + 1))},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.unittest
+def test_bulk_create_sprocket_types(client: TestClient) -> None:
+    sprockets = [
+        {"teeth": teeth, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1.0}
+        for teeth in range(1, 4)
+    ]
+    response = client.post(url="/api/v1/sprockets/bulk", json=sprockets)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 3
+    assert [result["index"] for result in data["results"]] == [0, 1, 2]
+    for result, sprocket in zip(data["results"], sprockets):
+        assert client.get(url=f"/api/v1/sprockets/{result['id']}").json() == {
+            **sprocket,
+            "id": result["id"],
+        }
+
+
+@pytest.mark.unittest
+def test_bulk_create_sprocket_productions(client: TestClient, session: Session) -> None:
+    sprocket_type_ids = [
+        create_sprocket_type(
+            session=session,
+            teeth=i,
+            pitch_diameter=5.0,
+            outside_diameter=6.0,
+            pitch=1.0,
+        )
+        for i in range(1, 3)
+    ]
+    chart_data = create_chart_data(session=session)
+    productions = [
+        {
+            "sprocket_production_actual": 10 + i,
+            "sprocket_production_goal": 20,
+            "time": 1633194818 + i,
+            "sprocket_types": sprocket_type_ids[: i + 1],
+            "chart_data_id": chart_data.id,
+        }
+        for i in range(2)
+    ]
+
+    response = client.post(url="/api/v1/sprocket_production/bulk", json=productions)
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+
+    created = client.get(url=f"/api/v1/chart_data/{chart_data.id}").json()
+    assert [
+        (p["sprocket_production_actual"], p["time"], len(p["sprocket_types"]))
+        for p in created["sprocket_productions"]
+    ] == [(10, 1633194818, 1), (11, 1633194819, 2)]
+
+
+@pytest.mark.unittest
+def test_bulk_create_sprocket_productions_reports_every_error(
+    client: TestClient, session: Session
+) -> None:
+    sprocket_type_id = create_sprocket_type(
+        session=session, teeth=5, pitch_diameter=5.0, outside_diameter=6.0, pitch=1.0
+    )
+    chart_data = create_chart_data(session=session)
+    production = {
+        "sprocket_production_actual": 10,
+        "sprocket_production_goal": 20,
+        "time": 1633194818,
+        "sprocket_types": [sprocket_type_id],
+        "chart_data_id": chart_data.id,
+    }
+    response = client.post(
+        url="/api/v1/sprocket_production/bulk",
+        json=[
+            production,
+            {**production, "sprocket_types": [sprocket_type_id, 98, 99]},
+            {**production, "chart_data_id": 999},
+        ],
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == [
+        {"index": 1, "error": "Unknown sprocket type ids [98, 99]"},
+        {"index": 2, "error": "Unknown chart data id 999"},
+    ]
+    assert client.get(url="/api/v1/sprocket_production/").json() == []
+
+
+@pytest.mark.unittest
+def test_create_sprocket_production_resolves_types_in_one_query(
+    client: TestClient, session: Session
+) -> None:
+    chart_data = create_chart_data(session=session)
+    sprocket_type_ids = [
+        create_sprocket_type(
+            session=session,
+            teeth=i,
+            pitch_diameter=5.0,
+            outside_diameter=6.0,
+            pitch=1.0,
+        )
+        for i in range(1, 9)
+    ]
+    for ids in (sprocket_type_ids[:1], sprocket_type_ids):
+        with count_queries(session) as statements:
+            response = client.post(
+                url="/api/v1/sprocket_production",
+                json={
+                    "sprocket_production_actual": 10,
+                    "sprocket_production_goal": 20,
+                    "time": 1633194818,
+                    "sprocket_types": ids,
+                    "chart_data_id": chart_data.id,
+                },
+            )
+        assert response.status_code == 200
+        assert len(response.json()["sprocket_types"]) == len(ids)
+        assert len([s for s in statements if s.startswith("SELECT sprockettype")]) == 1
+
+
+@pytest.mark.unittest
+def test_create_paths_report_all_unknown_ids(
+    client: TestClient, session: Session
+) -> None:
+    sprocket_type_id = create_sprocket_type(
+        session=session, teeth=5, pitch_diameter=5.0, outside_diameter=6.0, pitch=1.0
+    )
+    chart_data = create_chart_data(session=session)
+    response = client.post(
+        url="/api/v1/sprocket_production",
+        json={
+            "sprocket_production_actual": 10,
+            "sprocket_production_goal": 20,
+            "time": 1633194818,
+            "sprocket_types": [99, sprocket_type_id, 98],
+            "chart_data_id": chart_data.id,
+        },
+    )
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Unknown sprocket type ids [98, 99]"}
+
+    response = client.post(
+        url="/api/v1/chart_data", json={"sprocket_productions": [7, 8]}
+    )
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Unknown sprocket production ids [7, 8]"}
+
+
+@pytest.mark.unittest
+def test_aggregate_chart_data(client: TestClient, session: Session) -> None:
+    sprocket_type_id = create_sprocket_type(
+        session=session, teeth=5, pitch_diameter=5.0, outside_diameter=6.0, pitch=1.0
+    )
+    chart_data = create_chart_data(session=session)
+    for actual, goal, time in (
+        (10, 20, datetime(2024, 5, 30, 12, 5)),
+        (30, 20, datetime(2024, 5, 30, 12, 45)),
+        (5, 10, datetime(2024, 5, 30, 13, 15)),
+        (7, 0, datetime(2024, 5, 31, 8, 0)),
+    ):
+        create_sprocket_production(
+            session=session,
+            actual=actual,
+            goal=goal,
+            time=time,
+            sprocket_types=[sprocket_type_id],
+            chart_data_id=chart_data.id,
+        )
+    url = f"/api/v1/chart_data/{chart_data.id}/aggregate"
+
+    response = client.get(url=url)
+    assert response.status_code == 200
+    assert response.json() == {
+        "chart_data_id": chart_data.id,
+        "bucket": "hour",
+        "buckets": [
+            {
+                "time": int(datetime(2024, 5, 30, 12).timestamp()),
+                "count": 2,
+                "sprocket_production_actual": 40,
+                "sprocket_production_goal": 40,
+                "attainment": 1.0,
+            },
+            {
+                "time": int(datetime(2024, 5, 30, 13).timestamp()),
+                "count": 1,
+                "sprocket_production_actual": 5,
+                "sprocket_production_goal": 10,
+                "attainment": 0.5,
+            },
+            {
+                "time": int(datetime(2024, 5, 31, 8).timestamp()),
+                "count": 1,
+                "sprocket_production_actual": 7,
+                "sprocket_production_goal": 0,
+                "attainment": None,
+            },
+        ],
+    }
+
+    response = client.get(
+        url=url,
+        params={
+            "bucket": "day",
+            "start": int(datetime(2024, 5, 30, 12, 30).timestamp()),
+            "end": int(datetime(2024, 5, 31).timestamp()),
+        },
+    )
+    assert response.json()["buckets"] == [
+        {
+            "time": int(datetime(2024, 5, 30).timestamp()),
+            "count": 2,
+            "sprocket_production_actual": 35,
+            "sprocket_production_goal": 30,
+            "attainment": 1.0,
+        }
+    ]
+
+    response = client.get(url=url, params={"bucket": "minute", "start": 0})
+    assert [bucket["time"] for bucket in response.json()["buckets"]] == [
+        int(datetime(2024, 5, 30, 12, 5).timestamp()),
+        int(datetime(2024, 5, 30, 12, 45).timestamp()),
+        int(datetime(2024, 5, 30, 13, 15).timestamp()),
+        int(datetime(2024, 5, 31, 8, 0).timestamp()),
+    ]
+
+    assert client.get(url=url, params={"bucket": "week"}).status_code == 400
+    assert client.get(url="/api/v1/chart_data/999/aggregate").status_code == 404
+
+
+@pytest.mark.unittest
+def test_aggregate_factory(client: TestClient, session: Session) -> None:
+    factory_id = create_factory_with_productions(
+        session=session, productions=3, sprocket_types=1
+    )
+    response = client.get(url=f"/api/v1/factories/{factory_id}/aggregate")
+    assert response.status_code == 200
+    assert response.json()["buckets"] == [
+        {
+            "time": int(datetime(2024, 5, 30, 12).timestamp()),
+            "count": 3,
+            "sprocket_production_actual": 33,
+            "sprocket_production_goal": 63,
+            "attainment": pytest.approx((10 / 20 + 11 / 21 + 12 / 22) / 3),
+        }
+    ]
+    assert client.get(url="/api/v1/factories/999/aggregate").status_code == 404
+
+
+@pytest.mark.unittest
+def test_aggregate_reads_rollups(client: TestClient, session: Session) -> None:
+    sprocket_type_id = create_sprocket_type(
+        session=session, teeth=5, pitch_diameter=5.0, outside_diameter=6.0, pitch=1.0
+    )
+    chart_data = create_chart_data(session=session)
+    times = [
+        datetime(2024, 5, 30, 12, 5),
+        datetime(2024, 5, 30, 12, 45),
+        datetime(2024, 5, 30, 13, 15),
+    ]
+    response = client.post(
+        url="/api/v1/sprocket_production/bulk",
+        json=[
+            {
+                "sprocket_production_actual": 10 * (i + 1),
+                "sprocket_production_goal": 20,
+                "time": int(time.timestamp()),
+                "sprocket_types": [sprocket_type_id],
+                "chart_data_id": chart_data.id,
+            }
+            for i, time in enumerate(times)
+        ],
+    )
+    production_ids = [result["id"] for result in response.json()["results"]]
+    url = f"/api/v1/chart_data/{chart_data.id}/aggregate"
+    aligned = int(datetime(2024, 5, 30, 12).timestamp())
+
+    with count_queries(session) as statements:
+        from_rollups = client.get(url=url, params={"start": aligned}).json()
+    assert any("FROM chartdatarollup" in statement for statement in statements)
+    with count_queries(session) as statements:
+        from_productions = client.get(url=url, params={"start": aligned - 1}).json()
+    assert not any("rollup" in statement for statement in statements)
+    assert from_rollups == from_productions
+    assert [bucket["count"] for bucket in from_rollups["buckets"]] == [2, 1]
+    assert from_rollups["buckets"][0]["attainment"] == pytest.approx(0.75)
+
+    moved_to = client.post(
+        url="/api/v1/chart_data", json={"sprocket_productions": production_ids[2:]}
+    ).json()
+    assert client.get(url=url).json()["buckets"] == from_rollups["buckets"][:1]
+    response = client.get(url=f"/api/v1/chart_data/{moved_to['id']}/aggregate")
+    assert response.json()["buckets"] == from_rollups["buckets"][1:]
+
+    for bucket, actuals in (("hour", [30, 30]), ("minute", [10, 20, 30])):
+        response = client.get(
+            url=f"/api/v1/sprockets/{sprocket_type_id}/aggregate",
+            params={"bucket": bucket},
+        )
+        assert response.json()["sprocket_type_id"] == sprocket_type_id
+        buckets = response.json()["buckets"]
+        assert [b["sprocket_production_actual"] for b in buckets] == actuals
+    assert client.get(url="/api/v1/sprockets/999/aggregate").status_code == 404
+
+
+@pytest.mark.unittest
+def test_read_chart_data_columnar(client: TestClient, session: Session) -> None:
+    factory_id = create_factory_with_productions(
+        session=session, productions=3, sprocket_types=2
+    )
+    chart_data_id = services.get_factory(
+        session=session, factory_id=factory_id
+    ).chart_data_id
+    session.expire_all()
+    times = [int(datetime(2024, 5, 30, 12, i, 0).timestamp()) for i in range(3)]
+    expected = {
+        "id": chart_data_id,
+        "time": times,
+        "sprocket_production_actual": [10, 11, 12],
+        "sprocket_production_goal": [20, 21, 22],
+    }
+
+    with count_queries(session) as statements:
+        response = client.get(
+            url=f"/api/v1/chart_data/{chart_data_id}", params={"format": "columnar"}
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == services.COLUMNAR_MEDIA_TYPE
+    assert response.json() == expected
+    assert len(statements) == 2
+
+    response = client.get(
+        url=f"/api/v1/factories/{factory_id}",
+        headers={"Accept": services.COLUMNAR_MEDIA_TYPE},
+    )
+    assert response.json() == {"id": factory_id, "chart_data": expected}
+
+    response = client.get(
+        url=f"/api/v1/factories/{factory_id}",
+        params={"format": "rows"},
+        headers={"Accept": services.COLUMNAR_MEDIA_TYPE},
+    )
+    assert len(response.json()["chart_data"]["sprocket_productions"]) == 3
+
+    for url in ("/api/v1/chart_data/999", "/api/v1/factories/999"):
+        response = client.get(url=url, params={"format": "columnar"})
+        assert response.status_code == 404
+
+
+@pytest.mark.unittest
+def test_serializers_match_response_models(session: Session) -> None:
+    factory_id = create_factory_with_productions(
+        session=session, productions=3, sprocket_types=2
+    )
+    factory = services.get_factory(session=session, factory_id=factory_id)
+    chart_data = factory.chart_data
+    production = chart_data.sprocket_productions[0]
+    rows = {
+        schemas.FactoryResponse: [factory],
+        schemas.ChartDataResponse: [chart_data],
+        schemas.SPRocketProductionResponse: [production],
+        schemas.SPRocketTypeResponse: production.sprocket_types,
+    }
+    for response_model, items in rows.items():
+        serialize = serializers.json_serializer(response_model)
+        for item in items:
+            expected = response_model.model_validate(item).model_dump_json()
+            assert serialize(item) == expected.encode()
+
+
+@pytest.mark.unittest
+def test_read_chart_data_and_factory_etags(
+    client: TestClient, session: Session, redis_cache: FastApiRedisCache
+) -> None:
+    factory_id = create_factory_with_productions(
+        session=session, productions=2, sprocket_types=1
+    )
+    factory = services.get_factory(session=session, factory_id=factory_id)
+    chart_data_id = factory.chart_data_id
+    sprocket_type_id = factory.chart_data.sprocket_productions[0].sprocket_types[0].id
+    session.expire_all()
+    urls = [f"/api/v1/chart_data/{chart_data_id}", f"/api/v1/factories/{factory_id}"]
+    etags = {url: client.get(url=url).headers["etag"] for url in urls}
+
+    for url, etag in etags.items():
+        with count_queries(session) as statements:
+            response = client.get(url=url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+        assert statements == []
+        response = client.get(url=url, params={"format": "columnar"})
+        assert response.headers["etag"] != etag
+
+    create_sprocket_production(
+        session=session,
+        actual=1,
+        goal=2,
+        time=datetime(2024, 5, 31),
+        sprocket_types=[sprocket_type_id],
+        chart_data_id=chart_data_id,
+    )
+    for url, etag in etags.items():
+        response = client.get(url=url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        etags[url] = response.headers["etag"]
+
+    client.put(
+        url=f"/api/v1/sprockets/{sprocket_type_id}",
+        json={"teeth": 1, "pitch_diameter": 2, "outside_diameter": 3, "pitch": 4},
+    )
+    for url, etag in etags.items():
+        response = client.get(url=url, headers={"If-None-Match": f'W/{etag}, "x"'})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    response = client.get(url="/api/v1/chart_data/999", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+@pytest.mark.unittest
+def test_reads_go_to_replica_except_after_a_write(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    primary, replica = (
+        create_engine(f"sqlite:///{tmp_path / name}.sqlite") for name in ("a", "b")
+    )
+    for engine in (primary, replica):
+        SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(database, "engine", primary)
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    client = TestClient(app)
+    sprocket = {"teeth": 5, "pitch_diameter": 5.0, "outside_diameter": 6.0, "pitch": 1}
+
+    response = client.post(url="/api/v1/sprockets", json=sprocket)
+    assert database.PRIMARY_COOKIE in response.cookies
+    url = f"/api/v1/sprockets/{response.json()['id']}"
+    assert client.get(url=url).status_code == 200
+
+    client.cookies.clear()
+    assert client.get(url=url).status_code == 404
+    assert client.get(url="/api/v1/sprockets").json() == []
+    for engine in (primary, replica):
+        engine.dispose()
@@ -1,12 +1,17 @@
 import json
-from typing import Any
-from unittest.mock import mock_open
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Generator, List, Tuple
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.engine import Engine
 from sqlmodel import Session, select
 
-from apps.sprocket import models
+from apps.celery import app as celery_app
+from apps.sprocket import models, streaming
+from apps.database import database
+from apps.sprocket import tasks
 from apps.sprocket.tasks import load_data_from_json
 
 factory_data = {
@@ -31,24 +36,22 @@ sprocket_data = {
 
 
 @pytest.fixture
-def mock_files(mocker: Any) -> None:
-    factory_json = json.dumps(factory_data)
-    sprocket_json = json.dumps(sprocket_data)
-    mocked_open = mock_open()
-    mocked_open.side_effect = [
-        mock_open(read_data=factory_json).return_value,
-        mock_open(read_data=sprocket_json).return_value,
-    ]
-    mocker.patch("builtins.open", mocked_open)
+def seed_files(tmp_path: Path) -> Tuple[str, str]:
+    factory_file = tmp_path / "factory_file.json"
+    sprocket_file = tmp_path / "sprocket_file.json"
+    factory_file.write_text(json.dumps(factory_data, indent=2))
+    sprocket_file.write_text(json.dumps(sprocket_data, indent=2))
+    return str(factory_file), str(sprocket_file)
 
 
 @pytest.mark.unittest
 def test_load_data_from_json(
-    client: TestClient, session: Session, mock_files: Any
+    client: TestClient, session: Session, seed_files: Tuple[str, str]
 ) -> None:
+    factory_file_path, sprocket_file_path = seed_files
     load_data_from_json(
-        factory_file_path="factory_file.json",
-        sprocket_file_path="sprocket_file.json",
+        factory_file_path=factory_file_path,
+        sprocket_file_path=sprocket_file_path,
         session=session,
     )
 
@@ -95,3 +98,267 @@ def test_load_data_from_json(
     initial_data_load = session.exec(statement).all()
     assert len(initial_data_load) == 1
     assert initial_data_load[0].loaded is True
+
+
+@pytest.mark.unittest
+def test_load_data_from_json_in_batches(
+    client: TestClient, session: Session, seed_files: Tuple[str, str]
+) -> None:
+    factory_file_path, sprocket_file_path = seed_files
+    log = load_data_from_json(
+        factory_file_path=factory_file_path,
+        sprocket_file_path=sprocket_file_path,
+        session=session,
+        batch_size=2,
+    )
+    assert "rows/s" in log
+
+    statement = select(models.SPRocketProduction).order_by(models.SPRocketProduction.id)
+    sprocket_productions = session.exec(statement).all()
+    assert [sp.sprocket_production_actual for sp in sprocket_productions] == [
+        10,
+        20,
+        30,
+    ]
+    for sprocket_production in sprocket_productions:
+        assert [st.teeth for st in sprocket_production.sprocket_types] == [20]
+
+    statement = select(models.SPRocketTypeSPRocketProductionLink)
+    assert len(session.exec(statement).all()) == 3
+
+
+@pytest.mark.unittest
+def test_load_rejects_empty_batches(
+    session: Session, seed_files: Tuple[str, str]
+) -> None:
+    factory_file_path, sprocket_file_path = seed_files
+    with pytest.raises(ValueError):
+        list(tasks.batched(range(3), 0))
+    for load, options in (
+        (load_data_from_json, {"batch_size": 0}),
+        (tasks.load_data_in_parallel, {"batch_size": 0}),
+        (tasks.load_data_in_parallel, {"shard_size": 0}),
+    ):
+        with pytest.raises(ValueError):
+            load(
+                factory_file_path=factory_file_path,
+                sprocket_file_path=sprocket_file_path,
+                session=session,
+                **options,
+            )
+        session.rollback()
+    assert session.get(models.InitialDataLoad, tasks.INITIAL_DATA_LOAD_ID) is None
+
+
+@pytest.mark.unittest
+def test_stream_chart_data_points(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(streaming, "CHUNK_SIZE", 8)
+    factory_file = tmp_path / "factory_file.json"
+    chart_data = {
+        "sprocket_production_actual": list(range(100)),
+        "sprocket_production_goal": list(range(100, 200)),
+        "time": [1611194818 + i for i in range(100)],
+    }
+    factory_file.write_text(
+        json.dumps(
+            {
+                "factories": [
+                    {"factory": {"name": 'skipped "value"', "chart_data": chart_data}},
+                    {"factory": {"chart_data": chart_data}},
+                ]
+            }
+        )
+    )
+
+    offsets = list(streaming.iter_chart_data_offsets(str(factory_file)))
+    assert len(offsets) == 2
+    for factory_offsets in offsets:
+        points = list(
+            streaming.iter_chart_data_points(str(factory_file), factory_offsets)
+        )
+        assert points == list(
+            zip(
+                chart_data["sprocket_production_actual"],
+                chart_data["sprocket_production_goal"],
+                chart_data["time"],
+            )
+        )
+
+
+@pytest.mark.unittest
+def test_stream_sprockets(tmp_path: Path) -> None:
+    sprocket_file = tmp_path / "sprocket_file.json"
+    sprocket_file.write_text(json.dumps(sprocket_data))
+    assert (
+        list(streaming.iter_sprockets(str(sprocket_file))) == sprocket_data["sprockets"]
+    )
+
+
+@pytest.mark.unittest
+def test_load_factory_shards(
+    engine: Engine,
+    session: Session,
+    seed_files: Tuple[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(database, "engine", engine)
+    factory_file_path, _ = seed_files
+    sprocket_type = models.SPRocketType(
+        teeth=20, pitch_diameter=5.5, outside_diameter=6.0, pitch=2.5
+    )
+    session.add(sprocket_type)
+    session.commit()
+
+    shards = tasks.shard_factories(factory_file_path, shard_size=1)
+    assert len(shards) == 1
+    shard_rows = [
+        tasks.load_factory_shard(factory_file_path, index, shard, [sprocket_type.id])
+        for index, shard in enumerate(shards)
+    ]
+    assert tasks.mark_initial_data_loaded(shard_rows) == sum(shard_rows)
+
+    assert len(session.exec(select(models.SPRocketProduction)).all()) == 3
+    assert len(session.exec(select(models.Factory)).all()) == 1
+    assert tasks.initial_data_loaded(session=session)
+
+
+def rollup_rows(session: Session) -> List[Tuple[Any, ...]]:
+    session.expire_all()
+    return sorted(
+        (model.__name__, *sorted(rollup.model_dump().items()))
+        for model in (models.ChartDataRollup, models.SPRocketTypeRollup)
+        for rollup in session.exec(select(model)).all()
+    )
+
+
+@pytest.mark.unittest
+def test_load_factory_shards_fill_rollups(
+    engine: Engine,
+    session: Session,
+    seed_files: Tuple[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(database, "engine", engine)
+    factory_file_path, _ = seed_files
+    sprocket_type = models.SPRocketType(
+        teeth=20, pitch_diameter=5.5, outside_diameter=6.0, pitch=2.5
+    )
+    session.add(sprocket_type)
+    session.commit()
+    for index, shard in enumerate(tasks.shard_factories(factory_file_path, 1)):
+        tasks.load_factory_shard(factory_file_path, index, shard, [sprocket_type.id])
+
+    rollups = session.exec(
+        select(models.SPRocketTypeRollup).where(
+            models.SPRocketTypeRollup.granularity == "day"
+        )
+    ).all()
+    assert [
+        (rollup.count, rollup.sprocket_production_actual, rollup.attainment_sum)
+        for rollup in rollups
+    ] == [(1, 10, 10 / 15), (1, 20, 20 / 25), (1, 30, 30 / 35)]
+    assert len(rollup_rows(session)) == 12
+
+    loaded = rollup_rows(session)
+    tasks.rebuild_production_rollups()
+    assert rollup_rows(session) == loaded
+
+
+@pytest.fixture
+def eager_celery(
+    engine: Engine, monkeypatch: pytest.MonkeyPatch
+) -> Generator[None, None, None]:
+    monkeypatch.setattr(database, "engine", engine)
+    celery_app.conf.task_always_eager = True
+    yield
+    celery_app.conf.task_always_eager = False
+
+
+def seed_two_factories(tmp_path: Path) -> Tuple[str, str]:
+    factory_file = tmp_path / "factories.json"
+    factory_file.write_text(
+        json.dumps({"factories": factory_data["factories"] * 2}, indent=2)
+    )
+    sprocket_file = tmp_path / "sprockets.json"
+    sprocket_file.write_text(json.dumps(sprocket_data))
+    return str(factory_file), str(sprocket_file)
+
+
+def count_rows(session: Session, model: Any) -> int:
+    session.expire_all()
+    return len(session.exec(select(model)).all())
+
+
+@pytest.mark.unittest
+def test_load_data_in_parallel_runs_once(
+    session: Session, tmp_path: Path, eager_celery: None
+) -> None:
+    factory_file_path, sprocket_file_path = seed_two_factories(tmp_path)
+    result = tasks.load_data_in_parallel(
+        factory_file_path=factory_file_path,
+        sprocket_file_path=sprocket_file_path,
+        session=session,
+    )
+    assert result.get() == 2 * (2 + 3 + 3)
+    assert tasks.initial_data_loaded(session=session)
+    assert count_rows(session, models.InitialDataLoadFactory) == 0
+    assert count_rows(session, models.InitialDataLoadSPRocketType) == 0
+
+    options = dict(
+        factory_file_path=factory_file_path,
+        sprocket_file_path=sprocket_file_path,
+        session=session,
+    )
+    assert tasks.load_data_in_parallel(**options) is None
+    assert "already loaded" in load_data_from_json(**options)
+    assert count_rows(session, models.Factory) == 2
+    assert count_rows(session, models.SPRocketType) == 1
+
+
+@pytest.mark.unittest
+def test_failed_parallel_load_refuses_a_new_load_and_resumes(
+    session: Session,
+    tmp_path: Path,
+    eager_celery: None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    factory_file_path, sprocket_file_path = seed_two_factories(tmp_path)
+    load_chart_data = tasks.load_chart_data
+    calls = []
+
+    def fail_second_factory(**kwargs: Any) -> Tuple[int, int]:
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("Worker lost")
+        return load_chart_data(**kwargs)
+
+    monkeypatch.setattr(tasks, "load_chart_data", fail_second_factory)
+    options = dict(
+        factory_file_path=factory_file_path,
+        sprocket_file_path=sprocket_file_path,
+        session=session,
+    )
+    with pytest.raises(RuntimeError):
+        tasks.load_data_in_parallel(**options).get()
+    assert not tasks.initial_data_loaded(session=session)
+    assert count_rows(session, models.Factory) == 1
+
+    with pytest.raises(tasks.InitialDataLoadError):
+        tasks.load_data_in_parallel(**options)
+    with pytest.raises(tasks.InitialDataLoadError):
+        load_data_from_json(**options)
+
+    # Resuming must not depend on the sprocket types being left untouched.
+    for sprocket_type in session.exec(select(models.SPRocketType)):
+        sprocket_type.created_at = sprocket_type.updated_at = datetime.now()
+        session.add(sprocket_type)
+    session.commit()
+    result = tasks.load_data_in_parallel(**options, resume=True)
+    assert result.get() == 2 + 3 + 3
+    assert tasks.initial_data_loaded(session=session)
+    assert count_rows(session, models.Factory) == 2
+    assert count_rows(session, models.SPRocketType) == 1
+    assert count_rows(session, models.SPRocketProduction) == 6
+    assert count_rows(session, models.SPRocketTypeSPRocketProductionLink) == 6